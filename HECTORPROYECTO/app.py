@@ -6,7 +6,10 @@ except ModuleNotFoundError:
     print("Falta ttkbootstrap. Instálalo con: pip install ttkbootstrap", file=sys.stderr)
     raise
 
-from data.db import get_connection, ensure_schema_and_seed
+from data.db import ConnectionManager, ensure_schema_and_seed
+from services.cache import PortfolioCache
+from services.worker import DbWorker
+from utils import tracing
 from ui.home_view import HomeView
 from ui.client_view import ClientView
 
@@ -44,14 +47,28 @@ class App(tb.Window):
         self.container = ttk.Frame(self, padding=0)
         self.container.pack(fill="both", expand=True)
 
-        # DB
-        self.conn = get_connection()
-        ensure_schema_and_seed(self.conn)
+        # DB: WAL + escritor único + pool de lectores
+        self.db = ConnectionManager()
+        with self.db.writer() as conn:
+            ensure_schema_and_seed(conn)
+        # Consultas y escrituras de las vistas corren fuera del hilo de Tk
+        # Caché de clientes/posiciones/precios: volver a un cliente o refrescar tras una acción no repite consultas
+        self.cache = PortfolioCache()
+        self.worker = DbWorker(self.db, cache=self.cache)
+        self.protocol("WM_DELETE_WINDOW", self._on_close)
+        # Con INVERSIONES_TRACE activo, Ctrl+Shift+T vuelca las métricas sin cerrar la app
+        if tracing.get_tracer():
+            self.bind_all("<Control-Shift-T>", lambda e: tracing.dump())
 
         # Routing simple
         self.frames = {}
         self.show_home()
 
+    def _on_close(self):
+        self.worker.shutdown(wait=True)
+        self.db.close()
+        self.destroy()
+
     # -------- Tema --------
     def _switch_theme(self):
         self._theme_index = (self._theme_index + 1) % len(self.theme_cycle)
@@ -0,0 +1,161 @@
+import os
+import random
+import sqlite3
+import time
+from typing import Optional, List, Dict, Tuple
+from data import repositorios as repo
+from services.lots import rebuild_lots
+
+# Fin fijo del período generado (2025-01-01 00:00 UTC) para que la misma semilla dé la misma base
+END_TS = 1_735_689_600_000_000
+DAY_US = 86_400_000_000
+CHUNK_SIZE = 10000
+
+def _flush(conn: sqlite3.Connection, cash: list, trades: list, prices: list):
+    if cash:
+        repo.insert_cash_movements_many(conn, cash)
+        cash.clear()
+    if trades:
+        repo.insert_trades_many(conn, trades)
+        trades.clear()
+    if prices:
+        repo.insert_price_history_many(conn, prices)
+        prices.clear()
+
+def generate(conn: sqlite3.Connection, clients: int = 1000, instruments: int = 50, trades: int = 100_000,
+             prices: int = 50_000, days: int = 365, seed: int = 42) -> Dict[str, int]:
+    # Base sintética determinista: N clientes, M instrumentos, K operaciones BUY/SELL/DEPOSIT/WITHDRAW
+    # y P puntos de precio, repartidos en `days` días. Se espera una base vacía con el esquema al día.
+    if conn.execute("SELECT EXISTS (SELECT 1 FROM clients)").fetchone()[0]:
+        raise ValueError("La base ya tiene clientes; el generador necesita una base vacía")
+    rng = random.Random(seed)
+    start_ts = END_TS - days * DAY_US
+    symbols = [f"SYM{i:04d}" for i in range(1, instruments + 1)]
+    price = {i: round(rng.uniform(5, 500), 2) for i in range(1, instruments + 1)}
+
+    # Eventos ordenados en el tiempo: ("T", ts) operación o ("P", ts) precio
+    events: List[Tuple[int, str]] = sorted(
+        [(rng.randrange(start_ts, END_TS), "T") for _ in range(trades)]
+        + [(rng.randrange(start_ts, END_TS), "P") for _ in range(prices)]
+    )
+
+    capital: Dict[int, float] = {}
+    positions: Dict[Tuple[int, int], List[float]] = {}  # (cliente, instrumento) -> [inv_id, shares, avg]
+    held: Dict[int, List[Tuple[int, int]]] = {}         # cliente -> posiciones abiertas o cerradas
+    cash: list = []
+    trade_rows: list = []
+    price_rows: list = []
+    next_inv = 1
+    counts = {"DEPOSIT": 0, "WITHDRAW": 0, "BUY": 0, "SELL": 0, "prices": 0}
+
+    conn.execute("BEGIN")
+    try:
+        repo.create_instruments_many(conn, symbols, start_ts)
+        client_rows = []
+        for c in range(1, clients + 1):
+            capital[c] = round(rng.uniform(1_000, 100_000), 2)
+            client_rows.append((f"Cliente {c:05d}", f"cliente{c}@example.com", f"555-{c:07d}", start_ts + c, 0.0))
+            cash.append((c, "DEPOSIT", capital[c], "Aporte inicial", start_ts + c))
+            counts["DEPOSIT"] += 1
+        repo.create_clients_many(conn, client_rows)
+        # Un precio inicial por instrumento
+        price_rows.extend((i, p, start_ts) for i, p in price.items())
+
+        for ts, kind in events:
+            if kind == "P":
+                i = rng.randint(1, instruments)
+                price[i] = round(max(0.01, price[i] * rng.uniform(0.97, 1.03)), 2)
+                price_rows.append((i, price[i], ts))
+                counts["prices"] += 1
+            else:
+                c = rng.randint(1, clients)
+                r = rng.random()
+                if r < 0.10:
+                    amount = round(rng.uniform(100, 10_000), 2)
+                    capital[c] += amount
+                    cash.append((c, "DEPOSIT", amount, None, ts))
+                    counts["DEPOSIT"] += 1
+                elif r < 0.15 and capital[c] > 200:
+                    amount = round(rng.uniform(50, capital[c] / 4), 2)
+                    capital[c] -= amount
+                    cash.append((c, "WITHDRAW", amount, None, ts))
+                    counts["WITHDRAW"] += 1
+                elif r < 0.70 or not held.get(c):
+                    i = rng.randint(1, instruments)
+                    amount = round(min(capital[c], rng.uniform(100, 5_000)), 2)
+                    if amount <= 0:
+                        continue
+                    p = price[i]
+                    shares = amount / p
+                    pos = positions.get((c, i))
+                    if pos is None:
+                        pos = positions[(c, i)] = [next_inv, 0.0, 0.0]
+                        held.setdefault(c, []).append((c, i))
+                        repo.create_investments_many(conn, [(c, i, symbols[i - 1], p, 0.0, ts)])
+                        next_inv += 1
+                    pos[2] = (pos[2] * pos[1] + amount) / (pos[1] + shares)
+                    pos[1] += shares
+                    capital[c] -= amount
+                    # Como PortfolioService.buy: el capital baja, pero no hay movimiento de efectivo
+                    trade_rows.append((pos[0], "BUY", shares, p, amount, ts, None))
+                    counts["BUY"] += 1
+                else:
+                    key = rng.choice(held[c])
+                    pos = positions[key]
+                    if pos[1] <= 1e-9:
+                        continue
+                    p = price[key[1]]
+                    shares = pos[1] * rng.choice((0.25, 0.5, 1.0))
+                    amount = shares * p
+                    pos[1] -= shares
+                    capital[c] += amount
+                    trade_rows.append((pos[0], "SELL", shares, p, amount, ts, None))
+                    counts["SELL"] += 1
+            if len(cash) + len(trade_rows) + len(price_rows) >= CHUNK_SIZE:
+                _flush(conn, cash, trade_rows, price_rows)
+        _flush(conn, cash, trade_rows, price_rows)
+
+        repo.update_investments_many(conn, [(avg, shares, inv_id) for inv_id, shares, avg in positions.values()])
+        repo.update_client_capital_many(conn, [(round(v, 2), c) for c, v in capital.items()])
+        # Operaciones insertadas en bloque: lotes y resultado realizado en una pasada
+        rebuild_lots(conn)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("ANALYZE")
+    counts.update(clients=clients, instruments=instruments, positions=len(positions))
+    return counts
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import argparse
+    from data.db import get_connection
+    from data.migrations import migrate
+    p = argparse.ArgumentParser(description="Genera una base sintética determinista para benchmarks")
+    p.add_argument("db", help="Ruta de la base a crear")
+    p.add_argument("--clients", type=int, default=1000)
+    p.add_argument("--instruments", type=int, default=50)
+    p.add_argument("--trades", type=int, default=100_000, help="Operaciones de efectivo y compra/venta")
+    p.add_argument("--prices", type=int, default=50_000, help="Puntos de precio")
+    p.add_argument("--days", type=int, default=365)
+    p.add_argument("--seed", type=int, default=42)
+    p.add_argument("--force", action="store_true", help="Sobrescribir si el archivo existe")
+    args = p.parse_args(argv)
+
+    if os.path.exists(args.db):
+        if not args.force:
+            p.error(f"{args.db} ya existe (usar --force)")
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(args.db + suffix):
+                os.remove(args.db + suffix)
+    conn = get_connection(args.db)
+    migrate(conn)
+    started = time.perf_counter()
+    counts = generate(conn, args.clients, args.instruments, args.trades, args.prices, args.days, args.seed)
+    conn.close()
+    print(f"Base {args.db} generada en {time.perf_counter() - started:.2f}s: "
+          + ", ".join(f"{k}={v}" for k, v in counts.items()))
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
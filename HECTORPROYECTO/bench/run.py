@@ -0,0 +1,174 @@
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+import tracemalloc
+from typing import Optional, List, Dict, Any, Callable
+from data import repositorios as repo
+from data.db import get_connection
+from services.portfolio import PortfolioService
+from services.exports import export_client_history
+
+BASELINE_FILE = os.path.join(os.path.dirname(__file__), "baseline.json")
+TOLERANCE = 0.25  # +25% sobre la línea base en p50 o p95 cuenta como regresión
+MIN_DELTA_MS = 0.1  # diferencias menores son ruido del reloj/planificador
+SELL_SHARES = 0.001  # acciones por venta del benchmark de sell
+
+def _percentile(sorted_ms: List[float], q: float) -> float:
+    # Rango más cercano sobre una lista ya ordenada
+    if not sorted_ms:
+        return 0.0
+    k = max(0, min(len(sorted_ms) - 1, round(q * (len(sorted_ms) - 1))))
+    return sorted_ms[k]
+
+def _measure(fn: Callable[[int], Any], iterations: int, warmup: int = 3) -> Dict[str, float]:
+    for i in range(warmup):
+        fn(i)
+    times = []
+    for i in range(iterations):
+        t = time.perf_counter_ns()
+        fn(i)
+        times.append((time.perf_counter_ns() - t) / 1e6)
+    # Memoria: una corrida extra con tracemalloc (no se mezcla con los tiempos)
+    tracemalloc.start()
+    fn(iterations)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    times.sort()
+    total_s = sum(times) / 1000
+    return {
+        "n": iterations,
+        "p50_ms": round(_percentile(times, 0.50), 4),
+        "p95_ms": round(_percentile(times, 0.95), 4),
+        "p99_ms": round(_percentile(times, 0.99), 4),
+        "max_ms": round(times[-1], 4),
+        "ops_per_s": round(iterations / total_s, 1) if total_s else 0.0,
+        "peak_kb": round(peak / 1024, 1),
+    }
+
+def _copy_db(src: str, dst: str):
+    # backup() incluye lo que esté en el WAL; una copia de archivo no
+    with sqlite3.connect(src) as s, sqlite3.connect(dst) as d:
+        s.backup(d)
+
+def run_benchmarks(db_path: str, iterations: int = 200, seed: int = 1) -> Dict[str, Dict[str, float]]:
+    rng = random.Random(seed)
+    tmp = tempfile.mkdtemp(prefix="bench-")
+    try:
+        # Se trabaja sobre una copia: las escrituras no alteran la base generada
+        work = os.path.join(tmp, "bench.db")
+        _copy_db(db_path, work)
+        conn = get_connection(work)
+        svc = PortfolioService(conn)
+        client_ids = repo.list_client_ids(conn)
+        if not client_ids:
+            raise ValueError("La base no tiene clientes (generarla con python -m bench.generate)")
+        # Cliente con más movimientos: peor caso de historial/exportación
+        heavy = conn.execute(
+            "SELECT client_id FROM cash_movements GROUP BY client_id ORDER BY COUNT(*) DESC LIMIT 1"
+        ).fetchone()[0]
+        picks = [rng.choice(client_ids) for _ in range(iterations + 8)]
+        investments = [r[0] for r in conn.execute("SELECT id FROM investments WHERE shares > 0 ORDER BY id")]
+        inv_picks = [rng.choice(investments) for _ in range(iterations + 8)] if investments else []
+        # Ventas: solo posiciones que aguantan todas las corridas aunque salgan repetidas
+        sellable = [r[0] for r in conn.execute("SELECT id FROM investments WHERE shares >= ? ORDER BY id",
+                                               (SELL_SHARES * (iterations + 8),))]
+        sell_picks = [rng.choice(sellable) for _ in range(iterations + 8)] if sellable else []
+        symbols = [r[0] for r in conn.execute("SELECT symbol FROM instruments ORDER BY id")]
+        out = os.path.join(tmp, "export.csv")
+
+        results: Dict[str, Dict[str, float]] = {}
+        results["list_clients"] = _measure(lambda i: repo.list_clients(conn), max(10, iterations // 10))
+        results["list_clients_search"] = _measure(lambda i: repo.list_clients(conn, f"{i % 100:02d}"), iterations)
+        results["search_clients"] = _measure(lambda i: repo.search_clients(conn, f"{i % 100:02d}"), iterations)
+        # Una página de tarjetas de la pantalla inicial (48 clientes)
+        results["get_client_cards"] = _measure(
+            lambda i: svc.get_client_cards(client_ids[(i * 48) % len(client_ids):][:48]), iterations)
+        results["get_client_portfolio"] = _measure(lambda i: svc.get_client_portfolio(picks[i]), iterations)
+        results["get_client_history"] = _measure(lambda i: svc.get_client_history(picks[i]), iterations)
+        results["get_client_history_heavy"] = _measure(lambda i: svc.get_client_history(heavy), max(10, iterations // 10))
+        results["get_client_history_page"] = _measure(lambda i: svc.get_client_history_page(heavy), iterations)
+
+        # Escrituras: cada operación en su transacción, como desde la interfaz
+        svc.deposit(heavy, 1e9, "bench")
+        results["buy"] = _measure(lambda i: svc.buy(heavy, symbols[i % len(symbols)], 100.0, 10.0 + i % 7, "bench"), iterations)
+        if sell_picks:
+            results["sell"] = _measure(lambda i: svc.sell(sell_picks[i], SELL_SHARES, 10.0, "bench"), iterations)
+        if inv_picks:
+            results["update_price"] = _measure(lambda i: svc.update_price(inv_picks[i], 10.0 + i % 13, "bench"), iterations)
+
+        results["export_client_csv"] = _measure(lambda i: export_client_history(conn, out, heavy), max(5, iterations // 20))
+        conn.close()
+        return results
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+def _environment(db_path: str) -> Dict[str, Any]:
+    conn = get_connection(db_path, readonly=True)
+    counts = {t: conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0]
+              for t in ("clients", "instruments", "investments", "cash_movements", "investment_trades", "price_history")}
+    conn.close()
+    return {"python": platform.python_version(), "sqlite": sqlite3.sqlite_version,
+            "machine": platform.machine(), "counts": counts}
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]],
+            tolerance: float = TOLERANCE) -> List[str]:
+    # Devuelve las regresiones (p50 o p95 por encima de la línea base + tolerancia y de MIN_DELTA_MS)
+    regressions = []
+    for name, r in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        for key in ("p50_ms", "p95_ms"):
+            if base[key] > 0 and r[key] > base[key] * (1 + tolerance) and r[key] - base[key] >= MIN_DELTA_MS:
+                regressions.append(f"{name}: {key} {r[key]:.3f} ms vs {base[key]:.3f} ms (+{r[key] / base[key] - 1:.0%})")
+    return regressions
+
+def _print_table(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]]):
+    print(f"{'bench':28} {'n':>5} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'ops/s':>10} {'pico KB':>9} {'Δp50':>7}")
+    for name, r in results.items():
+        base = baseline.get(name)
+        delta = f"{r['p50_ms'] / base['p50_ms'] - 1:+.0%}" if base and base["p50_ms"] else ""
+        print(f"{name:28} {r['n']:>5} {r['p50_ms']:>10.3f} {r['p95_ms']:>10.3f} {r['p99_ms']:>10.3f} "
+              f"{r['ops_per_s']:>10,.0f} {r['peak_kb']:>9,.0f} {delta:>7}")
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import argparse
+    p = argparse.ArgumentParser(description="Benchmarks de PortfolioService contra una base generada")
+    p.add_argument("db", help="Base generada con python -m bench.generate")
+    p.add_argument("--iterations", type=int, default=200)
+    p.add_argument("--baseline", default=BASELINE_FILE, help="JSON con la línea base")
+    p.add_argument("--save-baseline", action="store_true", help="Guardar estos resultados como línea base")
+    p.add_argument("--tolerance", type=float, default=TOLERANCE, help="Margen antes de marcar regresión (0.25 = 25%%)")
+    p.add_argument("--json", default=None, help="Guardar también los resultados en este archivo")
+    args = p.parse_args(argv)
+
+    results = run_benchmarks(args.db, args.iterations)
+    report = {"environment": _environment(args.db), "iterations": args.iterations, "results": results}
+    baseline: Dict[str, Any] = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("environment", {}).get("counts") != report["environment"]["counts"]:
+            print("Aviso: la línea base se midió con otra base de datos; la comparación es orientativa")
+    _print_table(results, baseline.get("results", {}))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Línea base guardada en {args.baseline}")
+        return 0
+    regressions = compare(results, baseline.get("results", {}), args.tolerance)
+    for r in regressions:
+        print(f"REGRESIÓN {r}")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
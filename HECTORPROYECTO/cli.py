@@ -0,0 +1,266 @@
+import sys
+from typing import Optional, List
+
+# Entrada de línea de comandos sin interfaz gráfica (cron, servidores sin pantalla).
+# Los imports van dentro de cada comando: "python cli.py --help" no carga la base ni Tk.
+
+def _open(args):
+    from data.db import get_connection, ensure_schema_and_seed
+    conn = get_connection(args.db)
+    ensure_schema_and_seed(conn)
+    return conn
+
+def _emit(args, data, lines):
+    if args.json:
+        import json
+        json.dump(data, sys.stdout, ensure_ascii=False, default=str)
+        sys.stdout.write("\n")
+    else:
+        for line in lines:
+            print(line)
+
+def _resolve_investment(conn, client_id: int, company: str) -> int:
+    from data import repositorios as repo
+    inv = repo.get_investment_by_company(conn, client_id, company)
+    if not inv:
+        raise ValueError(f"El cliente {client_id} no tiene posición en {company}")
+    return inv["id"]
+
+def _capital(conn, client_id: int) -> float:
+    from data import repositorios as repo
+    client = repo.get_client(conn, client_id)
+    if not client:
+        raise ValueError("Cliente no existe")
+    return client["capital_available"]
+
+# ---- Consultas ----
+
+def cmd_clients(args) -> int:
+    from data import repositorios as repo
+    from utils.format import money
+    rows = [dict(r) for r in repo.list_clients(_open(args), args.q)]
+    _emit(args, rows, (f"{r['id']}\t{r['name']}\t{r['email'] or ''}\t{money(r['capital_available'])}" for r in rows))
+    return 0
+
+def cmd_portfolio(args) -> int:
+    from services.portfolio import PortfolioService
+    from utils.format import money
+    conn = _open(args)
+    capital = _capital(conn, args.client)
+    positions = PortfolioService(conn).get_client_portfolio(args.client)
+    invested = sum(p["current_value"] for p in positions)
+    data = {"client_id": args.client, "capital_available": capital, "invested": invested,
+            "equity": capital + invested, "positions": positions}
+    lines = [f"{p['company']}\t{p['shares']:.4f}\t{money(p['avg_price'])}\t{money(p['current_price'])}\t"
+             f"{money(p['current_value'])}\t{money(p['pnl'])}" for p in positions]
+    lines.append(f"Capital {money(capital)} | Invertido {money(invested)} | Total {money(capital + invested)}")
+    _emit(args, data, lines)
+    return 0
+
+def cmd_history(args) -> int:
+    from itertools import islice
+    from services.portfolio import PortfolioService
+    rows = PortfolioService(_open(args)).iter_client_history(args.client, args.day, args.date_from, args.date_to)
+    if args.limit:
+        rows = islice(rows, args.limit)
+    if args.json:
+        # Una fila JSON por línea: memoria constante con historiales grandes
+        import json
+        for r in rows:
+            r.pop("cursor", None)
+            sys.stdout.write(json.dumps(r, ensure_ascii=False) + "\n")
+    else:
+        for r in rows:
+            print(f"{r['fecha']}\t{r['tipo']}\t{r['detalle']}\t{r['monto_cambio_capital']}")
+    return 0
+
+def cmd_nav(args) -> int:
+    from services.portfolio import PortfolioService
+    from utils.format import money
+    rows = PortfolioService(_open(args)).get_nav_series(args.client, args.date_from, args.date_to)
+    _emit(args, rows, (f"{r['day']}\t{money(r['nav'])}\t{money(r['cash'])}\t{money(r['market_value'])}\t{r['net_flow']:.2f}"
+                       for r in rows))
+    return 0
+
+def cmd_realized(args) -> int:
+    from services.portfolio import PortfolioService
+    from utils.format import money
+    rows = PortfolioService(_open(args)).get_realized_gains(args.client, args.day, args.date_from, args.date_to)
+    lines = [f"{r['fecha']}\t{r['company']}\t{r['shares']:.4f}\t{money(r['price'])}\t{money(r['realized_pnl'] or 0)}"
+             for r in rows]
+    lines.append(f"Resultado realizado: {money(sum(r['realized_pnl'] or 0 for r in rows))}")
+    _emit(args, rows, lines)
+    return 0
+
+def cmd_stats(args) -> int:
+    import os
+    from data.migrations import get_version
+    from data import repositorios as repo
+    conn = _open(args)
+    tables = ("clients", "instruments", "investments", "cash_movements", "investment_trades", "price_history",
+              "nav_snapshots", "lots")
+    data = {
+        "db": os.path.abspath(args.db or "investments.db"),
+        "schema_version": get_version(conn),
+        "size_bytes": conn.execute("PRAGMA page_count").fetchone()[0] * conn.execute("PRAGMA page_size").fetchone()[0],
+        "counts": {t: conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0] for t in tables},
+        "latest_price_mismatches": len(repo.check_latest_prices(conn)),
+    }
+    lines = [f"{k}: {v}" for k, v in data.items() if k != "counts"]
+    lines += [f"  {t}: {n:,}" for t, n in data["counts"].items()]
+    _emit(args, data, lines)
+    return 0
+
+# ---- Escrituras ----
+
+def _write(args, client_id: int, action) -> int:
+    from services.portfolio import PortfolioService
+    from utils.format import money
+    conn = _open(args)
+    action(PortfolioService(conn), conn)
+    capital = _capital(conn, client_id)
+    _emit(args, {"ok": True, "client_id": client_id, "capital_available": capital},
+          [f"OK. Capital disponible: {money(capital)}"])
+    return 0
+
+def cmd_deposit(args) -> int:
+    return _write(args, args.client, lambda svc, conn: svc.deposit(args.client, args.amount, args.note))
+
+def cmd_withdraw(args) -> int:
+    return _write(args, args.client, lambda svc, conn: svc.withdraw(args.client, args.amount, args.note))
+
+def cmd_buy(args) -> int:
+    return _write(args, args.client,
+                  lambda svc, conn: svc.buy(args.client, args.company, args.amount, args.price, args.note))
+
+def cmd_sell(args) -> int:
+    def action(svc, conn):
+        from data import repositorios as repo
+        inv_id = _resolve_investment(conn, args.client, args.company)
+        shares = repo.get_investment(conn, inv_id)["shares"] if args.shares == "all" else float(args.shares)
+        svc.sell(inv_id, shares, args.price, args.note, args.method)
+    return _write(args, args.client, action)
+
+def cmd_price(args) -> int:
+    from services.portfolio import PortfolioService
+    PortfolioService(_open(args)).update_company_price(args.company, args.price)
+    _emit(args, {"ok": True, "company": args.company, "price": args.price},
+          [f"OK. {args.company} = {args.price}"])
+    return 0
+
+# ---- Delegados (mismos argumentos que python -m services.<módulo>) ----
+
+def _delegate(module: str):
+    def run(args) -> int:
+        import importlib
+        rest = list(args.rest)
+        if args.db and "--db" not in rest:
+            rest += ["--db", args.db]
+        return importlib.import_module(module).main(rest)
+    return run
+
+DELEGATES = (("export", "services.exports", "Exportar historial a CSV"),
+             ("reprice", "services.pricing", "Reprecio en bloque desde CSV"),
+             ("import", "services.importer", "Importar operaciones desde CSV"),
+             ("report", "services.reports", "Reporte de todos los clientes en paralelo"),
+             ("snapshots", "services.snapshots", "Calcular fotos diarias de NAV pendientes"),
+             ("returns", "services.returns", "TWR y XIRR por cliente para un período"),
+             ("lots", "services.lots", "Rehacer lotes y resultado realizado (FIFO/LIFO/AVG)"))
+
+def _parse(argv: List[str]):
+    # argparse.REMAINDER no toma opciones al inicio ("snapshots --to ..."): lo que sigue a un
+    # delegado pasa tal cual a su main()
+    names = {name for name, _m, _h in DELEGATES}
+    i = 0
+    while i < len(argv) and argv[i].startswith("-"):
+        i += 2 if argv[i] == "--db" else 1
+    if i < len(argv) and argv[i] in names:
+        args = build_parser().parse_args(argv[:i + 1])
+        args.rest = argv[i + 1:]
+        return args
+    return build_parser().parse_args(argv)
+
+def build_parser():
+    import argparse
+    p = argparse.ArgumentParser(prog="cli.py", description="Inversiones sin interfaz gráfica")
+    p.add_argument("--db", default=None, help="Ruta de la base (por defecto investments.db)")
+    p.add_argument("--json", action="store_true", help="Salida JSON (history: una fila por línea)")
+    sub = p.add_subparsers(dest="command", required=True)
+
+    s = sub.add_parser("clients", help="Listar clientes")
+    s.add_argument("-q", default=None, help="Buscar por nombre, email o teléfono (por relevancia)")
+    s.set_defaults(func=cmd_clients)
+
+    s = sub.add_parser("portfolio", help="Posiciones valuadas de un cliente")
+    s.add_argument("client", type=int)
+    s.set_defaults(func=cmd_portfolio)
+
+    s = sub.add_parser("history", help="Historial de un cliente (más reciente primero)")
+    s.add_argument("client", type=int)
+    s.add_argument("--day", default=None, help="Día YYYY-MM-DD")
+    s.add_argument("--from", dest="date_from", default=None, help="Desde YYYY-MM-DD")
+    s.add_argument("--to", dest="date_to", default=None, help="Hasta YYYY-MM-DD")
+    s.add_argument("--limit", type=int, default=None)
+    s.set_defaults(func=cmd_history)
+
+    s = sub.add_parser("nav", help="NAV diario de un cliente (fotos de services.snapshots)")
+    s.add_argument("client", type=int)
+    s.add_argument("--from", dest="date_from", default=None, help="Desde YYYY-MM-DD")
+    s.add_argument("--to", dest="date_to", default=None, help="Hasta YYYY-MM-DD")
+    s.set_defaults(func=cmd_nav)
+
+    s = sub.add_parser("realized", help="Ventas con resultado realizado de un cliente (por lotes)")
+    s.add_argument("client", type=int)
+    s.add_argument("--day", default=None, help="Día YYYY-MM-DD")
+    s.add_argument("--from", dest="date_from", default=None, help="Desde YYYY-MM-DD")
+    s.add_argument("--to", dest="date_to", default=None, help="Hasta YYYY-MM-DD")
+    s.set_defaults(func=cmd_realized)
+
+    s = sub.add_parser("stats", help="Versión de esquema, tamaño y conteos")
+    s.set_defaults(func=cmd_stats)
+
+    for name, func, help_ in (("deposit", cmd_deposit, "Depositar"), ("withdraw", cmd_withdraw, "Retirar")):
+        s = sub.add_parser(name, help=help_)
+        s.add_argument("client", type=int)
+        s.add_argument("amount", type=float)
+        s.add_argument("--note", default=None)
+        s.set_defaults(func=func)
+
+    s = sub.add_parser("buy", help="Comprar por monto")
+    s.add_argument("client", type=int)
+    s.add_argument("company")
+    s.add_argument("amount", type=float)
+    s.add_argument("price", type=float)
+    s.add_argument("--note", default=None)
+    s.set_defaults(func=cmd_buy)
+
+    s = sub.add_parser("sell", help="Vender acciones (o 'all')")
+    s.add_argument("client", type=int)
+    s.add_argument("company")
+    s.add_argument("shares")
+    s.add_argument("price", type=float)
+    s.add_argument("--note", default=None)
+    s.add_argument("--method", default=None, help="Lotes a vender: FIFO (por defecto), LIFO o AVG")
+    s.set_defaults(func=cmd_sell)
+
+    s = sub.add_parser("price", help="Actualizar el precio de una empresa para todos los clientes")
+    s.add_argument("company")
+    s.add_argument("price", type=float)
+    s.set_defaults(func=cmd_price)
+
+    for name, module, help_ in DELEGATES:
+        s = sub.add_parser(name, help=help_, add_help=False)
+        s.add_argument("rest", nargs=argparse.REMAINDER)
+        s.set_defaults(func=_delegate(module))
+    return p
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = _parse(sys.argv[1:] if argv is None else argv)
+    try:
+        return args.func(args)
+    except (ValueError, OSError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,31 +1,109 @@
 import os
+import queue
 import sqlite3
+import threading
+from contextlib import contextmanager
 from pathlib import Path
 
 DB_FILE = "investments.db"
 
-def get_connection():
-    conn = sqlite3.connect(DB_FILE, isolation_level=None, detect_types=sqlite3.PARSE_DECLTYPES)
+# WAL permite lecturas concurrentes con el escritor; NORMAL es seguro en WAL y evita un fsync por commit
+DEFAULT_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -20000,       # KiB (negativo) => ~20 MB por conexión
+    "mmap_size": 268435456,     # 256 MB
+    "temp_store": "MEMORY",
+}
+
+def get_connection(path: str | None = None, *, readonly: bool = False, pragmas: dict | None = None,
+                   check_same_thread: bool = True):
+    from utils.tracing import connection_factory
+    path = path or DB_FILE
+    # connection_factory() es sqlite3.Connection salvo con INVERSIONES_TRACE activo
+    if readonly:
+        uri = Path(path).resolve().as_uri() + "?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, isolation_level=None, detect_types=sqlite3.PARSE_DECLTYPES,
+                               check_same_thread=check_same_thread, factory=connection_factory())
+    else:
+        conn = sqlite3.connect(path, isolation_level=None, detect_types=sqlite3.PARSE_DECLTYPES,
+                               check_same_thread=check_same_thread, factory=connection_factory())
     conn.row_factory = sqlite3.Row
     conn.execute("PRAGMA foreign_keys = ON;")
+    for key, value in (DEFAULT_PRAGMAS if pragmas is None else pragmas).items():
+        if readonly and key == "journal_mode":
+            continue  # persistente en el archivo; lo fija el escritor
+        conn.execute(f"PRAGMA {key}={value}")
     return conn
 
-def run_schema(conn: sqlite3.Connection):
-    schema_path = Path("data") / "schema.sql"
-    with open(schema_path, "r", encoding="utf-8") as f:
-        sql = f.read()
-    with conn:
-        conn.executescript(sql)
+class ConnectionManager:
+    # Una conexión escritora (serializada con un lock) y un pool de conexiones de solo lectura.
+    # En WAL los lectores no bloquean al escritor ni viceversa.
+    def __init__(self, path: str | None = None, readers: int = 4, **pragmas):
+        self.path = path or DB_FILE
+        self.pragmas = {**DEFAULT_PRAGMAS, **pragmas}
+        self.max_readers = max(1, readers)
+        self._writer = get_connection(self.path, pragmas=self.pragmas, check_same_thread=False)
+        self._writer_lock = threading.RLock()
+        self._pool: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._created = 0
+        self._pool_lock = threading.Lock()
+        self._closed = False
+
+    @contextmanager
+    def writer(self):
+        with self._writer_lock:
+            yield self._writer
+
+    def acquire_reader(self, timeout: float | None = None) -> sqlite3.Connection:
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            pass
+        with self._pool_lock:
+            if self._created < self.max_readers:
+                self._created += 1
+                try:
+                    return get_connection(self.path, readonly=True, pragmas=self.pragmas, check_same_thread=False)
+                except Exception:
+                    self._created -= 1
+                    raise
+        return self._pool.get(timeout=timeout)
+
+    def release_reader(self, conn: sqlite3.Connection):
+        if self._closed:
+            conn.close()
+        else:
+            self._pool.put(conn)
+
+    @contextmanager
+    def reader(self):
+        conn = self.acquire_reader()
+        try:
+            yield conn
+        finally:
+            self.release_reader(conn)
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._writer_lock:
+            self._writer.close()
 
 def ensure_schema_and_seed(conn: sqlite3.Connection):
-    # Create schema
-    run_schema(conn)
-    # Seed demo
-    cur = conn.execute("SELECT COUNT(*) AS c FROM clients;")
-    c = cur.fetchone()["c"]
-    if c == 0:
-        from utils.format import now_iso
-        now = now_iso()
+    # Con el esquema al día esto es una sola lectura de PRAGMA user_version
+    from data.migrations import migrate, get_version
+    fresh = get_version(conn) == 0 and not conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='clients'").fetchone()
+    migrate(conn)
+    # Seed demo (solo al crear la base)
+    if fresh:
+        from utils.format import now_ts
+        now = now_ts()
         with conn:
             conn.execute(
                 "INSERT INTO clients (name, email, phone, created_at, capital_available) VALUES (?,?,?,?,?)",
@@ -33,15 +111,20 @@ def ensure_schema_and_seed(conn: sqlite3.Connection):
             )
             client_id = conn.execute("SELECT id FROM clients WHERE email = ?", ("demo@example.com",)).fetchone()["id"]
             # Opcional: crear inversiones ejemplo
+            instrument_id = conn.execute(
+                "INSERT INTO instruments (symbol, created_at) VALUES (?,?)", ("ACME", now)
+            ).lastrowid
             conn.execute(
-                "INSERT INTO investments (client_id, company, avg_price, shares, created_at) VALUES (?,?,?,?,?)",
-                (client_id, "ACME", 100.0, 20.0, now),
+                "INSERT INTO investments (client_id, instrument_id, company, avg_price, shares, created_at) VALUES (?,?,?,?,?,?)",
+                (client_id, instrument_id, "ACME", 100.0, 20.0, now),
             )
             inv_id = conn.execute("SELECT id FROM investments WHERE client_id=? AND company=?", (client_id, "ACME")).fetchone()["id"]
-            conn.execute(
-                "INSERT INTO price_history (investment_id, price, created_at) VALUES (?,?,?)",
-                (inv_id, 105.0, now),
-            )
+            ph_id = conn.execute(
+                "INSERT INTO price_history (instrument_id, price, created_at) VALUES (?,?,?)",
+                (instrument_id, 105.0, now),
+            ).lastrowid
+            from data.repositorios import upsert_latest_price
+            upsert_latest_price(conn, instrument_id, 105.0, now, ph_id)
             conn.execute(
                 "INSERT INTO investment_trades (investment_id, type, shares, price, amount, created_at, note) VALUES (?,?,?,?,?,?,?)",
                 (inv_id, "BUY", 20.0, 100.0, 2000.0, now, "Seed"),
@@ -0,0 +1,372 @@
+import sqlite3
+from collections import deque
+from itertools import groupby
+from pathlib import Path
+from typing import Callable, List, Tuple
+
+# Esquema base (versión 1); los cambios posteriores son pasos numerados en MIGRATIONS
+SCHEMA_FILE = Path(__file__).with_name("schema.sql")
+
+def _columns(conn: sqlite3.Connection, table: str) -> set:
+    return {r["name"] for r in conn.execute(f"PRAGMA table_info({table})")}
+
+def _exec_script(conn: sqlite3.Connection, sql: str):
+    # Como executescript pero sin su COMMIT implícito: corre dentro de la transacción del paso
+    stmt = ""
+    for line in sql.splitlines(keepends=True):
+        stmt += line
+        if sqlite3.complete_statement(stmt):
+            conn.execute(stmt)
+            stmt = ""
+    if stmt.strip():
+        conn.execute(stmt)
+
+def _legacy_instruments(conn: sqlite3.Connection):
+    # Bases anteriores a instruments: price_history/latest_price colgaban de investments.id.
+    # Se crea un instrumento por cada investments.company y la serie de precios pasa a ser
+    # por instrumento (puntos duplicados entre clientes se colapsan en uno).
+    if "investment_id" not in _columns(conn, "price_history"):
+        return
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS instruments (id INTEGER PRIMARY KEY, symbol TEXT NOT NULL UNIQUE, created_at TEXT)"
+    )
+    conn.execute(
+        "INSERT OR IGNORE INTO instruments (symbol, created_at) "
+        "SELECT company, MIN(created_at) FROM investments GROUP BY company"
+    )
+    if "instrument_id" not in _columns(conn, "investments"):
+        conn.execute("ALTER TABLE investments ADD COLUMN instrument_id INTEGER REFERENCES instruments(id)")
+    conn.execute(
+        "UPDATE investments SET instrument_id = (SELECT i.id FROM instruments i WHERE i.symbol = investments.company)"
+    )
+    conn.execute(
+        """
+        CREATE TABLE price_history_new (
+          id INTEGER PRIMARY KEY,
+          instrument_id INTEGER NOT NULL REFERENCES instruments(id) ON DELETE CASCADE,
+          price REAL NOT NULL,
+          created_at TEXT
+        )
+        """
+    )
+    conn.execute(
+        """
+        INSERT INTO price_history_new (id, instrument_id, price, created_at)
+        SELECT MIN(ph.id), inv.instrument_id, ph.price, ph.created_at
+        FROM price_history ph
+        JOIN investments inv ON inv.id = ph.investment_id
+        GROUP BY inv.instrument_id, ph.created_at, ph.price
+        """
+    )
+    conn.execute("DROP TABLE price_history")
+    conn.execute("ALTER TABLE price_history_new RENAME TO price_history")
+    # Se regenera por instrumento con el backfill del mismo paso
+    conn.execute("DROP TABLE IF EXISTS latest_price")
+
+def _v1_base(conn: sqlite3.Connection):
+    # Crea el esquema base o adapta bases anteriores al versionado (user_version = 0)
+    _legacy_instruments(conn)
+    _exec_script(conn, SCHEMA_FILE.read_text(encoding="utf-8"))
+    from data.repositorios import backfill_latest_prices
+    if conn.execute("SELECT NOT EXISTS (SELECT 1 FROM latest_price) AND EXISTS (SELECT 1 FROM price_history)").fetchone()[0]:
+        backfill_latest_prices(conn)
+
+# Tablas con created_at, en orden de dependencia, con su definición en la versión 2.
+# created_at pasa de texto local "YYYY-MM-DD HH:MM:SS" a INTEGER (microsegundos desde epoch, UTC).
+_V2_TABLES = [
+    ("clients", """
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        email TEXT UNIQUE,
+        phone TEXT,
+        created_at INTEGER,
+        capital_available REAL NOT NULL DEFAULT 0.0
+    """),
+    ("instruments", """
+        id INTEGER PRIMARY KEY,
+        symbol TEXT NOT NULL UNIQUE,
+        created_at INTEGER
+    """),
+    ("investments", """
+        id INTEGER PRIMARY KEY,
+        client_id INTEGER NOT NULL REFERENCES clients(id) ON DELETE CASCADE,
+        instrument_id INTEGER REFERENCES instruments(id),
+        company TEXT NOT NULL,
+        avg_price REAL NOT NULL DEFAULT 0,
+        shares REAL NOT NULL DEFAULT 0,
+        created_at INTEGER
+    """),
+    ("cash_movements", """
+        id INTEGER PRIMARY KEY,
+        client_id INTEGER NOT NULL REFERENCES clients(id) ON DELETE CASCADE,
+        type TEXT CHECK(type IN ('DEPOSIT','WITHDRAW')) NOT NULL,
+        amount REAL NOT NULL,
+        note TEXT,
+        created_at INTEGER
+    """),
+    ("investment_trades", """
+        id INTEGER PRIMARY KEY,
+        investment_id INTEGER NOT NULL REFERENCES investments(id) ON DELETE CASCADE,
+        type TEXT CHECK(type IN ('BUY','SELL','PRICE_UPDATE')) NOT NULL,
+        shares REAL DEFAULT 0,
+        price REAL NOT NULL,
+        amount REAL NOT NULL,
+        created_at INTEGER,
+        note TEXT
+    """),
+    ("price_history", """
+        id INTEGER PRIMARY KEY,
+        instrument_id INTEGER NOT NULL REFERENCES instruments(id) ON DELETE CASCADE,
+        price REAL NOT NULL,
+        created_at INTEGER
+    """),
+    ("latest_price", """
+        instrument_id INTEGER PRIMARY KEY REFERENCES instruments(id) ON DELETE CASCADE,
+        price REAL NOT NULL,
+        created_at INTEGER,
+        price_history_id INTEGER
+    """),
+]
+
+_V2_INDEXES = [
+    "CREATE INDEX idx_clients_created ON clients(created_at)",
+    "CREATE INDEX idx_investments_client ON investments(client_id)",
+    "CREATE INDEX idx_investments_instrument ON investments(instrument_id)",
+    "CREATE INDEX idx_cash_movements_client_ts ON cash_movements(client_id, created_at)",
+    "CREATE INDEX idx_trades_investment_ts ON investment_trades(investment_id, created_at)",
+    # Cubre la búsqueda del último precio / serie por instrumento sin tocar la tabla
+    "CREATE INDEX idx_price_history_instrument_ts ON price_history(instrument_id, created_at, price)",
+]
+
+# Texto en hora local -> microsegundos UTC (los enteros ya convertidos se dejan igual)
+_TS_EXPR = (
+    "CASE WHEN created_at IS NULL THEN NULL "
+    "WHEN typeof(created_at) = 'integer' THEN created_at "
+    "ELSE CAST(strftime('%s', created_at, 'utc') AS INTEGER) * 1000000 END"
+)
+
+def _v2_integer_timestamps(conn: sqlite3.Connection):
+    # SQLite no cambia el tipo de una columna: cada tabla se reconstruye y se copian los datos
+    for table, body in _V2_TABLES:
+        cols = _columns(conn, table)
+        new_cols = [line.strip().split()[0] for line in body.strip().splitlines()]
+        keep = [c for c in new_cols if c in cols]
+        select = ", ".join(_TS_EXPR if c == "created_at" else c for c in keep)
+        conn.execute(f"CREATE TABLE {table}_new ({body})")
+        conn.execute(f"INSERT INTO {table}_new ({', '.join(keep)}) SELECT {select} FROM {table}")
+        conn.execute(f"DROP TABLE {table}")
+        conn.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+    for stmt in _V2_INDEXES:
+        conn.execute(stmt)
+
+# Índice de texto de clientes (FTS5, contenido externo: guarda solo el índice, no copia las filas).
+# Lo mantienen los triggers; el UPDATE de capital no toca name/email/phone y no lo dispara.
+_V3_CLIENTS_FTS = [
+    """CREATE VIRTUAL TABLE clients_fts USING fts5(
+        name, email, phone,
+        content='clients', content_rowid='id',
+        tokenize="unicode61 remove_diacritics 2", prefix='2 3'
+    )""",
+    """CREATE TRIGGER clients_fts_ai AFTER INSERT ON clients BEGIN
+        INSERT INTO clients_fts(rowid, name, email, phone) VALUES (new.id, new.name, new.email, new.phone);
+    END""",
+    """CREATE TRIGGER clients_fts_ad AFTER DELETE ON clients BEGIN
+        INSERT INTO clients_fts(clients_fts, rowid, name, email, phone) VALUES ('delete', old.id, old.name, old.email, old.phone);
+    END""",
+    """CREATE TRIGGER clients_fts_au AFTER UPDATE OF name, email, phone ON clients BEGIN
+        INSERT INTO clients_fts(clients_fts, rowid, name, email, phone) VALUES ('delete', old.id, old.name, old.email, old.phone);
+        INSERT INTO clients_fts(rowid, name, email, phone) VALUES (new.id, new.name, new.email, new.phone);
+    END""",
+    "INSERT INTO clients_fts(clients_fts) VALUES ('rebuild')",
+]
+
+def _v3_clients_fts(conn: sqlite3.Connection):
+    # Sin FTS5 compilado en SQLite se omite: repositorios.search_clients cae a LIKE
+    try:
+        conn.execute("CREATE VIRTUAL TABLE temp._fts5_check USING fts5(x)")
+        conn.execute("DROP TABLE temp._fts5_check")
+    except sqlite3.OperationalError:
+        return
+    for stmt in _V3_CLIENTS_FTS:
+        conn.execute(stmt)
+
+# Fotos diarias de NAV por cliente (services.snapshots). day: "YYYY-MM-DD" en hora local, valores al cierre.
+_V4_NAV_SNAPSHOTS = [
+    """CREATE TABLE nav_snapshots (
+        client_id INTEGER NOT NULL REFERENCES clients(id) ON DELETE CASCADE,
+        day TEXT NOT NULL,
+        cash REAL NOT NULL,
+        market_value REAL NOT NULL,
+        nav REAL NOT NULL,
+        net_flow REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (client_id, day)
+    ) WITHOUT ROWID""",
+    """CREATE TABLE nav_snapshot_positions (
+        client_id INTEGER NOT NULL REFERENCES clients(id) ON DELETE CASCADE,
+        day TEXT NOT NULL,
+        investment_id INTEGER NOT NULL REFERENCES investments(id) ON DELETE CASCADE,
+        shares REAL NOT NULL,
+        price REAL NOT NULL,
+        value REAL NOT NULL,
+        PRIMARY KEY (client_id, day, investment_id)
+    ) WITHOUT ROWID""",
+    # Invalidación por fecha (escrituras con fecha pasada) sin recorrer todas las fotos
+    "CREATE INDEX idx_nav_snapshots_day ON nav_snapshots(day)",
+    "CREATE INDEX idx_nav_snapshot_positions_day ON nav_snapshot_positions(day)",
+]
+
+def _v4_nav_snapshots(conn: sqlite3.Connection):
+    for stmt in _V4_NAV_SNAPSHOTS:
+        conn.execute(stmt)
+
+# Lotes por posición (services.lots): uno por BUY; cada SELL consume lotes según el método y deja sus
+# cruces en lot_matches y el resultado realizado en investment_trades.realized_pnl.
+_V5_LOTS = [
+    """CREATE TABLE lots (
+        id INTEGER PRIMARY KEY,
+        investment_id INTEGER NOT NULL REFERENCES investments(id) ON DELETE CASCADE,
+        buy_trade_id INTEGER REFERENCES investment_trades(id) ON DELETE CASCADE,
+        shares REAL NOT NULL,
+        remaining REAL NOT NULL,
+        price REAL NOT NULL,
+        created_at INTEGER
+    )""",
+    """CREATE TABLE lot_matches (
+        id INTEGER PRIMARY KEY,
+        sell_trade_id INTEGER NOT NULL REFERENCES investment_trades(id) ON DELETE CASCADE,
+        lot_id INTEGER REFERENCES lots(id) ON DELETE CASCADE,
+        shares REAL NOT NULL,
+        cost REAL NOT NULL,
+        proceeds REAL NOT NULL,
+        realized_pnl REAL NOT NULL
+    )""",
+    # Cola de lotes abiertos de cada posición, en orden de compra (solo los que tienen saldo)
+    "CREATE INDEX idx_lots_open ON lots(investment_id, created_at, id) WHERE remaining > 0",
+    "CREATE INDEX idx_lots_investment ON lots(investment_id)",
+    "CREATE INDEX idx_lot_matches_sell ON lot_matches(sell_trade_id)",
+    "CREATE INDEX idx_lot_matches_lot ON lot_matches(lot_id)",
+    "ALTER TABLE investment_trades ADD COLUMN realized_pnl REAL",
+]
+
+def _v5_replay_fifo(conn: sqlite3.Connection):
+    # Lotes de las operaciones existentes con FIFO. Copia fija del motor de esta versión (no importa
+    # services.lots, que puede cambiar): una pasada por posición en orden cronológico, con un lote
+    # inicial a costo promedio para las acciones que el historial no explica.
+    eps = 1e-9
+    invs = {r["id"]: r for r in conn.execute("SELECT id, shares, avg_price, created_at FROM investments")}
+    traded = dict(conn.execute(
+        "SELECT investment_id, COALESCE(SUM(CASE type WHEN 'BUY' THEN shares WHEN 'SELL' THEN -shares ELSE 0 END), 0) "
+        "FROM investment_trades GROUP BY investment_id"
+    ).fetchall())
+    next_id = 1
+    lots_rows, matches_rows, pnl_rows = [], [], []
+
+    def opening(inv_id):
+        # [id, buy_trade_id, shares, remaining, price, created_at]
+        nonlocal next_id
+        inv = invs.get(inv_id)
+        if inv is None or inv["shares"] - traded.get(inv_id, 0.0) <= eps:
+            return []
+        qty = inv["shares"] - traded.get(inv_id, 0.0)
+        next_id += 1
+        return [[next_id - 1, None, qty, qty, inv["avg_price"], inv["created_at"]]]
+
+    def flush():
+        conn.executemany("INSERT INTO lots (id, investment_id, buy_trade_id, shares, remaining, price, created_at) "
+                         "VALUES (?,?,?,?,?,?,?)", lots_rows)
+        conn.executemany("INSERT INTO lot_matches (sell_trade_id, lot_id, shares, cost, proceeds, realized_pnl) "
+                         "VALUES (?,?,?,?,?,?)", matches_rows)
+        conn.executemany("UPDATE investment_trades SET realized_pnl = ? WHERE id = ?", pnl_rows)
+        lots_rows.clear()
+        matches_rows.clear()
+        pnl_rows.clear()
+
+    trades = conn.execute(
+        "SELECT id, investment_id, type, shares, price, created_at FROM investment_trades "
+        "WHERE type IN ('BUY','SELL') ORDER BY investment_id, created_at, id"
+    )
+    seen = set()
+    for inv_id, group in groupby(trades, key=lambda t: t["investment_id"]):
+        seen.add(inv_id)
+        lots = opening(inv_id)
+        queue = deque(lots)
+        for t in group:
+            if t["type"] == "BUY":
+                lots.append([next_id, t["id"], t["shares"], t["shares"], t["price"], t["created_at"]])
+                queue.append(lots[-1])
+                next_id += 1
+                continue
+            left, realized = t["shares"], 0.0
+            while left > eps and queue:
+                lot = queue[0]
+                qty = min(lot[3], left)
+                lot[3] -= qty
+                left -= qty
+                cost, proceeds = qty * lot[4], qty * t["price"]
+                matches_rows.append((t["id"], lot[0], qty, cost, proceeds, proceeds - cost))
+                realized += proceeds - cost
+                if lot[3] < eps:
+                    lot[3] = 0.0
+                    queue.popleft()
+            if left > eps:
+                matches_rows.append((t["id"], None, left, left * t["price"], left * t["price"], 0.0))
+            pnl_rows.append((realized, t["id"]))
+        lots_rows.extend((lot[0], inv_id, *lot[1:]) for lot in lots)
+        if len(lots_rows) + len(matches_rows) >= 50_000:
+            flush()
+    for inv_id in invs:
+        if inv_id not in seen:
+            lots_rows.extend((lot[0], inv_id, *lot[1:]) for lot in opening(inv_id))
+    flush()
+
+def _v5_lots(conn: sqlite3.Connection):
+    for stmt in _V5_LOTS:
+        conn.execute(stmt)
+    _v5_replay_fifo(conn)
+
+def _v6_lot_method(conn: sqlite3.Connection):
+    # Método de lotes de cada SELL (FIFO, LIFO o AVG) para rehacer lotes sin cambiar el elegido al vender.
+    # NULL: ventas anteriores a este paso, que el paso 5 cruzó con FIFO.
+    conn.execute("ALTER TABLE investment_trades ADD COLUMN lot_method TEXT")
+
+# (versión, descripción, función). Solo se agregan pasos al final; nunca se editan los publicados.
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Connection], None]]] = [
+    (1, "esquema base, instrumentos y latest_price", _v1_base),
+    (2, "created_at como entero (microsegundos epoch) e índices por rango", _v2_integer_timestamps),
+    (3, "índice de texto (FTS5) de clientes por nombre, email y teléfono", _v3_clients_fts),
+    (4, "fotos diarias de NAV por cliente y posición", _v4_nav_snapshots),
+    (5, "lotes por posición y resultado realizado por venta", _v5_lots),
+    (6, "método de lotes guardado en cada venta", _v6_lot_method),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def get_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def migrate(conn: sqlite3.Connection) -> int:
+    # Aplica los pasos pendientes, cada uno en su transacción junto con su user_version.
+    # Devuelve la versión previa (0 = base nueva o sin versionar).
+    current = get_version(conn)
+    if current >= SCHEMA_VERSION:
+        return current
+    # Las reescrituras de tablas requieren FKs desactivadas (no se puede cambiar dentro de una transacción)
+    conn.execute("PRAGMA foreign_keys = OFF")
+    try:
+        for version, _desc, step in MIGRATIONS:
+            if version <= current:
+                continue
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                step(conn)
+                bad = conn.execute("PRAGMA foreign_key_check").fetchall()
+                if bad:
+                    raise sqlite3.IntegrityError(f"Migración {version}: {len(bad)} referencias inválidas")
+                conn.execute(f"PRAGMA user_version = {version}")
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+    finally:
+        conn.execute("PRAGMA foreign_keys = ON")
+    return current
@@ -1,33 +1,155 @@
-from typing import Optional, List, Dict, Any, Tuple
+from typing import Optional, List, Dict, Any, Tuple, Iterator
+import re
 import sqlite3
 
+# Límite conservador de parámetros por sentencia (SQLITE_MAX_VARIABLE_NUMBER)
+_MAX_PARAMS = 500
+
+def _id_chunks(ids: List[int]):
+    # (placeholders, chunk) para consultas "IN (...)" sin exceder el límite de parámetros
+    ids = list(dict.fromkeys(ids))
+    for i in range(0, len(ids), _MAX_PARAMS):
+        chunk = ids[i:i + _MAX_PARAMS]
+        yield ",".join("?" * len(chunk)), tuple(chunk)
+
 # ==== Clients ====
 
+def _client_match(q: str) -> Optional[str]:
+    # Texto libre -> consulta FTS5: cada palabra como prefijo, todas requeridas ("ana" "gom"*...)
+    words = re.findall(r"\w+", q)
+    return " ".join(f'"{w}"*' for w in words) if words else None
+
+def _has_clients_fts(conn: sqlite3.Connection) -> bool:
+    return conn.execute("SELECT EXISTS (SELECT 1 FROM sqlite_master WHERE name = 'clients_fts')").fetchone()[0] == 1
+
+def _client_filter(conn: sqlite3.Connection, q: str) -> Tuple[str, list]:
+    # Condición sobre clients para una búsqueda: índice FTS5 si está, si no LIKE (recorre la tabla)
+    match = _client_match(q)
+    if match and _has_clients_fts(conn):
+        return "id IN (SELECT rowid FROM clients_fts WHERE clients_fts MATCH ?)", [match]
+    like = f"%{q}%"
+    return "(name LIKE ? OR email LIKE ? OR phone LIKE ?)", [like, like, like]
+
+def _search_sql(conn: sqlite3.Connection, q: str, columns: str, limit: Optional[int]) -> Tuple[str, list]:
+    # Por relevancia (nombre pesa más que email y este más que teléfono), luego los más nuevos
+    match = _client_match(q)
+    if match and _has_clients_fts(conn):
+        sql = (f"SELECT {columns} FROM clients_fts JOIN clients c ON c.id = clients_fts.rowid "
+               "WHERE clients_fts MATCH ? ORDER BY bm25(clients_fts, 10.0, 5.0, 1.0), c.created_at DESC")
+        params: List[Any] = [match]
+    else:
+        where, params = _client_filter(conn, q)
+        sql = f"SELECT {columns} FROM clients c WHERE {where} ORDER BY c.created_at DESC"
+    if limit:
+        sql += " LIMIT ?"
+        params.append(limit)
+    return sql, params
+
+def search_clients(conn: sqlite3.Connection, q: str, limit: Optional[int] = 50) -> List[sqlite3.Row]:
+    return conn.execute(*_search_sql(conn, q, "c.*", limit)).fetchall()
+
+def search_client_ids(conn: sqlite3.Connection, q: str, limit: Optional[int] = 50) -> List[int]:
+    # Mismo orden que search_clients, solo los IDs (grilla virtual: las filas se piden por página)
+    return [r[0] for r in conn.execute(*_search_sql(conn, q, "c.id", limit))]
+
 def list_clients(conn: sqlite3.Connection, q: Optional[str] = None) -> List[sqlite3.Row]:
     if q:
-        return conn.execute(
-            "SELECT * FROM clients WHERE name LIKE ? ORDER BY created_at DESC",
-            (f"%{q}%",),
-        ).fetchall()
+        return search_clients(conn, q, limit=None)
     return conn.execute(
         "SELECT * FROM clients ORDER BY created_at DESC"
     ).fetchall()
 
+def list_clients_page(conn: sqlite3.Connection, q: Optional[str] = None,
+                      before: Optional[Tuple[int, int]] = None, limit: int = 50) -> List[sqlite3.Row]:
+    # Más nuevos primero (también con q); before = (created_at, id) de la última fila vista
+    where, params = [], []
+    if q:
+        cond, cond_params = _client_filter(conn, q)
+        where.append(cond)
+        params += cond_params
+    if before is not None:
+        where.append("(created_at, id) < (?, ?)")
+        params += list(before)
+    sql = "SELECT * FROM clients"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY created_at DESC, id DESC LIMIT ?"
+    return conn.execute(sql, params + [limit]).fetchall()
+
+def list_client_ids(conn: sqlite3.Connection, newest_first: bool = False) -> List[int]:
+    order = "created_at DESC, id DESC" if newest_first else "id"
+    return [r[0] for r in conn.execute(f"SELECT id FROM clients ORDER BY {order}")]
+
 def create_client(conn: sqlite3.Connection, name: str, email: Optional[str], phone: Optional[str], initial_capital: float) -> int:
-    from utils.format import now_iso
-    now = now_iso()
+    from utils.format import now_ts
+    now = now_ts()
     cur = conn.execute(
         "INSERT INTO clients (name, email, phone, created_at, capital_available) VALUES (?,?,?,?,?)",
         (name, email, phone, now, float(initial_capital or 0.0)),
     )
     return cur.lastrowid
 
+def create_clients_many(conn: sqlite3.Connection, rows: List[Tuple[str, Optional[str], Optional[str], int, float]]):
+    # rows: (name, email, phone, created_at, capital_available)
+    conn.executemany(
+        "INSERT INTO clients (name, email, phone, created_at, capital_available) VALUES (?,?,?,?,?)",
+        rows,
+    )
+
 def get_client(conn: sqlite3.Connection, client_id: int) -> Optional[sqlite3.Row]:
     return conn.execute("SELECT * FROM clients WHERE id=?", (client_id,)).fetchone()
 
 def update_client_capital(conn: sqlite3.Connection, client_id: int, delta: float):
     conn.execute("UPDATE clients SET capital_available = capital_available + ? WHERE id=?", (delta, client_id))
 
+def get_clients_by_ids(conn: sqlite3.Connection, client_ids: List[int]) -> List[sqlite3.Row]:
+    rows: List[sqlite3.Row] = []
+    for marks, chunk in _id_chunks(client_ids):
+        rows.extend(conn.execute(f"SELECT * FROM clients WHERE id IN ({marks})", chunk).fetchall())
+    return rows
+
+def get_last_activity_ts(conn: sqlite3.Connection, client_ids: List[int]) -> Dict[int, int]:
+    # Último movimiento de efectivo u operación registrado por cliente (client_id -> created_at)
+    last: Dict[int, int] = {}
+    for marks, chunk in _id_chunks(client_ids):
+        for sql in (f"SELECT client_id, MAX(created_at) FROM cash_movements WHERE client_id IN ({marks}) GROUP BY client_id",
+                    f"SELECT inv.client_id, MAX(it.created_at) FROM investments inv "
+                    f"JOIN investment_trades it ON it.investment_id = inv.id "
+                    f"WHERE inv.client_id IN ({marks}) GROUP BY inv.client_id"):
+            for cid, ts in conn.execute(sql, chunk):
+                if ts is not None and (cid not in last or ts > last[cid]):
+                    last[cid] = ts
+    return last
+
+def get_clients_in_range(conn: sqlite3.Connection, first_id: int, last_id: int) -> List[sqlite3.Row]:
+    return conn.execute("SELECT * FROM clients WHERE id BETWEEN ? AND ? ORDER BY id", (first_id, last_id)).fetchall()
+
+def update_client_capital_many(conn: sqlite3.Connection, deltas: List[Tuple[float, int]]):
+    # deltas: (delta, client_id)
+    conn.executemany("UPDATE clients SET capital_available = capital_available + ? WHERE id=?", deltas)
+
+# ==== Instruments ====
+
+def get_instrument_by_symbol(conn: sqlite3.Connection, symbol: str) -> Optional[sqlite3.Row]:
+    return conn.execute("SELECT * FROM instruments WHERE symbol=?", (symbol,)).fetchone()
+
+def get_instrument_ids(conn: sqlite3.Connection) -> Dict[str, int]:
+    return {r["symbol"]: r["id"] for r in conn.execute("SELECT id, symbol FROM instruments")}
+
+def create_instruments_many(conn: sqlite3.Connection, symbols: List[str], created_at: int):
+    conn.executemany(
+        "INSERT OR IGNORE INTO instruments (symbol, created_at) VALUES (?,?)",
+        [(s, created_at) for s in symbols],
+    )
+
+def get_or_create_instrument(conn: sqlite3.Connection, symbol: str) -> int:
+    row = get_instrument_by_symbol(conn, symbol)
+    if row:
+        return row["id"]
+    from utils.format import now_ts
+    cur = conn.execute("INSERT INTO instruments (symbol, created_at) VALUES (?,?)", (symbol, now_ts()))
+    return cur.lastrowid
+
 # ==== Investments ====
 
 def get_investments_by_client(conn: sqlite3.Connection, client_id: int) -> List[sqlite3.Row]:
@@ -35,6 +157,12 @@ def get_investments_by_client(conn: sqlite3.Connection, client_id: int) -> List[
         "SELECT * FROM investments WHERE client_id=? ORDER BY created_at DESC", (client_id,)
     ).fetchall()
 
+def get_investments_by_ids(conn: sqlite3.Connection, investment_ids: List[int]) -> List[sqlite3.Row]:
+    rows: List[sqlite3.Row] = []
+    for marks, chunk in _id_chunks(investment_ids):
+        rows.extend(conn.execute(f"SELECT * FROM investments WHERE id IN ({marks})", chunk).fetchall())
+    return rows
+
 def get_investment_by_company(conn: sqlite3.Connection, client_id: int, company: str) -> Optional[sqlite3.Row]:
     return conn.execute(
         "SELECT * FROM investments WHERE client_id=? AND company=?",
@@ -44,15 +172,35 @@ def get_investment_by_company(conn: sqlite3.Connection, client_id: int, company:
 def get_investment(conn: sqlite3.Connection, investment_id: int) -> Optional[sqlite3.Row]:
     return conn.execute("SELECT * FROM investments WHERE id=?", (investment_id,)).fetchone()
 
-def create_investment(conn: sqlite3.Connection, client_id: int, company: str, avg_price: float, shares: float) -> int:
-    from utils.format import now_iso
-    now = now_iso()
+def create_investment(conn: sqlite3.Connection, client_id: int, company: str, avg_price: float, shares: float,
+                      instrument_id: Optional[int] = None) -> int:
+    from utils.format import now_ts
+    now = now_ts()
+    if instrument_id is None:
+        instrument_id = get_or_create_instrument(conn, company)
     cur = conn.execute(
-        "INSERT INTO investments (client_id, company, avg_price, shares, created_at) VALUES (?,?,?,?,?)",
-        (client_id, company, avg_price, shares, now),
+        "INSERT INTO investments (client_id, instrument_id, company, avg_price, shares, created_at) VALUES (?,?,?,?,?,?)",
+        (client_id, instrument_id, company, avg_price, shares, now),
     )
     return cur.lastrowid
 
+def get_investments_by_clients(conn: sqlite3.Connection, client_ids: List[int]) -> List[sqlite3.Row]:
+    rows: List[sqlite3.Row] = []
+    for marks, chunk in _id_chunks(client_ids):
+        rows.extend(conn.execute(f"SELECT * FROM investments WHERE client_id IN ({marks})", chunk).fetchall())
+    return rows
+
+def create_investments_many(conn: sqlite3.Connection, rows: List[Tuple[int, int, str, float, float, int]]):
+    # rows: (client_id, instrument_id, company, avg_price, shares, created_at)
+    conn.executemany(
+        "INSERT INTO investments (client_id, instrument_id, company, avg_price, shares, created_at) VALUES (?,?,?,?,?,?)",
+        rows,
+    )
+
+def update_investments_many(conn: sqlite3.Connection, rows: List[Tuple[float, float, int]]):
+    # rows: (avg_price, shares, investment_id)
+    conn.executemany("UPDATE investments SET avg_price=?, shares=? WHERE id=?", rows)
+
 def update_investment(conn: sqlite3.Connection, investment_id: int, *, avg_price: Optional[float]=None, shares: Optional[float]=None):
     if avg_price is not None and shares is not None:
         conn.execute("UPDATE investments SET avg_price=?, shares=? WHERE id=?", (avg_price, shares, investment_id))
@@ -64,47 +212,463 @@ def update_investment(conn: sqlite3.Connection, investment_id: int, *, avg_price
 # ==== Movements / Trades / Prices ====
 
 def insert_cash_movement(conn: sqlite3.Connection, client_id: int, mtype: str, amount: float, note: Optional[str]):
-    from utils.format import now_iso
-    now = now_iso()
+    from utils.format import now_ts
+    now = now_ts()
     conn.execute(
         "INSERT INTO cash_movements (client_id, type, amount, note, created_at) VALUES (?,?,?,?,?)",
         (client_id, mtype, amount, note, now),
     )
+    # Una foto del día en curso (build_snapshots --to hoy) ya no vale
+    invalidate_nav_snapshots(conn, now, [client_id])
 
-def insert_trade(conn: sqlite3.Connection, investment_id: int, ttype: str, shares: float, price: float, amount: float, note: Optional[str]):
-    from utils.format import now_iso
-    now = now_iso()
-    conn.execute(
+def insert_trade(conn: sqlite3.Connection, investment_id: int, ttype: str, shares: float, price: float, amount: float,
+                 note: Optional[str], realized_pnl: Optional[float] = None, created_at: Optional[int] = None,
+                 lot_method: Optional[str] = None) -> int:
+    from utils.format import now_ts
+    now = now_ts() if created_at is None else created_at
+    cur = conn.execute(
+        "INSERT INTO investment_trades (investment_id, type, shares, price, amount, created_at, note, realized_pnl, "
+        "lot_method) VALUES (?,?,?,?,?,?,?,?,?)",
+        (investment_id, ttype, shares, price, amount, now, note, realized_pnl, lot_method),
+    )
+    invalidate_nav_snapshots(conn, now, investment_ids=[investment_id])
+    return cur.lastrowid
+
+def insert_cash_movements_many(conn: sqlite3.Connection, rows: List[Tuple[int, str, float, Optional[str], int]]):
+    # rows: (client_id, type, amount, note, created_at)
+    conn.executemany(
+        "INSERT INTO cash_movements (client_id, type, amount, note, created_at) VALUES (?,?,?,?,?)",
+        rows,
+    )
+    if rows:
+        invalidate_nav_snapshots(conn, min(r[4] for r in rows), [r[0] for r in rows])
+
+def insert_trades_many(conn: sqlite3.Connection, rows: List[Tuple[int, str, float, float, float, int, Optional[str]]]):
+    # rows: (investment_id, type, shares, price, amount, created_at, note)
+    conn.executemany(
         "INSERT INTO investment_trades (investment_id, type, shares, price, amount, created_at, note) VALUES (?,?,?,?,?,?,?)",
-        (investment_id, ttype, shares, price, amount, now, note),
+        rows,
     )
+    if rows:
+        invalidate_nav_snapshots(conn, min(r[5] for r in rows), investment_ids=[r[0] for r in rows])
+
+def insert_price_history(conn: sqlite3.Connection, instrument_id: int, price: float):
+    from utils.format import now_ts
+    now = now_ts()
+    cur = conn.execute(
+        "INSERT INTO price_history (instrument_id, price, created_at) VALUES (?,?,?)",
+        (instrument_id, price, now),
+    )
+    upsert_latest_price(conn, instrument_id, price, now, cur.lastrowid)
+    invalidate_nav_snapshots(conn, now, instrument_id=instrument_id)
+
+def upsert_latest_price(conn: sqlite3.Connection, instrument_id: int, price: float, created_at: int, price_history_id: int):
+    # Solo reemplaza si el nuevo punto es posterior (created_at, id) al guardado
+    conn.execute(
+        """
+        INSERT INTO latest_price (instrument_id, price, created_at, price_history_id) VALUES (?,?,?,?)
+        ON CONFLICT(instrument_id) DO UPDATE SET
+            price=excluded.price, created_at=excluded.created_at, price_history_id=excluded.price_history_id
+        WHERE excluded.created_at > latest_price.created_at
+           OR (excluded.created_at = latest_price.created_at AND excluded.price_history_id > latest_price.price_history_id)
+        """,
+        (instrument_id, price, created_at, price_history_id),
+    )
+
+def insert_price_history_many(conn: sqlite3.Connection, rows: List[Tuple[int, float, int]]) -> int:
+    # rows: (instrument_id, price, created_at); mantiene latest_price en bloque
+    if not rows:
+        return 0
+    first_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM price_history").fetchone()[0]
+    conn.executemany("INSERT INTO price_history (instrument_id, price, created_at) VALUES (?,?,?)", rows)
+    refresh_latest_prices_since(conn, first_id)
+    # Un precio con fecha pasada cambia el NAV de todos los que tienen el instrumento
+    invalidate_nav_snapshots(conn, min(r[2] for r in rows))
+    return len(rows)
 
-def insert_price_history(conn: sqlite3.Connection, investment_id: int, price: float):
-    from utils.format import now_iso
-    now = now_iso()
+def refresh_latest_prices_since(conn: sqlite3.Connection, after_id: int):
+    # Aplica a latest_price los puntos de price_history con id > after_id (en orden, gana el más reciente)
     conn.execute(
-        "INSERT INTO price_history (investment_id, price, created_at) VALUES (?,?,?)",
-        (investment_id, price, now),
+        """
+        INSERT INTO latest_price (instrument_id, price, created_at, price_history_id)
+        SELECT instrument_id, price, created_at, id FROM price_history WHERE id > ? ORDER BY id
+        ON CONFLICT(instrument_id) DO UPDATE SET
+            price=excluded.price, created_at=excluded.created_at, price_history_id=excluded.price_history_id
+        WHERE excluded.created_at > latest_price.created_at
+           OR (excluded.created_at = latest_price.created_at AND excluded.price_history_id > latest_price.price_history_id)
+        """,
+        (after_id,),
     )
 
-def get_last_price(conn: sqlite3.Connection, investment_id: int) -> Optional[float]:
+def count_positions_by_instrument(conn: sqlite3.Connection, instrument_ids: List[int]) -> int:
+    total = 0
+    for marks, chunk in _id_chunks(instrument_ids):
+        total += conn.execute(f"SELECT COUNT(*) FROM investments WHERE instrument_id IN ({marks})", chunk).fetchone()[0]
+    return total
+
+def get_last_price(conn: sqlite3.Connection, instrument_id: int) -> Optional[float]:
     row = conn.execute(
-        "SELECT price FROM price_history WHERE investment_id=? ORDER BY created_at DESC LIMIT 1",
-        (investment_id,),
+        "SELECT price FROM latest_price WHERE instrument_id=?",
+        (instrument_id,),
     ).fetchone()
     return row["price"] if row else None
 
+def get_last_prices(conn: sqlite3.Connection, instrument_ids: List[int]) -> Dict[int, float]:
+    prices: Dict[int, float] = {}
+    for marks, chunk in _id_chunks(instrument_ids):
+        for r in conn.execute(f"SELECT instrument_id, price FROM latest_price WHERE instrument_id IN ({marks})", chunk):
+            prices[r["instrument_id"]] = r["price"]
+    return prices
+
+# ==== Latest price (mantenimiento) ====
+
+_LATEST_FROM_HISTORY_SQL = """
+SELECT ph.instrument_id, ph.price, ph.created_at, ph.id AS price_history_id
+FROM price_history ph
+WHERE ph.id = (SELECT p2.id FROM price_history p2
+               WHERE p2.instrument_id = ph.instrument_id
+               ORDER BY p2.created_at DESC, p2.id DESC LIMIT 1)
+"""
+
+def backfill_latest_prices(conn: sqlite3.Connection) -> int:
+    # Reconstruye latest_price completo a partir de price_history
+    conn.execute("DELETE FROM latest_price")
+    cur = conn.execute(
+        "INSERT INTO latest_price (instrument_id, price, created_at, price_history_id) " + _LATEST_FROM_HISTORY_SQL
+    )
+    return cur.rowcount
+
+def check_latest_prices(conn: sqlite3.Connection) -> List[sqlite3.Row]:
+    # Instrumentos donde latest_price no coincide con el último punto de price_history
+    return conn.execute(
+        f"""
+        SELECT h.instrument_id, h.price_history_id AS expected_id, lp.price_history_id AS stored_id
+        FROM ({_LATEST_FROM_HISTORY_SQL}) h
+        LEFT JOIN latest_price lp ON lp.instrument_id = h.instrument_id
+        WHERE lp.price_history_id IS NOT h.price_history_id OR lp.price IS NOT h.price
+        UNION ALL
+        SELECT lp.instrument_id, NULL, lp.price_history_id
+        FROM latest_price lp
+        WHERE NOT EXISTS (SELECT 1 FROM price_history ph WHERE ph.instrument_id = lp.instrument_id)
+        """
+    ).fetchall()
+
+# ==== Valuation (batched) ====
+
+_VALUATION_SQL = """
+SELECT inv.id AS investment_id, inv.client_id, inv.company, inv.shares, inv.avg_price,
+       COALESCE(lp.price, inv.avg_price) AS current_price
+FROM investments inv
+LEFT JOIN latest_price lp ON lp.instrument_id = inv.instrument_id
+{where}
+ORDER BY inv.client_id, inv.created_at DESC
+"""
+
+def fetch_portfolio_valuation(conn: sqlite3.Connection, client_ids: Optional[List[int]] = None) -> List[sqlite3.Row]:
+    # Posiciones con su último precio en una sola consulta (lee latest_price, O(posiciones))
+    if client_ids is None:
+        return conn.execute(_VALUATION_SQL.format(where="")).fetchall()
+    rows: List[sqlite3.Row] = []
+    for marks, chunk in _id_chunks(client_ids):
+        rows.extend(conn.execute(_VALUATION_SQL.format(where=f"WHERE inv.client_id IN ({marks})"), chunk).fetchall())
+    return rows
+
+def fetch_market_values(conn: sqlite3.Connection, client_ids: List[int]) -> Dict[int, Tuple[float, int]]:
+    # {client_id: (valor de mercado, posiciones abiertas)} agregado en SQL, una consulta por bloque de IDs
+    result: Dict[int, Tuple[float, int]] = {}
+    for marks, chunk in _id_chunks(client_ids):
+        for r in conn.execute(
+            f"""
+            SELECT inv.client_id, SUM(inv.shares * COALESCE(lp.price, inv.avg_price)) AS market_value,
+                   COUNT(*) AS positions
+            FROM investments inv
+            LEFT JOIN latest_price lp ON lp.instrument_id = inv.instrument_id
+            WHERE inv.client_id IN ({marks}) AND inv.shares > 0
+            GROUP BY inv.client_id
+            """,
+            chunk,
+        ):
+            result[r["client_id"]] = (r["market_value"], r["positions"])
+    return result
+
+def fetch_portfolio_valuation_range(conn: sqlite3.Connection, first_id: int, last_id: int) -> List[sqlite3.Row]:
+    return conn.execute(_VALUATION_SQL.format(where="WHERE inv.client_id BETWEEN ? AND ?"), (first_id, last_id)).fetchall()
+
+# ==== Totales por cliente (reportes) ====
+# Por rango de IDs de cliente: los shards de reportes son rangos contiguos y usan los índices por client_id
+
+def fetch_cash_totals(conn: sqlite3.Connection, first_id: int, last_id: int,
+                      start_ts: Optional[int] = None, end_ts: Optional[int] = None) -> List[sqlite3.Row]:
+    sql = """
+        SELECT client_id,
+               SUM(CASE WHEN type='DEPOSIT' THEN amount ELSE 0 END) AS deposits,
+               SUM(CASE WHEN type='WITHDRAW' THEN amount ELSE 0 END) AS withdrawals,
+               COUNT(*) AS movements
+        FROM cash_movements
+        WHERE client_id BETWEEN ? AND ?
+    """
+    params = [first_id, last_id]
+    if start_ts is not None and end_ts is not None:
+        sql += " AND created_at >= ? AND created_at < ?"
+        params += [start_ts, end_ts]
+    return conn.execute(sql + " GROUP BY client_id", params).fetchall()
+
+def fetch_trade_totals(conn: sqlite3.Connection, first_id: int, last_id: int,
+                       start_ts: Optional[int] = None, end_ts: Optional[int] = None) -> List[sqlite3.Row]:
+    sql = """
+        SELECT inv.client_id,
+               SUM(CASE WHEN it.type='BUY' THEN it.amount ELSE 0 END) AS bought,
+               SUM(CASE WHEN it.type='SELL' THEN it.amount ELSE 0 END) AS sold,
+               SUM(CASE WHEN it.type IN ('BUY','SELL') THEN 1 ELSE 0 END) AS trades,
+               COALESCE(SUM(it.realized_pnl), 0) AS realized_pnl
+        FROM investments inv
+        JOIN investment_trades it ON it.investment_id = inv.id
+        WHERE inv.client_id BETWEEN ? AND ?
+    """
+    params = [first_id, last_id]
+    if start_ts is not None and end_ts is not None:
+        sql += " AND it.created_at >= ? AND it.created_at < ?"
+        params += [start_ts, end_ts]
+    return conn.execute(sql + " GROUP BY inv.client_id", params).fetchall()
+
+# ==== Lotes (services.lots) ====
+
+def get_open_lots(conn: sqlite3.Connection, investment_id: int) -> List[sqlite3.Row]:
+    # En orden de compra (FIFO); usa el índice parcial de lotes con saldo
+    return conn.execute(
+        "SELECT id, remaining, price, created_at FROM lots WHERE investment_id = ? AND remaining > 0 "
+        "ORDER BY created_at, id",
+        (investment_id,),
+    ).fetchall()
+
+def insert_lot(conn: sqlite3.Connection, investment_id: int, buy_trade_id: Optional[int], shares: float,
+               price: float, created_at: int) -> int:
+    cur = conn.execute(
+        "INSERT INTO lots (investment_id, buy_trade_id, shares, remaining, price, created_at) VALUES (?,?,?,?,?,?)",
+        (investment_id, buy_trade_id, shares, shares, price, created_at),
+    )
+    return cur.lastrowid
+
+def insert_lots_many(conn: sqlite3.Connection, rows: List[tuple]):
+    # rows: (id, investment_id, buy_trade_id, shares, remaining, price, created_at)
+    conn.executemany(
+        "INSERT INTO lots (id, investment_id, buy_trade_id, shares, remaining, price, created_at) VALUES (?,?,?,?,?,?,?)",
+        rows,
+    )
+
+def update_lots_remaining_many(conn: sqlite3.Connection, rows: List[Tuple[float, int]]):
+    # rows: (remaining, lot_id)
+    conn.executemany("UPDATE lots SET remaining = ? WHERE id = ?", rows)
+
+def insert_lot_matches_many(conn: sqlite3.Connection, rows: List[tuple]):
+    # rows: (sell_trade_id, lot_id, shares, cost, proceeds, realized_pnl)
+    conn.executemany(
+        "INSERT INTO lot_matches (sell_trade_id, lot_id, shares, cost, proceeds, realized_pnl) VALUES (?,?,?,?,?,?)",
+        rows,
+    )
+
+def update_sell_results_many(conn: sqlite3.Connection, rows: List[Tuple[float, Optional[str], int]]):
+    # rows: (realized_pnl, lot_method, trade_id)
+    conn.executemany("UPDATE investment_trades SET realized_pnl = ?, lot_method = ? WHERE id = ?", rows)
+
+def delete_lots(conn: sqlite3.Connection, investment_ids: Optional[List[int]] = None):
+    # Borra lotes, cruces y resultados realizados (de todas las posiciones o de las indicadas)
+    if investment_ids is None:
+        conn.execute("DELETE FROM lot_matches")
+        conn.execute("DELETE FROM lots")
+        conn.execute("UPDATE investment_trades SET realized_pnl = NULL WHERE realized_pnl IS NOT NULL")
+        return
+    for marks, chunk in _id_chunks(investment_ids):
+        conn.execute(f"DELETE FROM lot_matches WHERE lot_id IN (SELECT id FROM lots WHERE investment_id IN ({marks}))", chunk)
+        conn.execute(f"DELETE FROM lot_matches WHERE sell_trade_id IN "
+                     f"(SELECT id FROM investment_trades WHERE investment_id IN ({marks}))", chunk)
+        conn.execute(f"DELETE FROM lots WHERE investment_id IN ({marks})", chunk)
+        conn.execute(f"UPDATE investment_trades SET realized_pnl = NULL WHERE investment_id IN ({marks})", chunk)
+
+def iter_trades_for_lots(conn: sqlite3.Connection, investment_ids: Optional[List[int]] = None) -> Iterator[sqlite3.Row]:
+    # BUY/SELL por posición en orden cronológico (índice (investment_id, created_at))
+    sql = ("SELECT id, investment_id, type, shares, price, created_at, lot_method FROM investment_trades "
+           "WHERE type IN ('BUY','SELL') {where} ORDER BY investment_id, created_at, id")
+    if investment_ids is None:
+        yield from conn.execute(sql.format(where=""))
+        return
+    for marks, chunk in _id_chunks(sorted(investment_ids)):
+        yield from conn.execute(sql.format(where=f"AND investment_id IN ({marks})"), chunk)
+
+def get_trade_share_totals(conn: sqlite3.Connection, investment_ids: Optional[List[int]] = None) -> Dict[int, float]:
+    # {investment_id: acciones compradas - vendidas} según investment_trades
+    sql = ("SELECT investment_id, SUM(CASE type WHEN 'BUY' THEN shares WHEN 'SELL' THEN -shares ELSE 0 END) "
+           "FROM investment_trades {where} GROUP BY investment_id")
+    if investment_ids is None:
+        return {r[0]: r[1] or 0.0 for r in conn.execute(sql.format(where=""))}
+    totals: Dict[int, float] = {}
+    for marks, chunk in _id_chunks(investment_ids):
+        totals.update({r[0]: r[1] or 0.0 for r in conn.execute(sql.format(where=f"WHERE investment_id IN ({marks})"), chunk)})
+    return totals
+
+def fetch_realized_gains(conn: sqlite3.Connection, client_id: int, start_ts: Optional[int] = None,
+                         end_ts: Optional[int] = None) -> List[sqlite3.Row]:
+    sql = """
+        SELECT it.id, it.created_at, inv.company, it.shares, it.price, it.amount, it.realized_pnl
+        FROM investment_trades it
+        JOIN investments inv ON inv.id = it.investment_id
+        WHERE inv.client_id = ? AND it.type = 'SELL'
+    """
+    params: List[Any] = [client_id]
+    if start_ts is not None and end_ts is not None:
+        sql += " AND it.created_at >= ? AND it.created_at < ?"
+        params += [start_ts, end_ts]
+    return conn.execute(sql + " ORDER BY it.created_at, it.id", params).fetchall()
+
+# ==== Fotos diarias de NAV (services.snapshots) ====
+
+def fetch_ledger_range(conn: sqlite3.Connection, first_id: int, last_id: int,
+                       since_ts: Optional[int] = None) -> Iterator[sqlite3.Row]:
+    # Efectivo y operaciones de un rango de clientes en orden cronológico (desde since_ts si se indica)
+    cash_where = "client_id BETWEEN ? AND ?"
+    trade_where = "inv.client_id BETWEEN ? AND ?"
+    params: List[Any] = [first_id, last_id]
+    if since_ts is not None:
+        cash_where += " AND created_at >= ?"
+        trade_where += " AND it.created_at >= ?"
+        params.append(since_ts)
+    sql = f"""
+    SELECT {HISTORY_SRC_CASH} AS src, id, client_id, type, NULL AS investment_id, NULL AS instrument_id,
+           0 AS shares, 0 AS price, amount, created_at
+    FROM cash_movements
+    WHERE {cash_where}
+    UNION ALL
+    SELECT {HISTORY_SRC_TRADE} AS src, it.id, inv.client_id, it.type, it.investment_id, inv.instrument_id,
+           COALESCE(it.shares, 0), it.price, it.amount, it.created_at
+    FROM investment_trades it
+    JOIN investments inv ON inv.id = it.investment_id
+    WHERE {trade_where}
+    ORDER BY created_at, src, id
+    """
+    return iter(conn.execute(sql, params + params))
+
+def get_investments_in_range(conn: sqlite3.Connection, first_id: int, last_id: int) -> List[sqlite3.Row]:
+    return conn.execute(
+        "SELECT * FROM investments WHERE client_id BETWEEN ? AND ? ORDER BY id", (first_id, last_id)
+    ).fetchall()
+
+def get_prices_as_of(conn: sqlite3.Connection, ts: int) -> Dict[int, float]:
+    # Último precio de cada instrumento antes de ts (precio de cierre del día anterior)
+    # Con MAX() SQLite toma price de la misma fila; recorre solo el índice (instrument_id, created_at, price)
+    rows = conn.execute(
+        "SELECT instrument_id, price, MAX(created_at) FROM price_history WHERE created_at < ? GROUP BY instrument_id",
+        (ts,),
+    )
+    return {r["instrument_id"]: r["price"] for r in rows}
+
+def iter_price_points(conn: sqlite3.Connection, start_ts: int, end_ts: int) -> Iterator[sqlite3.Row]:
+    return iter(conn.execute(
+        "SELECT instrument_id, price, created_at FROM price_history "
+        "WHERE created_at >= ? AND created_at < ? ORDER BY created_at, id",
+        (start_ts, end_ts),
+    ))
+
+# MAX(day) por cliente como subconsulta: una búsqueda en la clave (client_id, day), no un recorrido de todas las fotos
+_LAST_NAV_DAY = "(SELECT MAX(day) FROM nav_snapshots s WHERE s.client_id = c.id)"
+
+def get_last_nav_days(conn: sqlite3.Connection) -> Dict[int, str]:
+    return {r[0]: r[1] for r in conn.execute(f"SELECT c.id, {_LAST_NAV_DAY} AS day FROM clients c") if r[1]}
+
+def get_last_nav_state(conn: sqlite3.Connection, first_id: int, last_id: int) -> Dict[int, Dict[str, Any]]:
+    # Última foto de cada cliente del rango: {client_id: {"day", "cash", "shares": {investment_id: shares}}}
+    latest = f"SELECT c.id AS client_id, {_LAST_NAV_DAY} AS day FROM clients c WHERE c.id BETWEEN ? AND ?"
+    state: Dict[int, Dict[str, Any]] = {}
+    for r in conn.execute(f"SELECT s.client_id, s.day, s.cash FROM nav_snapshots s JOIN ({latest}) l "
+                          "ON l.client_id = s.client_id AND l.day = s.day", (first_id, last_id)):
+        state[r["client_id"]] = {"day": r["day"], "cash": r["cash"], "shares": {}}
+    for r in conn.execute(f"SELECT p.client_id, p.investment_id, p.shares FROM nav_snapshot_positions p JOIN ({latest}) l "
+                          "ON l.client_id = p.client_id AND l.day = p.day", (first_id, last_id)):
+        state[r["client_id"]]["shares"][r["investment_id"]] = r["shares"]
+    return state
+
+def insert_nav_snapshots_many(conn: sqlite3.Connection, snapshots: List[tuple], positions: List[tuple]):
+    # snapshots: (client_id, day, cash, market_value, nav, net_flow)
+    # positions: (client_id, day, investment_id, shares, price, value)
+    conn.executemany(
+        "INSERT INTO nav_snapshots (client_id, day, cash, market_value, nav, net_flow) VALUES (?,?,?,?,?,?)",
+        snapshots,
+    )
+    conn.executemany(
+        "INSERT INTO nav_snapshot_positions (client_id, day, investment_id, shares, price, value) VALUES (?,?,?,?,?,?)",
+        positions,
+    )
+
+def delete_nav_snapshots(conn: sqlite3.Connection, from_day: str, client_ids: Optional[List[int]] = None):
+    # Borra las fotos desde from_day (inclusive); la próxima corrida las recalcula desde la anterior
+    if client_ids is None:
+        conn.execute("DELETE FROM nav_snapshot_positions WHERE day >= ?", (from_day,))
+        conn.execute("DELETE FROM nav_snapshots WHERE day >= ?", (from_day,))
+        return
+    for marks, chunk in _id_chunks(client_ids):
+        conn.execute(f"DELETE FROM nav_snapshot_positions WHERE day >= ? AND client_id IN ({marks})", (from_day, *chunk))
+        conn.execute(f"DELETE FROM nav_snapshots WHERE day >= ? AND client_id IN ({marks})", (from_day, *chunk))
+
+def invalidate_nav_snapshots(conn: sqlite3.Connection, since_ts: int, client_ids: Optional[List[int]] = None,
+                             investment_ids: Optional[List[int]] = None, instrument_id: Optional[int] = None):
+    # Escrituras con fecha pasada (importaciones, precios de cierre) o del día de una foto ya tomada dejan
+    # viejas las fotos desde ese día. Sin client_ids, investment_ids ni instrument_id afecta a todos.
+    from utils.format import day_of
+    day = day_of(since_ts)
+    if not conn.execute("SELECT EXISTS (SELECT 1 FROM nav_snapshots WHERE day >= ?)", (day,)).fetchone()[0]:
+        return
+    if investment_ids is not None:
+        client_ids = [r["client_id"] for r in get_investments_by_ids(conn, investment_ids)]
+    elif instrument_id is not None:
+        client_ids = [r[0] for r in conn.execute(
+            "SELECT DISTINCT client_id FROM investments WHERE instrument_id = ?", (instrument_id,))]
+    delete_nav_snapshots(conn, day, client_ids)
+
+def get_nav_series(conn: sqlite3.Connection, client_id: int, date_from: Optional[str] = None,
+                   date_to: Optional[str] = None) -> List[sqlite3.Row]:
+    sql = "SELECT day, cash, market_value, nav, net_flow FROM nav_snapshots WHERE client_id = ?"
+    params: List[Any] = [client_id]
+    if date_from:
+        sql += " AND day >= ?"
+        params.append(date_from)
+    if date_to:
+        sql += " AND day <= ?"
+        params.append(date_to)
+    return conn.execute(sql + " ORDER BY day", params).fetchall()
+
+def iter_nav_range(conn: sqlite3.Connection, first_id: int, last_id: int, date_from: str,
+                   date_to: str) -> Iterator[sqlite3.Row]:
+    # Fotos de un rango de clientes entre date_from y date_to (inclusive), por cliente y día (recorre la clave)
+    return iter(conn.execute(
+        "SELECT client_id, day, nav, net_flow FROM nav_snapshots "
+        "WHERE client_id BETWEEN ? AND ? AND day >= ? AND day <= ? ORDER BY client_id, day",
+        (first_id, last_id, date_from, date_to),
+    ))
+
+def get_nav_positions(conn: sqlite3.Connection, client_id: int, day: str) -> List[sqlite3.Row]:
+    return conn.execute(
+        """
+        SELECT p.investment_id, inv.company, p.shares, p.price, p.value
+        FROM nav_snapshot_positions p
+        JOIN investments inv ON inv.id = p.investment_id
+        WHERE p.client_id = ? AND p.day = ?
+        ORDER BY p.value DESC
+        """,
+        (client_id, day),
+    ).fetchall()
+
 # ==== History queries (raw) ====
 
-def fetch_cash_movements(conn: sqlite3.Connection, client_id: int, start_iso: Optional[str], end_iso: Optional[str]) -> List[sqlite3.Row]:
+# Rangos de fecha: [start_ts, end_ts) en microsegundos desde epoch
+
+def fetch_cash_movements(conn: sqlite3.Connection, client_id: int, start_ts: Optional[int], end_ts: Optional[int]) -> List[sqlite3.Row]:
     base = "SELECT id, type, amount, note, created_at FROM cash_movements WHERE client_id=?"
     params = [client_id]
-    if start_iso and end_iso:
-        base += " AND created_at BETWEEN ? AND ?"
-        params += [start_iso, end_iso]
-    return conn.execute(base + " ORDER BY created_at DESC", tuple(params)).fetchall()
+    if start_ts is not None and end_ts is not None:
+        base += " AND created_at >= ? AND created_at < ?"
+        params += [start_ts, end_ts]
+    return conn.execute(base + " ORDER BY created_at DESC, id DESC", tuple(params)).fetchall()
 
-def fetch_trades_with_company(conn: sqlite3.Connection, client_id: int, start_iso: Optional[str], end_iso: Optional[str]) -> List[sqlite3.Row]:
+def fetch_trades_with_company(conn: sqlite3.Connection, client_id: int, start_ts: Optional[int], end_ts: Optional[int]) -> List[sqlite3.Row]:
     base = """
     SELECT it.id, it.type, it.shares, it.price, it.amount, it.created_at, it.note,
            inv.company, inv.id as investment_id
@@ -113,8 +677,81 @@ def fetch_trades_with_company(conn: sqlite3.Connection, client_id: int, start_is
     WHERE inv.client_id=?
     """
     params = [client_id]
-    if start_iso and end_iso:
-        base += " AND it.created_at BETWEEN ? AND ?"
-        params += [start_iso, end_iso]
-    base += " ORDER BY it.created_at DESC"
+    if start_ts is not None and end_ts is not None:
+        base += " AND it.created_at >= ? AND it.created_at < ?"
+        params += [start_ts, end_ts]
+    base += " ORDER BY it.created_at DESC, it.id DESC"
     return conn.execute(base, tuple(params)).fetchall()
+
+# Historial unificado: efectivo (src=0) y operaciones (src=1) mezclados en SQL,
+# orden (created_at, src, id) descendente. El cursor es esa misma clave.
+HISTORY_SRC_CASH = 0
+HISTORY_SRC_TRADE = 1
+
+# Ordenamientos del historial resueltos en SQL: clave -> (expresión en efectivo, expresión en operaciones).
+# Se desempata siempre por (created_at, src, id), así el cursor de página es único.
+HISTORY_SORTS = {
+    "tipo_general": ("'EFECTIVO'", "CASE WHEN it.type IN ('BUY','SELL') THEN 'INVERSIÓN' ELSE 'PRECIO' END"),
+    "tipo": ("type", "it.type"),
+    "empresa": ("''", "inv.company"),
+    "monto": ("CASE type WHEN 'DEPOSIT' THEN amount ELSE -amount END",
+              "CASE it.type WHEN 'SELL' THEN it.amount WHEN 'BUY' THEN -it.amount ELSE 0 END"),
+    "shares": ("0", "COALESCE(it.shares, 0)"),
+    "price": ("0", "it.price"),
+}
+
+def iter_client_history(conn: sqlite3.Connection, client_id: int, start_ts: Optional[int], end_ts: Optional[int],
+                        before: Optional[tuple] = None, limit: Optional[int] = None,
+                        after: Optional[Tuple[int, int, int]] = None,
+                        sort: Optional[str] = None, descending: bool = True) -> Iterator[sqlite3.Row]:
+    # Orden por defecto: created_at DESC. before: página siguiente (cursor de la última fila vista:
+    # (created_at, src, id), o (sort_key, created_at, src, id) con sort); after: solo las más nuevas
+    # que el cursor (orden por defecto).
+    cash_where = ["client_id=?"]
+    trade_where = ["inv.client_id=?"]
+    cash_params: List[Any] = [client_id]
+    trade_params: List[Any] = [client_id]
+    cash_key, trade_key = HISTORY_SORTS[sort] if sort else ("created_at", "it.created_at")
+    op = "<" if descending else ">"
+    if start_ts is not None and end_ts is not None:
+        cash_where.append("created_at >= ? AND created_at < ?")
+        trade_where.append("it.created_at >= ? AND it.created_at < ?")
+        cash_params += [start_ts, end_ts]
+        trade_params += [start_ts, end_ts]
+    if before and not sort:
+        # El límite simple sobre created_at deja que el índice (client_id, created_at) acote el rango
+        bound = "<=" if descending else ">="
+        cash_where.append(f"created_at {bound} ? AND (created_at, {HISTORY_SRC_CASH}, id) {op} (?, ?, ?)")
+        trade_where.append(f"it.created_at {bound} ? AND (it.created_at, {HISTORY_SRC_TRADE}, it.id) {op} (?, ?, ?)")
+        cash_params += [before[0], *before]
+        trade_params += [before[0], *before]
+    elif before:
+        cash_where.append(f"({cash_key}, created_at, {HISTORY_SRC_CASH}, id) {op} (?, ?, ?, ?)")
+        trade_where.append(f"({trade_key}, it.created_at, {HISTORY_SRC_TRADE}, it.id) {op} (?, ?, ?, ?)")
+        cash_params += list(before)
+        trade_params += list(before)
+    if after:
+        cash_where.append(f"created_at >= ? AND (created_at, {HISTORY_SRC_CASH}, id) > (?, ?, ?)")
+        trade_where.append(f"it.created_at >= ? AND (it.created_at, {HISTORY_SRC_TRADE}, it.id) > (?, ?, ?)")
+        cash_params += [after[0], *after]
+        trade_params += [after[0], *after]
+    d = "DESC" if descending else "ASC"
+    sql = f"""
+    SELECT {HISTORY_SRC_CASH} AS src, id, type, NULL AS shares, NULL AS price, amount, created_at, note,
+           NULL AS company, NULL AS investment_id, {cash_key} AS sort_key
+    FROM cash_movements
+    WHERE {" AND ".join(cash_where)}
+    UNION ALL
+    SELECT {HISTORY_SRC_TRADE} AS src, it.id, it.type, it.shares, it.price, it.amount, it.created_at, it.note,
+           inv.company, inv.id AS investment_id, {trade_key} AS sort_key
+    FROM investment_trades it
+    JOIN investments inv ON inv.id = it.investment_id
+    WHERE {" AND ".join(trade_where)}
+    ORDER BY {"sort_key " + d + ", " if sort else ""}created_at {d}, src {d}, id {d}
+    """
+    params = cash_params + trade_params
+    if limit:
+        sql += " LIMIT ?"
+        params.append(limit)
+    # Se itera el cursor directamente: las filas se leen a medida que se consumen
+    return iter(conn.execute(sql, tuple(params)))
@@ -1,3 +1,4 @@
+-- Esquema base (user_version = 1). No editar: los cambios posteriores son pasos en data/migrations.py
 PRAGMA foreign_keys = ON;
 
 CREATE TABLE IF NOT EXISTS clients (
@@ -9,9 +10,17 @@ CREATE TABLE IF NOT EXISTS clients (
   capital_available REAL NOT NULL DEFAULT 0.0
 );
 
+-- Instrumento (ticker) dueño de la serie de precios, compartido por todos los clientes
+CREATE TABLE IF NOT EXISTS instruments (
+  id INTEGER PRIMARY KEY,
+  symbol TEXT NOT NULL UNIQUE,
+  created_at TEXT
+);
+
 CREATE TABLE IF NOT EXISTS investments (
   id INTEGER PRIMARY KEY,
   client_id INTEGER NOT NULL REFERENCES clients(id) ON DELETE CASCADE,
+  instrument_id INTEGER REFERENCES instruments(id),
   company TEXT NOT NULL,
   avg_price REAL NOT NULL DEFAULT 0,
   shares REAL NOT NULL DEFAULT 0,
@@ -40,11 +49,21 @@ CREATE TABLE IF NOT EXISTS investment_trades (
 
 CREATE TABLE IF NOT EXISTS price_history (
   id INTEGER PRIMARY KEY,
-  investment_id INTEGER NOT NULL REFERENCES investments(id) ON DELETE CASCADE,
+  instrument_id INTEGER NOT NULL REFERENCES instruments(id) ON DELETE CASCADE,
   price REAL NOT NULL,
   created_at TEXT
 );
 
+-- Último precio por instrumento, mantenido en la misma transacción que price_history
+CREATE TABLE IF NOT EXISTS latest_price (
+  instrument_id INTEGER PRIMARY KEY REFERENCES instruments(id) ON DELETE CASCADE,
+  price REAL NOT NULL,
+  created_at TEXT,
+  price_history_id INTEGER
+);
+
 CREATE INDEX IF NOT EXISTS idx_cash_movements_client_date ON cash_movements(client_id, created_at);
 CREATE INDEX IF NOT EXISTS idx_trades_investment_date ON investment_trades(investment_id, created_at);
 CREATE INDEX IF NOT EXISTS idx_investments_client ON investments(client_id);
+CREATE INDEX IF NOT EXISTS idx_investments_instrument ON investments(instrument_id);
+CREATE INDEX IF NOT EXISTS idx_price_history_instrument_date ON price_history(instrument_id, created_at);
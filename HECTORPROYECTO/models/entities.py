@@ -7,14 +7,21 @@ class Client:
     name: str
     email: Optional[str]
     phone: Optional[str]
-    created_at: str
+    created_at: int
     capital_available: float
 
+@dataclass
+class Instrument:
+    id: int
+    symbol: str
+    created_at: int
+
 @dataclass
 class Investment:
     id: int
     client_id: int
+    instrument_id: Optional[int]
     company: str
     avg_price: float
     shares: float
-    created_at: str
+    created_at: int
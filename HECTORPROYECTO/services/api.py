@@ -0,0 +1,324 @@
+import json
+import re
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Optional, List, Dict, Any, Callable, Tuple
+from urllib.parse import urlsplit, parse_qs
+from data import repositorios as repo
+from data.db import ConnectionManager, ensure_schema_and_seed
+from services.portfolio import PortfolioService
+from services.worker import DbWorker
+from utils.tracing import new_stat, add_sample, summarize
+
+# API HTTP/JSON local (solo stdlib). Lecturas: en el hilo de cada request con una conexión
+# del pool de solo lectura. Escrituras: se encolan al hilo escritor único de DbWorker.
+DEFAULT_PORT = 8765
+MAX_PAGE = 500
+WRITE_TIMEOUT = 30.0
+
+class ApiError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+# ---- Cursores de paginación (opacos para el cliente: "a.b.c") ----
+
+def _encode_cursor(cursor: Optional[tuple]) -> Optional[str]:
+    return ".".join(str(v) for v in cursor) if cursor else None
+
+def _decode_cursor(s: Optional[str], size: int) -> Optional[tuple]:
+    if not s:
+        return None
+    try:
+        parts = tuple(int(v) for v in s.split("."))
+    except ValueError:
+        raise ApiError(400, "Cursor inválido")
+    if len(parts) != size:
+        raise ApiError(400, "Cursor inválido")
+    return parts
+
+def _limit(query: Dict[str, str], default: int = 50) -> int:
+    try:
+        return max(1, min(MAX_PAGE, int(query.get("limit", default))))
+    except ValueError:
+        raise ApiError(400, "limit inválido")
+
+def _number(body: Dict[str, Any], key: str) -> float:
+    try:
+        return float(body[key])
+    except KeyError:
+        raise ApiError(400, f"Falta '{key}'")
+    except (TypeError, ValueError):
+        raise ApiError(400, f"'{key}' debe ser numérico")
+
+# ---- Handlers: (servidor, match, query, body) -> (status, payload) ----
+
+def _client_or_404(conn, client_id: int):
+    client = repo.get_client(conn, client_id)
+    if not client:
+        raise ApiError(404, "Cliente no existe")
+    return dict(client)
+
+def get_clients(api, m, query, body):
+    limit = _limit(query)
+    with api.db.reader() as conn:
+        rows = [dict(r) for r in repo.list_clients_page(conn, query.get("q"),
+                                                         _decode_cursor(query.get("cursor"), 2), limit)]
+    nxt = _encode_cursor((rows[-1]["created_at"], rows[-1]["id"])) if len(rows) == limit else None
+    return 200, {"items": rows, "next_cursor": nxt}
+
+def get_client(api, m, query, body):
+    with api.db.reader() as conn:
+        return 200, _client_or_404(conn, int(m["id"]))
+
+def post_client(api, m, query, body):
+    name = (body.get("name") or "").strip()
+    if not name:
+        raise ApiError(400, "El nombre es obligatorio")
+    capital = _number(body, "initial_capital") if "initial_capital" in body else 0.0
+    client_id = api.write(lambda svc: svc.create_client(name, body.get("email"), body.get("phone"), capital))
+    return 201, {"id": client_id}
+
+def get_portfolio(api, m, query, body):
+    client_id = int(m["id"])
+    with api.db.reader() as conn:
+        client = _client_or_404(conn, client_id)
+        positions = PortfolioService(conn).get_client_portfolio(client_id)
+    invested = sum(p["current_value"] for p in positions)
+    return 200, {"client_id": client_id, "capital_available": client["capital_available"],
+                 "invested": invested, "equity": client["capital_available"] + invested, "positions": positions}
+
+def get_history(api, m, query, body):
+    client_id = int(m["id"])
+    limit = _limit(query, 200)
+    try:
+        with api.db.reader() as conn:
+            _client_or_404(conn, client_id)
+            page, nxt = PortfolioService(conn).get_client_history_page(
+                client_id, query.get("day"), query.get("from"), query.get("to"),
+                _decode_cursor(query.get("cursor"), 3), limit)
+    except ValueError as e:  # fechas mal formadas
+        raise ApiError(400, str(e))
+    for r in page:
+        r.pop("cursor", None)
+    return 200, {"items": page, "next_cursor": _encode_cursor(nxt)}
+
+def get_nav(api, m, query, body):
+    client_id = int(m["id"])
+    try:
+        with api.db.reader() as conn:
+            _client_or_404(conn, client_id)
+            rows = PortfolioService(conn).get_nav_series(client_id, query.get("from"), query.get("to"))
+    except ValueError as e:
+        raise ApiError(400, str(e))
+    return 200, {"client_id": client_id, "items": rows}
+
+def get_returns(api, m, query, body):
+    client_id = int(m["id"])
+    if not query.get("from") or not query.get("to"):
+        raise ApiError(400, "Faltan 'from' y 'to'")
+    try:
+        with api.db.reader() as conn:
+            _client_or_404(conn, client_id)
+            result = PortfolioService(conn).get_client_returns(client_id, query["from"], query["to"])
+    except ValueError as e:
+        raise ApiError(400, str(e))
+    if result is None:
+        raise ApiError(404, "Sin fotos de NAV en el período (python -m services.snapshots)")
+    return 200, result
+
+def get_realized(api, m, query, body):
+    client_id = int(m["id"])
+    try:
+        with api.db.reader() as conn:
+            _client_or_404(conn, client_id)
+            rows = PortfolioService(conn).get_realized_gains(client_id, query.get("day"), query.get("from"),
+                                                             query.get("to"))
+    except ValueError as e:
+        raise ApiError(400, str(e))
+    return 200, {"client_id": client_id, "items": rows,
+                 "realized_pnl": sum(r["realized_pnl"] or 0.0 for r in rows)}
+
+def _capital_after(api, client_id: int) -> Dict[str, Any]:
+    with api.db.reader() as conn:
+        return {"client_id": client_id, "capital_available": _client_or_404(conn, client_id)["capital_available"]}
+
+def post_cash(kind: str):
+    def handler(api, m, query, body):
+        client_id = int(m["id"])
+        amount = _number(body, "amount")
+        api.write(lambda svc: getattr(svc, kind)(client_id, amount, body.get("note")))
+        return 200, _capital_after(api, client_id)
+    return handler
+
+def post_buy(api, m, query, body):
+    client_id = int(m["id"])
+    company = (body.get("company") or "").strip()
+    if not company:
+        raise ApiError(400, "Falta 'company'")
+    amount, price = _number(body, "amount"), _number(body, "price")
+    api.write(lambda svc: svc.buy(client_id, company, amount, price, body.get("note")))
+    return 200, _capital_after(api, client_id)
+
+def post_sell(api, m, query, body):
+    client_id = int(m["id"])
+    price = _number(body, "price")
+    def write(svc):
+        inv = repo.get_investment_by_company(svc.conn, client_id, body.get("company") or "")
+        if not inv:
+            raise ApiError(404, "Posición no existe")
+        shares = inv["shares"] if body.get("shares") == "all" else _number(body, "shares")
+        svc.sell(inv["id"], shares, price, body.get("note"), body.get("method"))
+    api.write(write)
+    return 200, _capital_after(api, client_id)
+
+def post_price(api, m, query, body):
+    company = (body.get("company") or "").strip()
+    price = _number(body, "price")
+    api.write(lambda svc: svc.update_company_price(company, price))
+    return 200, {"company": company, "price": price}
+
+def get_metrics(api, m, query, body):
+    return 200, api.metrics_snapshot()
+
+def get_health(api, m, query, body):
+    return 200, {"ok": True}
+
+# (método, plantilla, handler); {id} es un entero. La plantilla es también la clave de /metrics.
+ROUTES: List[Tuple[str, str, "re.Pattern", Callable]] = [
+    (method, template, re.compile("^" + template.replace("{id}", r"(?P<id>\d+)") + "$"), fn)
+    for method, template, fn in (
+        ("GET", "/health", get_health),
+        ("GET", "/metrics", get_metrics),
+        ("GET", "/clients", get_clients),
+        ("POST", "/clients", post_client),
+        ("GET", "/clients/{id}", get_client),
+        ("GET", "/clients/{id}/portfolio", get_portfolio),
+        ("GET", "/clients/{id}/history", get_history),
+        ("GET", "/clients/{id}/nav", get_nav),
+        ("GET", "/clients/{id}/returns", get_returns),
+        ("GET", "/clients/{id}/realized", get_realized),
+        ("POST", "/clients/{id}/deposit", post_cash("deposit")),
+        ("POST", "/clients/{id}/withdraw", post_cash("withdraw")),
+        ("POST", "/clients/{id}/buy", post_buy),
+        ("POST", "/clients/{id}/sell", post_sell),
+        ("POST", "/prices", post_price),
+    )
+]
+
+class ApiServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, db: ConnectionManager, worker: DbWorker):
+        super().__init__(address, ApiHandler)
+        self.db = db
+        self.worker = worker
+        self._metrics_lock = threading.Lock()
+        self._metrics: Dict[str, Dict[str, Any]] = {}
+
+    def write(self, fn: Callable[..., Any]):
+        # Serializa en el hilo escritor; el request espera el resultado (o la excepción). Si vence la
+        # espera, una escritura todavía en cola se cancela (503: no se aplicó, se puede reintentar);
+        # una que ya corre no se puede cortar (504: puede aplicarse igual, consultar antes de reintentar)
+        future = self.worker.submit_write(fn)
+        try:
+            return future.result(timeout=WRITE_TIMEOUT)
+        except TimeoutError:
+            if future.cancel():
+                raise ApiError(503, "Escritura cancelada por demora: no se aplicó, se puede reintentar")
+            if future.done():  # terminó justo al vencer la espera
+                return future.result()
+            raise ApiError(504, "La escritura sigue en curso y puede aplicarse: consultar antes de reintentar")
+
+    def record(self, route: str, ms: float):
+        with self._metrics_lock:
+            add_sample(self._metrics.setdefault(route, new_stat()), ms)
+
+    def metrics_snapshot(self) -> Dict[str, Any]:
+        with self._metrics_lock:
+            return {"routes": summarize(self._metrics)}
+
+class ApiHandler(BaseHTTPRequestHandler):
+    server: ApiServer
+    protocol_version = "HTTP/1.1"
+
+    def _dispatch(self, method: str):
+        started = time.perf_counter()
+        parts = urlsplit(self.path)
+        route = f"{method} ?"
+        try:
+            query = {k: v[-1] for k, v in parse_qs(parts.query).items()}
+            body: Dict[str, Any] = {}
+            length = int(self.headers.get("Content-Length") or 0)
+            if length:
+                try:
+                    body = json.loads(self.rfile.read(length))
+                except ValueError:
+                    raise ApiError(400, "JSON inválido")
+                if not isinstance(body, dict):
+                    raise ApiError(400, "Se esperaba un objeto JSON")
+            path = parts.path.rstrip("/") or "/"
+            for m_, template, pattern, fn in ROUTES:
+                match = pattern.match(path) if m_ == method else None
+                if match:
+                    route = f"{method} {template}"
+                    status, payload = fn(self.server, match, query, body)
+                    break
+            else:
+                raise ApiError(404, "Ruta no encontrada")
+        except ApiError as e:
+            status, payload = e.status, {"error": str(e)}
+        except ValueError as e:
+            # Validaciones del servicio (fondos insuficientes, montos <= 0, ...)
+            status, payload = 400, {"error": str(e)}
+        except Exception as e:
+            status, payload = 500, {"error": f"{type(e).__name__}: {e}"}
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+        self.server.record(route, (time.perf_counter() - started) * 1000)
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def log_message(self, format, *args):
+        pass  # las métricas están en /metrics
+
+def serve(db_path: Optional[str] = None, host: str = "127.0.0.1", port: int = DEFAULT_PORT,
+          readers: int = 8) -> ApiServer:
+    # Devuelve el servidor listo; serve_forever() lo deja atendiendo (ver main)
+    db = ConnectionManager(db_path, readers=readers)
+    with db.writer() as conn:
+        ensure_schema_and_seed(conn)
+    return ApiServer((host, port), db, DbWorker(db, readers=1))
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import argparse
+    p = argparse.ArgumentParser(description="API HTTP/JSON local sobre PortfolioService")
+    p.add_argument("--db", default=None, help="Ruta de la base (por defecto investments.db)")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=DEFAULT_PORT)
+    p.add_argument("--readers", type=int, default=8, help="Conexiones de solo lectura en el pool")
+    args = p.parse_args(argv)
+
+    server = serve(args.db, args.host, args.port, args.readers)
+    print(f"Escuchando en http://{args.host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.worker.shutdown(wait=True)
+        server.db.close()
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,98 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, Any, Dict, Optional, Iterable
+
+# Caché en proceso delante de data.repositorios. Claves:
+#   ("client", client_id)        -> fila del cliente (dict) o None
+#   ("positions", client_id)     -> inversiones del cliente sin valuar (lista de dicts)
+#   ("price", instrument_id)     -> último precio o None
+# Los precios se guardan aparte de las posiciones: un cambio de precio invalida una sola
+# entrada y no las carteras de todos los clientes que tienen ese instrumento.
+# La invalidación la hacen los métodos de escritura de PortfolioService después del COMMIT;
+# escrituras por fuera (importadores, reprecio en bloque, otro proceso) requieren clear().
+DEFAULT_MAX_ENTRIES = 5000
+
+class PortfolioCache:
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.max_entries = max(1, max_entries)
+        self._data: "OrderedDict[tuple, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Se incrementa en cada invalidación: una carga que empezó antes no guarda su resultado
+        self._epoch = 0
+        self.hits: Dict[str, int] = {}
+        self.misses: Dict[str, int] = {}
+        self.evictions = 0
+
+    def get_or_load(self, key: tuple, loader: Callable[[], Any]) -> Any:
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits[key[0]] = self.hits.get(key[0], 0) + 1
+                return self._data[key]
+            self.misses[key[0]] = self.misses.get(key[0], 0) + 1
+            epoch = self._epoch
+        value = loader()
+        with self._lock:
+            if epoch == self._epoch:
+                self._store(key, value)
+        return value
+
+    def get_many(self, kind: str, ids: Iterable[int], loader: Callable[[list], Dict[int, Any]]) -> Dict[int, Any]:
+        # Como get_or_load para varias claves del mismo tipo; loader(ids_faltantes) -> {id: valor}
+        result: Dict[int, Any] = {}
+        missing = []
+        with self._lock:
+            for i in ids:
+                key = (kind, i)
+                if key in self._data:
+                    self._data.move_to_end(key)
+                    result[i] = self._data[key]
+                else:
+                    missing.append(i)
+            self.hits[kind] = self.hits.get(kind, 0) + len(result)
+            self.misses[kind] = self.misses.get(kind, 0) + len(missing)
+            epoch = self._epoch
+        if missing:
+            loaded = loader(missing)
+            with self._lock:
+                for i in missing:
+                    result[i] = loaded.get(i)
+                    if epoch == self._epoch:
+                        self._store((kind, i), result[i])
+        return result
+
+    def _store(self, key: tuple, value: Any):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, *keys: tuple):
+        with self._lock:
+            self._epoch += 1
+            for key in keys:
+                self._data.pop(key, None)
+
+    def invalidate_client(self, client_id: int, positions: bool = False):
+        keys = [("client", client_id)]
+        if positions:
+            keys.append(("positions", client_id))
+        self.invalidate(*keys)
+
+    def invalidate_price(self, instrument_id: int):
+        self.invalidate(("price", instrument_id))
+
+    def clear(self):
+        with self._lock:
+            self._epoch += 1
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            kinds = sorted(set(self.hits) | set(self.misses))
+            return {
+                "entries": len(self._data), "max_entries": self.max_entries, "evictions": self.evictions,
+                "hits": {k: self.hits.get(k, 0) for k in kinds},
+                "misses": {k: self.misses.get(k, 0) for k in kinds},
+            }
@@ -0,0 +1,53 @@
+import sqlite3
+from typing import Optional, List, Iterator, Dict, Any
+from data import repositorios as repo
+from services.portfolio import PortfolioService
+from utils.exports import export_history_csv
+
+def _compress_for(path: str, compress: Optional[bool]) -> bool:
+    return path.endswith(".gz") if compress is None else compress
+
+def export_client_history(conn: sqlite3.Connection, path: str, client_id: int, day: Optional[str] = None,
+                          date_from: Optional[str] = None, date_to: Optional[str] = None,
+                          compress: Optional[bool] = None) -> int:
+    # Escribe en streaming desde el cursor; nunca arma la lista completa
+    rows = PortfolioService(conn).iter_client_history(client_id, day, date_from, date_to)
+    return export_history_csv(path, rows, _compress_for(path, compress))
+
+def iter_all_history(conn: sqlite3.Connection) -> Iterator[Dict[str, Any]]:
+    # Cliente por cliente (usa los índices por client_id), cada fila etiquetada con su cliente
+    svc = PortfolioService(conn)
+    for client_id in repo.list_client_ids(conn):
+        for row in svc.iter_client_history(client_id):
+            row["client_id"] = client_id
+            yield row
+
+def export_all_history(conn: sqlite3.Connection, path: str, compress: Optional[bool] = None) -> int:
+    return export_history_csv(path, iter_all_history(conn), _compress_for(path, compress), extra_fields=("client_id",))
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import argparse
+    import time
+    from data.db import get_connection, ensure_schema_and_seed
+    p = argparse.ArgumentParser(description="Exporta historial a CSV en streaming (un cliente o todos)")
+    p.add_argument("out", help="Archivo destino (.csv o .csv.gz)")
+    p.add_argument("--db", default=None, help="Ruta de la base (por defecto investments.db)")
+    p.add_argument("--client", type=int, default=None, help="ID de cliente; sin él se exportan todos")
+    p.add_argument("--day", default=None, help="Día YYYY-MM-DD")
+    p.add_argument("--from", dest="date_from", default=None, help="Desde YYYY-MM-DD")
+    p.add_argument("--to", dest="date_to", default=None, help="Hasta YYYY-MM-DD")
+    p.add_argument("--gzip", action="store_true", default=None, help="Comprimir (por defecto según extensión .gz)")
+    args = p.parse_args(argv)
+
+    conn = get_connection(args.db)
+    ensure_schema_and_seed(conn)
+    started = time.perf_counter()
+    if args.client is not None:
+        n = export_client_history(conn, args.out, args.client, args.day, args.date_from, args.date_to, args.gzip)
+    else:
+        n = export_all_history(conn, args.out, args.gzip)
+    print(f"Exportadas {n} filas a {args.out} en {time.perf_counter() - started:.2f}s")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,237 @@
+import csv
+import sqlite3
+import time
+from typing import Iterable, Iterator, Optional, Tuple, Dict, Any, List
+from data import repositorios as repo
+from services.lots import rebuild_lots
+from utils.format import now_ts
+from utils.validation import parse_float_or_none, parse_timestamp
+
+# Filas por sentencia executemany al aplicar una importación
+CHUNK_SIZE = 10_000
+
+OPERATION_TYPES = ("DEPOSIT", "WITHDRAW", "BUY", "SELL")
+
+def read_trade_file(path: str) -> Iterator[Tuple[int, Dict[str, str]]]:
+    # CSV con encabezado type,client_id,company,amount,shares,price,note,timestamp
+    with open(path, "r", newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        for r in reader:
+            yield reader.line_num, r
+
+def _parse_row(line: int, r: Dict[str, str], default_ts: str, errors: List[Tuple[int, str]]) -> Optional[tuple]:
+    def err(msg):
+        errors.append((line, msg))
+        return None
+
+    op = (r.get("type") or "").strip().upper()
+    if op not in OPERATION_TYPES:
+        return err(f"tipo inválido '{r.get('type') or ''}'")
+    try:
+        client_id = int((r.get("client_id") or "").strip())
+    except ValueError:
+        return err(f"client_id inválido '{r.get('client_id') or ''}'")
+    ts_s = (r.get("timestamp") or "").strip()
+    ts = parse_timestamp(ts_s) if ts_s else default_ts
+    if ts is None:
+        return err(f"fecha inválida '{ts_s}'")
+    note = (r.get("note") or "").strip() or None
+    company = (r.get("company") or "").strip()
+    amount = parse_float_or_none(r.get("amount"))
+    shares = parse_float_or_none(r.get("shares"))
+    price = parse_float_or_none(r.get("price"))
+
+    if op in ("DEPOSIT", "WITHDRAW"):
+        if amount is None or amount <= 0:
+            return err("El depósito debe ser > 0" if op == "DEPOSIT" else "El retiro debe ser > 0")
+        return (line, op, client_id, "", 0.0, 0.0, amount, note, ts)
+    if not company:
+        return err("Empresa es obligatoria")
+    if price is None or price <= 0:
+        return err("El precio debe ser > 0")
+    if op == "BUY":
+        if amount is None or amount <= 0:
+            return err("El monto debe ser > 0")
+        return (line, op, client_id, company, amount / price, price, amount, note, ts)
+    if shares is None or shares <= 0:
+        return err("Las acciones a vender deben ser > 0")
+    return (line, op, client_id, company, shares, price, shares * price, note, ts)
+
+def validate_operations(conn: sqlite3.Connection, rows: Iterable[Tuple[int, Dict[str, str]]]) -> Dict[str, Any]:
+    # Valida todo el archivo en memoria simulando capital y acciones, sin tocar la base
+    default_ts = now_ts()
+    errors: List[Tuple[int, str]] = []
+    ops = [op for op in (_parse_row(line, r, default_ts, errors) for line, r in rows) if op]
+    # Se simula en el mismo orden en que quedan en el libro (fecha, luego línea), no en el del archivo
+    ops.sort(key=lambda op: (op[8], op[0]))
+
+    client_ids = list({op[2] for op in ops})
+    capital = {c["id"]: c["capital_available"] for c in repo.get_clients_by_ids(conn, client_ids)}
+    start_capital = dict(capital)
+    # Nada antes de lo ya registrado: reescribiría saldos y lotes pasados que la simulación no ve
+    last_ts = repo.get_last_activity_ts(conn, list(capital))
+    positions: Dict[Tuple[int, str], Dict[str, Any]] = {}
+    for inv in repo.get_investments_by_clients(conn, list(capital)):
+        positions.setdefault((inv["client_id"], inv["company"]), {
+            "id": inv["id"], "instrument_id": inv["instrument_id"],
+            "shares": inv["shares"], "avg_price": inv["avg_price"], "created_at": None,
+        })
+
+    valid = []
+    for op in ops:
+        line, kind, client_id, company, shares, price, amount, _note, ts = op
+        if client_id not in capital:
+            errors.append((line, "Cliente no existe"))
+            continue
+        if ts < last_ts.get(client_id, ts):
+            errors.append((line, "Fecha anterior al último movimiento registrado del cliente"))
+            continue
+        if kind == "DEPOSIT":
+            capital[client_id] += amount
+        elif kind == "WITHDRAW":
+            if capital[client_id] < amount:
+                errors.append((line, "Fondos insuficientes para retirar"))
+                continue
+            capital[client_id] -= amount
+        elif kind == "BUY":
+            if capital[client_id] < amount:
+                errors.append((line, "Capital insuficiente"))
+                continue
+            pos = positions.get((client_id, company))
+            if pos:
+                new_shares = pos["shares"] + shares
+                pos["avg_price"] = ((pos["avg_price"] * pos["shares"]) + amount) / new_shares
+                pos["shares"] = new_shares
+            else:
+                positions[(client_id, company)] = {
+                    "id": None, "instrument_id": None, "shares": shares, "avg_price": price, "created_at": ts,
+                }
+            capital[client_id] -= amount
+        else:  # SELL
+            pos = positions.get((client_id, company))
+            if not pos:
+                errors.append((line, "Inversión no existe"))
+                continue
+            if shares > pos["shares"]:
+                errors.append((line, "No hay suficientes acciones"))
+                continue
+            pos["shares"] -= shares
+            if pos["shares"] <= 0:
+                pos["avg_price"] = 0.0
+            capital[client_id] += amount
+        valid.append(op)
+
+    return {
+        "ops": valid,
+        "errors": [f"Línea {line}: {msg}" for line, msg in sorted(errors)],
+        "capital_deltas": [(capital[c] - start_capital[c], c) for c in capital if capital[c] != start_capital[c]],
+        "positions": positions,
+    }
+
+def apply_operations(conn: sqlite3.Connection, plan: Dict[str, Any], chunk_size: int = CHUNK_SIZE):
+    # Una sola transacción (todo o nada); las inserciones van en bloques con executemany
+    ops = plan["ops"]
+    positions = plan["positions"]
+    touched = {(op[2], op[3]) for op in ops if op[1] in ("BUY", "SELL")}
+    new_keys = [k for k in touched if positions[k]["id"] is None]
+    new_set = set(new_keys)
+    try:
+        conn.execute("BEGIN")
+        if new_keys:
+            repo.create_instruments_many(conn, list({company for _c, company in new_keys}), now_ts())
+            instruments = repo.get_instrument_ids(conn)
+            repo.create_investments_many(conn, [
+                (c, instruments[company], company, positions[(c, company)]["avg_price"],
+                 positions[(c, company)]["shares"], positions[(c, company)]["created_at"])
+                for c, company in new_keys
+            ])
+            # recuperar ids generados (nuevas posiciones: una por cliente/empresa)
+            for inv in repo.get_investments_by_clients(conn, list({c for c, _ in new_keys})):
+                key = (inv["client_id"], inv["company"])
+                if key in new_set and positions[key]["id"] is None:
+                    positions[key]["id"] = inv["id"]
+                    positions[key]["instrument_id"] = inv["instrument_id"]
+        repo.update_investments_many(conn, [
+            (positions[k]["avg_price"], positions[k]["shares"], positions[k]["id"])
+            for k in touched if k not in new_set
+        ])
+
+        cash, trades, prices = [], [], []
+        def flush():
+            repo.insert_cash_movements_many(conn, cash)
+            repo.insert_trades_many(conn, trades)
+            repo.insert_price_history_many(conn, prices)
+            cash.clear(); trades.clear(); prices.clear()
+
+        for _line, kind, client_id, company, shares, price, amount, note, ts in ops:
+            if kind in ("DEPOSIT", "WITHDRAW"):
+                cash.append((client_id, kind, amount, note, ts))
+            else:
+                pos = positions[(client_id, company)]
+                trades.append((pos["id"], kind, shares, price, amount, ts, note))
+                prices.append((pos["instrument_id"], price, ts))
+            if len(cash) + len(trades) >= chunk_size:
+                flush()
+        flush()
+        repo.update_client_capital_many(conn, plan["capital_deltas"])
+        # Las operaciones pueden tener fecha pasada: se rehacen los lotes de las posiciones tocadas
+        if touched:
+            rebuild_lots(conn, investment_ids=[positions[k]["id"] for k in touched])
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+def import_trades(conn: sqlite3.Connection, rows: Iterable[Tuple[int, Dict[str, str]]],
+                  chunk_size: int = CHUNK_SIZE, dry_run: bool = False) -> Dict[str, Any]:
+    started = time.perf_counter()
+    plan = validate_operations(conn, rows)
+    applied = False
+    if not plan["errors"] and not dry_run:
+        apply_operations(conn, plan, chunk_size)
+        applied = True
+    elapsed = time.perf_counter() - started
+    counts = {t: 0 for t in OPERATION_TYPES}
+    for op in plan["ops"]:
+        counts[op[1]] += 1
+    return {
+        "applied": applied,
+        "rows": len(plan["ops"]) if applied else 0,
+        "counts": counts,
+        "errors": plan["errors"],
+        "seconds": elapsed,
+        "rows_per_sec": len(plan["ops"]) / elapsed if applied and elapsed > 0 else 0.0,
+    }
+
+def import_trade_file(conn: sqlite3.Connection, path: str, chunk_size: int = CHUNK_SIZE,
+                      dry_run: bool = False) -> Dict[str, Any]:
+    return import_trades(conn, read_trade_file(path), chunk_size, dry_run)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import argparse
+    from data.db import get_connection, ensure_schema_and_seed
+    p = argparse.ArgumentParser(description="Importa operaciones BUY/SELL/DEPOSIT/WITHDRAW desde un CSV (todo o nada)")
+    p.add_argument("file")
+    p.add_argument("--db", default=None, help="Ruta de la base (por defecto investments.db)")
+    p.add_argument("--chunk", type=int, default=CHUNK_SIZE, help="Filas por executemany")
+    p.add_argument("--dry-run", action="store_true", help="Solo validar, sin escribir")
+    args = p.parse_args(argv)
+
+    conn = get_connection(args.db)
+    ensure_schema_and_seed(conn)
+    report = import_trade_file(conn, args.file, args.chunk, args.dry_run)
+    if report["errors"]:
+        for e in report["errors"]:
+            print(e)
+        print(f"{len(report['errors'])} errores; no se aplicó ningún cambio")
+        return 1
+    summary = ", ".join(f"{k}={v}" for k, v in report["counts"].items())
+    if report["applied"]:
+        print(f"Importadas {report['rows']} operaciones ({summary}) en {report['seconds']:.2f}s "
+              f"({report['rows_per_sec']:,.0f} filas/s)")
+    else:
+        print(f"Validación correcta ({summary}); sin cambios (--dry-run)")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,202 @@
+import sqlite3
+import time
+from collections import deque
+from typing import Optional, List, Dict, Any, Tuple
+from data import repositorios as repo
+
+# Lotes por posición: cada BUY abre un lote (acciones, costo por acción); cada SELL consume lotes abiertos
+# según el método y guarda el resultado realizado (venta - costo) en la operación y en lot_matches.
+# El método queda en la venta (investment_trades.lot_method; NULL = FIFO) y rehacer los lotes lo respeta.
+#   FIFO: primero los lotes más viejos; LIFO: los más nuevos;
+#   AVG: costo promedio de los lotes abiertos, que se reducen en proporción (el promedio no cambia).
+# Posiciones con acciones que no vienen de un BUY registrado (bases viejas) abren un lote inicial
+# al costo promedio de la posición.
+LOT_METHODS = ("FIFO", "LIFO", "AVG")
+DEFAULT_LOT_METHOD = "FIFO"
+EPS = 1e-9
+FLUSH_ROWS = 50_000
+
+def _check_method(method: str) -> str:
+    method = (method or DEFAULT_LOT_METHOD).upper()
+    if method not in LOT_METHODS:
+        raise ValueError(f"Método de lotes inválido: {method} (use {', '.join(LOT_METHODS)})")
+    return method
+
+def match_lots(open_lots: List[Dict[str, Any]], shares: float, price: float,
+               method: str = DEFAULT_LOT_METHOD) -> Tuple[List[Tuple[Optional[int], float, float, float]], float]:
+    # open_lots: [{"id", "remaining", "price"}] en orden de compra; se descuentan en el lugar.
+    # Devuelve ([(lot_id, acciones, costo, venta)], resultado realizado). Lo que no cubren los lotes
+    # queda con lot_id None y costo igual a la venta (sin resultado).
+    method = _check_method(method)
+    matches: List[Tuple[Optional[int], float, float, float]] = []
+    left = shares
+    if method == "AVG":
+        total = sum(lot["remaining"] for lot in open_lots)
+        if total > EPS:
+            take = min(left, total)
+            avg = sum(lot["remaining"] * lot["price"] for lot in open_lots) / total
+            ratio = take / total
+            for lot in open_lots:
+                qty = lot["remaining"] * ratio
+                if qty > 0:
+                    lot["remaining"] -= qty
+                    matches.append((lot["id"], qty, qty * avg, qty * price))
+            left -= take
+    else:
+        order = open_lots if method == "FIFO" else reversed(open_lots)
+        for lot in order:
+            if left <= EPS:
+                break
+            qty = min(lot["remaining"], left)
+            if qty <= 0:
+                continue
+            lot["remaining"] -= qty
+            left -= qty
+            matches.append((lot["id"], qty, qty * lot["price"], qty * price))
+    for lot in open_lots:
+        if lot["remaining"] < EPS:
+            lot["remaining"] = 0.0
+    if left > EPS:
+        matches.append((None, left, left * price, left * price))
+    realized = sum(proceeds - cost for _lot, _qty, cost, proceeds in matches)
+    return matches, realized
+
+def plan_sell(conn: sqlite3.Connection, investment_id: int, shares: float, price: float,
+              method: str = DEFAULT_LOT_METHOD) -> Tuple[List[tuple], List[Tuple[float, int]], float]:
+    # Para una venta en curso (dentro de la transacción del llamador): (cruces, [(saldo, lot_id)], resultado).
+    # El llamador inserta el SELL con el resultado y luego save_sell() con su id.
+    lots = [dict(r) for r in repo.get_open_lots(conn, investment_id)]
+    matches, realized = match_lots(lots, shares, price, method)
+    touched = {lot_id for lot_id, *_ in matches if lot_id is not None}
+    remaining = [(lot["remaining"], lot["id"]) for lot in lots if lot["id"] in touched]
+    return matches, remaining, realized
+
+def save_sell(conn: sqlite3.Connection, sell_trade_id: int, matches: List[tuple], remaining: List[Tuple[float, int]]):
+    repo.update_lots_remaining_many(conn, remaining)
+    repo.insert_lot_matches_many(conn, [(sell_trade_id, lot_id, qty, cost, proceeds, proceeds - cost)
+                                        for lot_id, qty, cost, proceeds in matches])
+
+def rebuild_lots(conn: sqlite3.Connection, method: Optional[str] = None,
+                 investment_ids: Optional[List[int]] = None) -> Dict[str, Any]:
+    # Rehace lotes, cruces y realized_pnl reproduciendo investment_trades en bloque, una pasada por
+    # posición en orden cronológico. Cada venta usa su propio método; con method se cambia el de todas.
+    # Corre dentro de la transacción del llamador.
+    method = _check_method(method) if method else None
+    started = time.perf_counter()
+    repo.delete_lots(conn, investment_ids)
+    invs = {i["id"]: i for i in (repo.get_investments_by_ids(conn, investment_ids) if investment_ids is not None
+                                 else conn.execute("SELECT * FROM investments").fetchall())}
+    # Acciones que no explica el historial de operaciones: lote inicial a costo promedio
+    traded = repo.get_trade_share_totals(conn, list(invs) if investment_ids is not None else None)
+    next_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM lots").fetchone()[0] + 1
+    stats = {"method": method or "por venta", "positions": 0, "lots": 0, "sells": 0, "unmatched": 0, "realized_pnl": 0.0}
+    lots_rows: List[tuple] = []
+    matches_rows: List[tuple] = []
+    pnl_rows: List[Tuple[float, int]] = []
+
+    def flush():
+        repo.insert_lots_many(conn, lots_rows)
+        repo.insert_lot_matches_many(conn, matches_rows)
+        repo.update_sell_results_many(conn, pnl_rows)
+        lots_rows.clear()
+        matches_rows.clear()
+        pnl_rows.clear()
+
+    def start(inv_id):
+        # Lista de lotes de la posición (todos, para guardarlos al final)
+        nonlocal next_id
+        inv = invs.get(inv_id)
+        lots: List[Dict[str, Any]] = []
+        if inv is not None:
+            opening = inv["shares"] - traded.get(inv_id, 0.0)
+            if opening > EPS:
+                lots.append({"id": next_id, "buy_trade_id": None, "shares": opening, "remaining": opening,
+                             "price": inv["avg_price"], "created_at": inv["created_at"]})
+                next_id += 1
+        return lots
+
+    def finish(inv_id, lots):
+        lots_rows.extend((lot["id"], inv_id, lot["buy_trade_id"], lot["shares"], lot["remaining"], lot["price"],
+                          lot["created_at"]) for lot in lots)
+        stats["positions"] += 1
+        stats["lots"] += len(lots)
+        if len(lots_rows) + len(matches_rows) >= FLUSH_ROWS:
+            flush()
+
+    current, lots, queue = None, [], deque()
+    seen = set()
+    for t in repo.iter_trades_for_lots(conn, investment_ids):
+        if t["investment_id"] != current:
+            if current is not None:
+                finish(current, lots)
+            current, lots = t["investment_id"], start(t["investment_id"])
+            # Cola de lotes con saldo en orden de compra; los agotados salen por la punta que consume el método
+            queue = deque(lots)
+            seen.add(current)
+        if t["type"] == "BUY":
+            lot = {"id": next_id, "buy_trade_id": t["id"], "shares": t["shares"], "remaining": t["shares"],
+                   "price": t["price"], "created_at": t["created_at"]}
+            next_id += 1
+            lots.append(lot)
+            queue.append(lot)
+            continue
+        sell_method = method or t["lot_method"]
+        matches, realized = match_lots(queue, t["shares"], t["price"], sell_method or DEFAULT_LOT_METHOD)
+        while queue and queue[0]["remaining"] <= 0:
+            queue.popleft()
+        while queue and queue[-1]["remaining"] <= 0:
+            queue.pop()
+        matches_rows.extend((t["id"], lot_id, qty, cost, proceeds, proceeds - cost)
+                            for lot_id, qty, cost, proceeds in matches)
+        pnl_rows.append((realized, sell_method, t["id"]))
+        stats["sells"] += 1
+        stats["unmatched"] += sum(1 for lot_id, *_ in matches if lot_id is None)
+        stats["realized_pnl"] += realized
+    if current is not None:
+        finish(current, lots)
+    # Posiciones con acciones y sin operaciones BUY/SELL: solo el lote inicial
+    for inv_id in invs:
+        if inv_id not in seen:
+            lots = start(inv_id)
+            if lots:
+                finish(inv_id, lots)
+    flush()
+    stats["seconds"] = time.perf_counter() - started
+    return stats
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import argparse
+    from data.db import DB_FILE, get_connection, ensure_schema_and_seed
+    p = argparse.ArgumentParser(description="Rehace lotes y resultado realizado desde investment_trades")
+    p.add_argument("--db", default=DB_FILE, help="Ruta de la base (por defecto investments.db)")
+    p.add_argument("--method", default=None,
+                   help="FIFO, LIFO o AVG para todas las ventas (por defecto, el guardado en cada venta)")
+    p.add_argument("--client", type=int, default=None, help="Solo las posiciones de este cliente")
+    args = p.parse_args(argv)
+
+    conn = get_connection(args.db)
+    ensure_schema_and_seed(conn)
+    try:
+        ids = None
+        if args.client is not None:
+            ids = [r["id"] for r in repo.get_investments_by_client(conn, args.client)]
+        conn.execute("BEGIN")
+        try:
+            stats = rebuild_lots(conn, args.method, ids)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    except ValueError as e:
+        print(f"Error: {e}")
+        return 1
+    finally:
+        conn.close()
+    print(f"Lotes ({stats['method']}): {stats['lots']:,} en {stats['positions']:,} posiciones, "
+          f"{stats['sells']:,} ventas, resultado realizado {stats['realized_pnl']:,.2f} en {stats['seconds']:.2f}s")
+    if stats["unmatched"]:
+        print(f"Aviso: {stats['unmatched']} ventas sin lotes suficientes (quedan sin resultado por esa parte)")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
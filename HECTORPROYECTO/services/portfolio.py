@@ -1,13 +1,41 @@
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple, Iterator
 import sqlite3
 from data import repositorios as repo
-from utils.validation import ensure_positive, ensure_non_negative, ensure_shares_positive
-from utils.format import now_iso
+from utils.validation import ensure_positive, ensure_non_negative, ensure_shares_positive, validate_date_str
+from utils.format import day_range, fmt_ts, now_ts
+from utils.tracing import instrument
+from services.cache import PortfolioCache
+from services import lots
 from datetime import datetime, timedelta
 
+@instrument
 class PortfolioService:
-    def __init__(self, conn: sqlite3.Connection):
+    def __init__(self, conn: sqlite3.Connection, read_conn: Optional[sqlite3.Connection] = None,
+                 cache: Optional[PortfolioCache] = None):
+        # conn: escrituras (y validaciones previas); read_conn: consultas (p. ej. del pool de solo lectura)
+        # cache: opcional; las escrituras de esta clase lo invalidan después del COMMIT
         self.conn = conn
+        self.read_conn = read_conn or conn
+        self.cache = cache
+
+    # ---- Clients ----
+    def create_client(self, name: str, email: Optional[str] = None, phone: Optional[str] = None,
+                      initial_capital: float = 0.0) -> int:
+        name = (name or "").strip()
+        if not name:
+            raise ValueError("El nombre es obligatorio")
+        ensure_non_negative(initial_capital, "El capital inicial debe ser >= 0")
+        try:
+            self.conn.execute("BEGIN")
+            client_id = repo.create_client(self.conn, name, email, phone, initial_capital)
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        # Un get_client previo de este id pudo dejar None en la caché
+        if self.cache:
+            self.cache.invalidate_client(client_id)
+        return client_id
 
     # ---- Cash ----
     def deposit(self, client_id: int, amount: float, note: Optional[str] = None):
@@ -20,6 +48,8 @@ class PortfolioService:
         except Exception:
             self.conn.execute("ROLLBACK")
             raise
+        if self.cache:
+            self.cache.invalidate_client(client_id)
 
     def withdraw(self, client_id: int, amount: float, note: Optional[str] = None):
         ensure_positive(amount, "El retiro debe ser > 0")
@@ -36,6 +66,8 @@ class PortfolioService:
         except Exception:
             self.conn.execute("ROLLBACK")
             raise
+        if self.cache:
+            self.cache.invalidate_client(client_id)
 
     # ---- Trades ----
     def buy(self, client_id: int, company: str, amount: float, price: float, note: Optional[str] = None):
@@ -56,19 +88,30 @@ class PortfolioService:
                 new_avg = ((inv["avg_price"] * inv["shares"]) + amount) / new_shares
                 repo.update_investment(self.conn, inv["id"], avg_price=new_avg, shares=new_shares)
                 inv_id = inv["id"]
+                instrument_id = inv["instrument_id"]
             else:
-                inv_id = repo.create_investment(self.conn, client_id, company, price, shares)
+                instrument_id = repo.get_or_create_instrument(self.conn, company)
+                inv_id = repo.create_investment(self.conn, client_id, company, price, shares, instrument_id)
             # capital down
             repo.update_client_capital(self.conn, client_id, -amount)
             # trade + price history
-            repo.insert_trade(self.conn, inv_id, "BUY", shares, price, amount, note)
-            repo.insert_price_history(self.conn, inv_id, price)
+            # cada compra abre un lote (services.lots) con la misma fecha que la operación, como en rebuild_lots
+            ts = now_ts()
+            trade_id = repo.insert_trade(self.conn, inv_id, "BUY", shares, price, amount, note, created_at=ts)
+            repo.insert_lot(self.conn, inv_id, trade_id, shares, price, ts)
+            repo.insert_price_history(self.conn, instrument_id, price)
             self.conn.execute("COMMIT")
         except Exception:
             self.conn.execute("ROLLBACK")
             raise
+        if self.cache:
+            self.cache.invalidate_client(client_id, positions=True)
+            self.cache.invalidate_price(instrument_id)
 
-    def sell(self, investment_id: int, shares_to_sell: float, price: float, note: Optional[str] = None):
+    def sell(self, investment_id: int, shares_to_sell: float, price: float, note: Optional[str] = None,
+             method: Optional[str] = None):
+        # method: FIFO, LIFO o AVG para elegir los lotes que se venden (por defecto FIFO); queda en la venta
+        method = (method or lots.DEFAULT_LOT_METHOD).upper()
         ensure_positive(shares_to_sell, "Las acciones a vender deben ser > 0")
         ensure_positive(price, "El precio debe ser > 0")
         inv = repo.get_investment(self.conn, investment_id)
@@ -86,13 +129,20 @@ class PortfolioService:
             # abonar capital
             client_id = inv["client_id"]
             repo.update_client_capital(self.conn, client_id, amount)
+            # lotes que cubren la venta y resultado realizado
+            matches, lots_left, realized = lots.plan_sell(self.conn, investment_id, shares_to_sell, price, method)
             # trade (SELL) y price_history (opcional mantener precio de venta solo como trade)
-            repo.insert_trade(self.conn, investment_id, "SELL", shares_to_sell, price, amount, note)
-            repo.insert_price_history(self.conn, investment_id, price)
+            trade_id = repo.insert_trade(self.conn, investment_id, "SELL", shares_to_sell, price, amount, note,
+                                         realized_pnl=realized, lot_method=method)
+            lots.save_sell(self.conn, trade_id, matches, lots_left)
+            repo.insert_price_history(self.conn, inv["instrument_id"], price)
             self.conn.execute("COMMIT")
         except Exception:
             self.conn.execute("ROLLBACK")
             raise
+        if self.cache:
+            self.cache.invalidate_client(client_id, positions=True)
+            self.cache.invalidate_price(inv["instrument_id"])
 
     def update_price(self, investment_id: int, price: float, note: Optional[str] = None):
         ensure_positive(price, "El precio debe ser > 0")
@@ -103,90 +153,198 @@ class PortfolioService:
             self.conn.execute("BEGIN")
             # PRICE_UPDATE no cambia shares/capital
             repo.insert_trade(self.conn, investment_id, "PRICE_UPDATE", 0.0, price, 0.0, note)
-            repo.insert_price_history(self.conn, investment_id, price)
+            repo.insert_price_history(self.conn, inv["instrument_id"], price)
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        if self.cache:
+            self.cache.invalidate_price(inv["instrument_id"])
+
+    def update_company_price(self, company: str, price: float):
+        # Un solo punto en la serie del instrumento revalúa a todos los clientes que lo tienen
+        ensure_positive(price, "El precio debe ser > 0")
+        instrument = repo.get_instrument_by_symbol(self.conn, company)
+        if not instrument:
+            raise ValueError("Empresa no existe")
+        try:
+            self.conn.execute("BEGIN")
+            repo.insert_price_history(self.conn, instrument["id"], price)
             self.conn.execute("COMMIT")
         except Exception:
             self.conn.execute("ROLLBACK")
             raise
+        if self.cache:
+            self.cache.invalidate_price(instrument["id"])
 
     # ---- Queries ----
     def get_last_price(self, investment_id: int) -> Optional[float]:
-        return repo.get_last_price(self.conn, investment_id)
+        inv = repo.get_investment(self.read_conn, investment_id)
+        return repo.get_last_price(self.read_conn, inv["instrument_id"]) if inv else None
+
+    def get_client(self, client_id: int) -> Optional[Dict[str, Any]]:
+        def load():
+            row = repo.get_client(self.read_conn, client_id)
+            return dict(row) if row else None
+        return self.cache.get_or_load(("client", client_id), load) if self.cache else load()
 
     def get_client_portfolio(self, client_id: int) -> List[Dict[str, Any]]:
-        investments = repo.get_investments_by_client(self.conn, client_id)
-        rows = []
-        for inv in investments:
-            current_price = repo.get_last_price(self.conn, inv["id"]) or inv["avg_price"]
-            current_value = current_price * inv["shares"]
-            pnl = (current_price - inv["avg_price"]) * inv["shares"]
-            rows.append({
-                "investment_id": inv["id"],
-                "company": inv["company"],
-                "shares": inv["shares"],
-                "avg_price": inv["avg_price"],
-                "current_price": current_price,
-                "current_value": current_value,
-                "pnl": pnl,
-            })
-        return rows
-
-    def _range_from_day(self, day: str) -> tuple[str, str]:
-        # day: "YYYY-MM-DD"
-        start = f"{day} 00:00:00"
-        end = f"{day} 23:59:59"
-        return start, end
+        if not self.cache:
+            return self.get_portfolios([client_id]).get(client_id, [])
+        # Con caché: posiciones y precios por separado, valuación en memoria
+        positions = self.cache.get_or_load(
+            ("positions", client_id),
+            lambda: [dict(r) for r in repo.get_investments_by_client(self.read_conn, client_id)])
+        prices = self.cache.get_many(
+            "price", {p["instrument_id"] for p in positions if p["instrument_id"] is not None},
+            lambda ids: repo.get_last_prices(self.read_conn, ids))
+        return [self._position_row(p["id"], p["company"], p["shares"], p["avg_price"],
+                                   prices.get(p["instrument_id"]))
+                for p in positions]
+
+    @staticmethod
+    def _position_row(investment_id: int, company: str, shares: float, avg_price: float,
+                      price: Optional[float]) -> Dict[str, Any]:
+        # Sin precio registrado se valúa al costo promedio (como el COALESCE de la consulta)
+        price = avg_price if price is None else price
+        return {
+            "investment_id": investment_id,
+            "company": company,
+            "shares": shares,
+            "avg_price": avg_price,
+            "current_price": price,
+            "current_value": price * shares,
+            "pnl": (price - avg_price) * shares,
+        }
+
+    def get_portfolios(self, client_ids: Optional[List[int]] = None) -> Dict[int, List[Dict[str, Any]]]:
+        # Valuación de varios clientes (o todos con None) en una sola consulta
+        result: Dict[int, List[Dict[str, Any]]] = {}
+        for r in repo.fetch_portfolio_valuation(self.read_conn, client_ids):
+            result.setdefault(r["client_id"], []).append(
+                self._position_row(r["investment_id"], r["company"], r["shares"], r["avg_price"], r["current_price"]))
+        return result
+
+    def get_client_cards(self, client_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+        # Resumen por cliente para las tarjetas visibles: dos consultas para toda la página.
+        # equity = efectivo disponible + posiciones abiertas al último precio.
+        values = repo.fetch_market_values(self.read_conn, client_ids)
+        cards = {}
+        for c in repo.get_clients_by_ids(self.read_conn, client_ids):
+            market_value, positions = values.get(c["id"], (0.0, 0))
+            cards[c["id"]] = {
+                "id": c["id"], "name": c["name"], "email": c["email"],
+                "capital_available": c["capital_available"],
+                "market_value": market_value, "positions": positions,
+                "equity": c["capital_available"] + market_value,
+            }
+        return cards
+
+    def get_nav_series(self, client_id: int, date_from: Optional[str] = None,
+                       date_to: Optional[str] = None) -> List[Dict[str, Any]]:
+        # Evolución diaria desde nav_snapshots (services.snapshots): una fila por día, sin recorrer el libro
+        for d in (date_from, date_to):
+            if d:
+                validate_date_str(d)
+        return [dict(r) for r in repo.get_nav_series(self.read_conn, client_id, date_from, date_to)]
+
+    def get_client_returns(self, client_id: int, date_from: str, date_to: str) -> Optional[Dict[str, Any]]:
+        # TWR / XIRR del período sobre las fotos de NAV; None si el cliente no tiene fotos en el rango
+        from services.returns import compute_returns
+        rows = compute_returns(self.read_conn, date_from, date_to, [client_id])
+        return rows[0] if rows else None
+
+    def get_realized_gains(self, client_id: int, day: Optional[str] = None, date_from: Optional[str] = None,
+                           date_to: Optional[str] = None) -> List[Dict[str, Any]]:
+        # Ventas con su resultado realizado (guardado al vender o por services.lots): una consulta
+        start, end = self._history_range(day, date_from, date_to)
+        return [{**dict(r), "fecha": fmt_ts(r["created_at"])}
+                for r in repo.fetch_realized_gains(self.read_conn, client_id, start, end)]
+
+    def _range_from_day(self, day: str) -> tuple[int, int]:
+        # day: "YYYY-MM-DD" -> [00:00 del día, 00:00 del siguiente)
+        return day_range(day)
+
+    def _history_range(self, day: Optional[str], date_from: Optional[str], date_to: Optional[str]) -> tuple:
+        if day:
+            return self._range_from_day(day)
+        if date_from and date_to:
+            return day_range(date_from, date_to)
+        return None, None
+
+    @staticmethod
+    def _cash_row(m) -> Dict[str, Any]:
+        delta = m["amount"] if m["type"] == "DEPOSIT" else -m["amount"]
+        return {
+            "fecha": fmt_ts(m["created_at"]),
+            "tipo_general": "EFECTIVO",
+            "tipo": m["type"],
+            "empresa": "",
+            "detalle": f"{m['type']} ${m['amount']:.2f}" + (f" ({m['note']})" if m['note'] else ""),
+            "monto_cambio_capital": delta,
+            "shares": "",
+            "price": "",
+            "created_at": m["created_at"],
+            "cursor": (m["created_at"], repo.HISTORY_SRC_CASH, m["id"]),
+        }
+
+    @staticmethod
+    def _trade_row(t) -> Dict[str, Any]:
+        empresa = t["company"]
+        tipo = t["type"]
+        if tipo == "BUY":
+            detalle = f"BUY {t['shares']:.4f} @ ${t['price']:.2f} de {empresa}"
+            delta = -t["amount"]
+        elif tipo == "SELL":
+            detalle = f"SELL {t['shares']:.4f} @ ${t['price']:.2f} de {empresa}"
+            delta = t["amount"]
+        else:  # PRICE_UPDATE
+            detalle = f"PRICE_UPDATE @ ${t['price']:.2f} de {empresa}"
+            delta = 0.0
+        return {
+            "fecha": fmt_ts(t["created_at"]),
+            "tipo_general": "INVERSIÓN" if tipo in ("BUY", "SELL") else "PRECIO",
+            "tipo": tipo,
+            "empresa": empresa,
+            "detalle": detalle + (f" ({t['note']})" if t['note'] else ""),
+            "monto_cambio_capital": delta,
+            "shares": t["shares"] if t["shares"] else "",
+            "price": t["price"],
+            "created_at": t["created_at"],
+            "cursor": (t["created_at"], repo.HISTORY_SRC_TRADE, t["id"]),
+        }
+
+    def iter_client_history(self, client_id: int, day: Optional[str] = None,
+                            date_from: Optional[str] = None, date_to: Optional[str] = None,
+                            cursor: Optional[tuple] = None, limit: Optional[int] = None,
+                            sort: Optional[str] = None, descending: bool = True) -> Iterator[Dict[str, Any]]:
+        # Flujo ya ordenado desde SQL (UNION ALL); "cursor" de cada fila sirve para continuar después.
+        # sort: una clave de repo.HISTORY_SORTS (None = por fecha); el cursor incluye entonces la clave de orden.
+        start_ts, end_ts = self._history_range(day, date_from, date_to)
+        for r in repo.iter_client_history(self.read_conn, client_id, start_ts, end_ts, cursor, limit,
+                                          sort=sort, descending=descending):
+            row = self._cash_row(r) if r["src"] == repo.HISTORY_SRC_CASH else self._trade_row(r)
+            if sort:
+                row["cursor"] = (r["sort_key"],) + row["cursor"]
+            yield row
 
     def get_client_history(self, client_id: int, day: Optional[str] = None,
                            date_from: Optional[str] = None, date_to: Optional[str] = None) -> List[Dict[str, Any]]:
-        start_iso = end_iso = None
-        if day:
-            start_iso, end_iso = self._range_from_day(day)
-        elif date_from and date_to:
-            start_iso = f"{date_from} 00:00:00"
-            end_iso = f"{date_to} 23:59:59"
-
-        cash = repo.fetch_cash_movements(self.conn, client_id, start_iso, end_iso)
-        trades = repo.fetch_trades_with_company(self.conn, client_id, start_iso, end_iso)
-
-        unified: List[Dict[str, Any]] = []
-        # Cash
-        for m in cash:
-            delta = m["amount"] if m["type"] == "DEPOSIT" else -m["amount"]
-            unified.append({
-                "fecha": m["created_at"],
-                "tipo_general": "EFECTIVO",
-                "tipo": m["type"],
-                "empresa": "",
-                "detalle": f"{m['type']} ${m['amount']:.2f}" + (f" ({m['note']})" if m['note'] else ""),
-                "monto_cambio_capital": delta,
-                "shares": "",
-                "price": "",
-            })
-        # Trades
-        for t in trades:
-            empresa = t["company"]
-            tipo = t["type"]
-            if tipo == "BUY":
-                detalle = f"BUY {t['shares']:.4f} @ ${t['price']:.2f} de {empresa}"
-                delta = -t["amount"]
-            elif tipo == "SELL":
-                detalle = f"SELL {t['shares']:.4f} @ ${t['price']:.2f} de {empresa}"
-                delta = t["amount"]
-            else:  # PRICE_UPDATE
-                detalle = f"PRICE_UPDATE @ ${t['price']:.2f} de {empresa}"
-                delta = 0.0
-            unified.append({
-                "fecha": t["created_at"],
-                "tipo_general": "INVERSIÓN" if tipo in ("BUY", "SELL") else "PRECIO",
-                "tipo": tipo,
-                "empresa": empresa,
-                "detalle": detalle + (f" ({t['note']})" if t['note'] else ""),
-                "monto_cambio_capital": delta,
-                "shares": t["shares"] if t["shares"] else "",
-                "price": t["price"],
-            })
-
-        # Orden desc por fecha
-        unified.sort(key=lambda r: r["fecha"], reverse=True)
-        return unified
+        return list(self.iter_client_history(client_id, day, date_from, date_to))
+
+    def get_client_history_page(self, client_id: int, day: Optional[str] = None,
+                                date_from: Optional[str] = None, date_to: Optional[str] = None,
+                                cursor: Optional[tuple] = None, limit: int = 200,
+                                sort: Optional[str] = None, descending: bool = True) -> Tuple[List[Dict[str, Any]], Optional[tuple]]:
+        # Paginación por clave (keyset), sin OFFSET. Devuelve (filas, cursor_siguiente);
+        # cursor_siguiente es None al llegar al final. El cursor solo vale para el mismo sort/descending.
+        page = list(self.iter_client_history(client_id, day, date_from, date_to, cursor, limit, sort, descending))
+        next_cursor = page[-1]["cursor"] if len(page) == limit else None
+        return page, next_cursor
+
+    def get_client_history_since(self, client_id: int, after: tuple, day: Optional[str] = None,
+                                 date_from: Optional[str] = None, date_to: Optional[str] = None) -> List[Dict[str, Any]]:
+        # Filas más nuevas que "after" (el cursor de la primera fila mostrada), mismo orden y filtro
+        start_ts, end_ts = self._history_range(day, date_from, date_to)
+        return [self._cash_row(r) if r["src"] == repo.HISTORY_SRC_CASH else self._trade_row(r)
+                for r in repo.iter_client_history(self.read_conn, client_id, start_ts, end_ts, after=after)]
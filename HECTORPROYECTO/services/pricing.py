@@ -0,0 +1,104 @@
+import csv
+import sqlite3
+import time
+from typing import Iterable, Iterator, Optional, Tuple, Dict, Any, List
+from data import repositorios as repo
+from utils.format import now_ts
+from utils.validation import parse_float_or_none, parse_timestamp
+
+# Filas por transacción al reprecificar en bloque
+CHUNK_SIZE = 50_000
+
+def read_price_file(path: str) -> Iterator[Tuple[int, str, str, str]]:
+    # CSV con encabezado company,price[,timestamp]; produce (línea, company, price, timestamp) sin cargar el archivo
+    with open(path, "r", newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        for r in reader:
+            yield reader.line_num, (r.get("company") or "").strip(), r.get("price") or "", r.get("timestamp") or ""
+
+def bulk_update_prices(conn: sqlite3.Connection, rows: Iterable[Tuple[int, str, str, str]],
+                       chunk_size: int = CHUNK_SIZE) -> Dict[str, Any]:
+    # Resuelve empresa -> instrumento una sola vez y escribe price_history con executemany por bloques
+    started = time.perf_counter()
+    instruments = repo.get_instrument_ids(conn)
+    default_ts = now_ts()
+    applied = 0
+    touched = set()
+    unknown: Dict[str, int] = {}
+    errors: List[str] = []
+    batch: List[Tuple[int, float, int]] = []
+    parsed_ts: Dict[str, Optional[int]] = {}  # los archivos de cierre repiten la misma marca de tiempo
+
+    def flush():
+        nonlocal applied
+        if not batch:
+            return
+        try:
+            conn.execute("BEGIN")
+            applied += repo.insert_price_history_many(conn, batch)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        batch.clear()
+
+    for line, company, price_s, ts_s in rows:
+        price = parse_float_or_none(price_s)
+        if price is None or price <= 0:
+            errors.append(f"Línea {line}: precio inválido '{price_s}'")
+            continue
+        if not ts_s.strip():
+            ts = default_ts
+        else:
+            ts = parsed_ts.get(ts_s)
+            if ts is None and ts_s not in parsed_ts:
+                ts = parsed_ts[ts_s] = parse_timestamp(ts_s)
+        if ts is None:
+            errors.append(f"Línea {line}: fecha inválida '{ts_s}'")
+            continue
+        instrument_id = instruments.get(company)
+        if instrument_id is None:
+            unknown[company] = unknown.get(company, 0) + 1
+            continue
+        batch.append((instrument_id, price, ts))
+        touched.add(instrument_id)
+        if len(batch) >= chunk_size:
+            flush()
+    flush()
+
+    elapsed = time.perf_counter() - started
+    return {
+        "applied": applied,
+        "instruments": len(touched),
+        "positions": repo.count_positions_by_instrument(conn, list(touched)),
+        "unknown": unknown,
+        "errors": errors,
+        "seconds": elapsed,
+        "rows_per_sec": applied / elapsed if elapsed > 0 else 0.0,
+    }
+
+def import_price_file(conn: sqlite3.Connection, path: str, chunk_size: int = CHUNK_SIZE) -> Dict[str, Any]:
+    return bulk_update_prices(conn, read_price_file(path), chunk_size)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import argparse
+    from data.db import get_connection, ensure_schema_and_seed
+    p = argparse.ArgumentParser(description="Reprecifica en bloque desde un CSV (company,price,timestamp)")
+    p.add_argument("file")
+    p.add_argument("--db", default=None, help="Ruta de la base (por defecto investments.db)")
+    p.add_argument("--chunk", type=int, default=CHUNK_SIZE, help="Filas por transacción")
+    args = p.parse_args(argv)
+
+    conn = get_connection(args.db)
+    ensure_schema_and_seed(conn)
+    stats = import_price_file(conn, args.file, args.chunk)
+    print(f"Aplicados {stats['applied']} precios en {stats['instruments']} instrumentos "
+          f"({stats['positions']} posiciones) en {stats['seconds']:.2f}s ({stats['rows_per_sec']:,.0f} filas/s)")
+    if stats["unknown"]:
+        print(f"Empresas desconocidas ({sum(stats['unknown'].values())} filas): {', '.join(sorted(stats['unknown']))}")
+    for e in stats["errors"]:
+        print(e)
+    return 1 if stats["errors"] else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,125 @@
+import csv
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, List, Dict, Any, Tuple
+from data import repositorios as repo
+from data.db import get_connection
+from utils.format import day_range, now_ts, fmt_ts
+
+# Reporte nocturno de todos los clientes. Los IDs se reparten en rangos contiguos entre
+# procesos; cada proceso abre su propia conexión de solo lectura (WAL: no bloquea al escritor).
+REPORT_FIELDS = [
+    "client_id", "name", "capital_available", "market_value", "nav", "cost_basis", "unrealized_pnl",
+    "realized_pnl", "positions", "deposits", "withdrawals", "net_flow", "bought", "sold", "movements", "trades",
+]
+SHARDS_PER_WORKER = 4  # más shards que procesos: los rápidos toman trabajo de los lentos
+
+def _shards(client_ids: List[int], count: int) -> List[Tuple[int, int]]:
+    # (primer_id, último_id) de rangos contiguos con cantidades parecidas de clientes
+    if not client_ids:
+        return []
+    size = max(1, -(-len(client_ids) // count))
+    return [(client_ids[i], client_ids[min(i + size, len(client_ids)) - 1]) for i in range(0, len(client_ids), size)]
+
+def report_shard(db_path: str, first_id: int, last_id: int,
+                 start_ts: Optional[int] = None, end_ts: Optional[int] = None) -> List[Dict[str, Any]]:
+    # Corre en el proceso hijo: cuatro consultas por rango, todo lo demás en memoria
+    conn = get_connection(db_path, readonly=True)
+    try:
+        rows: Dict[int, Dict[str, Any]] = {}
+        for c in repo.get_clients_in_range(conn, first_id, last_id):
+            rows[c["id"]] = {
+                "client_id": c["id"], "name": c["name"], "capital_available": c["capital_available"],
+                "market_value": 0.0, "cost_basis": 0.0, "positions": 0,
+                "deposits": 0.0, "withdrawals": 0.0, "bought": 0.0, "sold": 0.0, "movements": 0, "trades": 0,
+                "realized_pnl": 0.0,
+            }
+        for p in repo.fetch_portfolio_valuation_range(conn, first_id, last_id):
+            r = rows.get(p["client_id"])
+            if r is None or p["shares"] <= 0:
+                continue
+            r["market_value"] += p["current_price"] * p["shares"]
+            r["cost_basis"] += p["avg_price"] * p["shares"]
+            r["positions"] += 1
+        for t in repo.fetch_cash_totals(conn, first_id, last_id, start_ts, end_ts):
+            if t["client_id"] in rows:
+                rows[t["client_id"]].update(deposits=t["deposits"], withdrawals=t["withdrawals"], movements=t["movements"])
+        for t in repo.fetch_trade_totals(conn, first_id, last_id, start_ts, end_ts):
+            if t["client_id"] in rows:
+                rows[t["client_id"]].update(bought=t["bought"], sold=t["sold"], trades=t["trades"],
+                                               realized_pnl=t["realized_pnl"])
+    finally:
+        conn.close()
+    for r in rows.values():
+        r["nav"] = r["capital_available"] + r["market_value"]
+        r["unrealized_pnl"] = r["market_value"] - r["cost_basis"]
+        r["net_flow"] = r["deposits"] - r["withdrawals"]
+    return list(rows.values())
+
+def build_report(db_path: str, workers: Optional[int] = None, date_from: Optional[str] = None,
+                 date_to: Optional[str] = None) -> Dict[str, Any]:
+    # Flujos (depósitos, retiros, compras, ventas) en [date_from, date_to] si se indican; NAV siempre al día
+    workers = workers or os.cpu_count() or 1
+    start_ts = end_ts = None
+    if date_from and date_to:
+        start_ts, end_ts = day_range(date_from, date_to)
+    conn = get_connection(db_path, readonly=True)
+    try:
+        client_ids = repo.list_client_ids(conn)
+    finally:
+        conn.close()
+    shards = _shards(client_ids, workers * SHARDS_PER_WORKER if workers > 1 else 1)
+    started = time.perf_counter()
+    if workers == 1:
+        parts = [report_shard(db_path, a, b, start_ts, end_ts) for a, b in shards]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            futures = [ex.submit(report_shard, db_path, a, b, start_ts, end_ts) for a, b in shards]
+            parts = [f.result() for f in futures]
+    clients = [r for part in parts for r in part]
+    totals = {k: sum(r[k] for r in clients) for k in REPORT_FIELDS if k not in ("client_id", "name")}
+    return {
+        "generated_at": fmt_ts(now_ts()),
+        "date_from": date_from, "date_to": date_to,
+        "workers": workers, "shards": len(shards),
+        "seconds": round(time.perf_counter() - started, 3),
+        "totals": totals,
+        "clients": clients,
+    }
+
+def write_report(report: Dict[str, Any], path: str):
+    # .json: reporte completo con totales; otro (CSV): una fila por cliente
+    if path.endswith(".json"):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=1)
+        return
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=REPORT_FIELDS)
+        w.writeheader()
+        w.writerows(report["clients"])
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import argparse
+    from data.db import DB_FILE, ensure_schema_and_seed
+    p = argparse.ArgumentParser(description="Reporte de valuación y flujos de todos los clientes en paralelo")
+    p.add_argument("out", help="Archivo destino (.csv o .json)")
+    p.add_argument("--db", default=DB_FILE, help="Ruta de la base (por defecto investments.db)")
+    p.add_argument("--workers", type=int, default=None, help="Procesos (por defecto, núcleos disponibles)")
+    p.add_argument("--from", dest="date_from", default=None, help="Flujos desde YYYY-MM-DD")
+    p.add_argument("--to", dest="date_to", default=None, help="Flujos hasta YYYY-MM-DD")
+    args = p.parse_args(argv)
+
+    # Migraciones pendientes antes de abrir los lectores de solo lectura
+    conn = get_connection(args.db)
+    ensure_schema_and_seed(conn)
+    conn.close()
+    report = build_report(args.db, args.workers, args.date_from, args.date_to)
+    write_report(report, args.out)
+    print(f"Reporte de {len(report['clients'])} clientes en {report['seconds']:.2f}s "
+          f"({report['workers']} procesos, {report['shards']} shards) -> {args.out}")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
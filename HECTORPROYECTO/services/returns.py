@@ -0,0 +1,178 @@
+import csv
+import json
+import sqlite3
+import time
+from datetime import date, timedelta
+from typing import Optional, List, Dict, Any, Tuple, Iterable
+from data import repositorios as repo
+from utils.validation import validate_date_str
+
+# Rentabilidad por cliente sobre las fotos diarias de NAV (services.snapshots). Los flujos externos son
+# los DEPOSIT/WITHDRAW de cash_movements (net_flow de cada foto); las valuaciones salen de operaciones y
+# precios ya aplicados en la foto. Se recorren las fotos una vez, sin rearmar el libro.
+#   TWR: encadena los retornos diarios (NAV_d - flujo_d) / NAV_{d-1} - 1; el flujo se toma al cierre del día.
+#   XIRR: tasa anual que anula el valor presente de -NAV inicial, -flujos y +NAV final (días / 365).
+# Sin foto del día anterior a date_from (cliente nuevo) el período empieza al cierre de su primera foto.
+RETURN_FIELDS = ["client_id", "name", "date_from", "date_to", "days", "begin_nav", "end_nav",
+                 "net_flow", "gain", "twr", "xirr"]
+CLIENTS_PER_CHUNK = 1000
+XIRR_TOLERANCE = 1e-9
+XIRR_MAX_ITER = 100
+
+def _prev_day(day: str) -> str:
+    return (date.fromisoformat(day) - timedelta(days=1)).isoformat()
+
+def _npv(rate: float, flows: List[Tuple[float, float]]) -> Tuple[float, float]:
+    # (valor presente, derivada) de [(años desde el inicio, monto)]
+    value = deriv = 0.0
+    base = 1.0 + rate
+    for t, amount in flows:
+        disc = base ** -t
+        value += amount * disc
+        deriv -= t * amount * disc / base
+    return value, deriv
+
+def xirr(flows: List[Tuple[float, float]]) -> Optional[float]:
+    # Newton desde 10%; si no converge, bisección sobre un intervalo con cambio de signo.
+    # None si los flujos no tienen solución (todos del mismo signo o nulos).
+    if not any(a > 0 for _t, a in flows) or not any(a < 0 for _t, a in flows):
+        return None
+    rate = 0.1
+    for _ in range(XIRR_MAX_ITER):
+        value, deriv = _npv(rate, flows)
+        if abs(value) < XIRR_TOLERANCE:
+            return rate
+        if deriv == 0:
+            break
+        nxt = rate - value / deriv
+        if nxt <= -1.0 or nxt != nxt:
+            break
+        if abs(nxt - rate) < XIRR_TOLERANCE:
+            return nxt
+        rate = nxt
+    lo, hi = -0.999999, 1.0
+    f_lo = _npv(lo, flows)[0]
+    f_hi = _npv(hi, flows)[0]
+    while f_lo * f_hi > 0 and hi < 1e6:
+        hi *= 10
+        f_hi = _npv(hi, flows)[0]
+    if f_lo * f_hi > 0:
+        return None
+    for _ in range(200):
+        mid = (lo + hi) / 2
+        f_mid = _npv(mid, flows)[0]
+        if abs(f_mid) < XIRR_TOLERANCE or hi - lo < XIRR_TOLERANCE:
+            return mid
+        if f_lo * f_mid < 0:
+            hi = mid
+        else:
+            lo, f_lo = mid, f_mid
+    return (lo + hi) / 2
+
+def client_returns(rows: Iterable[Any], date_from: str) -> Optional[Dict[str, Any]]:
+    # rows: fotos de un cliente ordenadas por día (day, nav, net_flow), desde el día anterior a date_from.
+    # Una sola pasada: TWR encadenado y flujos para XIRR.
+    begin_day = begin_nav = None
+    prev_nav = None
+    growth = 1.0
+    flows: List[Tuple[str, float]] = []
+    net_flow = 0.0
+    day = nav = None
+    for r in rows:
+        day, nav, flow = r["day"], r["nav"], r["net_flow"]
+        if begin_day is None:
+            # Foto del día anterior al rango, o la primera del cliente: NAV inicial con sus flujos incluidos
+            begin_day, begin_nav, prev_nav = day, nav, nav
+            continue
+        if prev_nav and prev_nav > 0:
+            growth *= (nav - flow) / prev_nav
+        if flow:
+            flows.append((day, flow))
+            net_flow += flow
+        prev_nav = nav
+    if begin_day is None:
+        return None
+    start = date.fromisoformat(begin_day)
+    cash_flows = [(0.0, -begin_nav)] if begin_nav else []
+    cash_flows += [((date.fromisoformat(d) - start).days / 365.0, -f) for d, f in flows]
+    years = (date.fromisoformat(day) - start).days / 365.0
+    cash_flows.append((years, nav))
+    return {
+        "date_from": begin_day if begin_day >= date_from else date_from,
+        "date_to": day,
+        "days": (date.fromisoformat(day) - start).days,
+        "begin_nav": begin_nav,
+        "end_nav": nav,
+        "net_flow": net_flow,
+        "gain": nav - begin_nav - net_flow,
+        "twr": growth - 1.0,
+        "xirr": xirr(cash_flows) if years > 0 else None,
+    }
+
+def _chunks(client_ids: List[int], size: int) -> List[Tuple[int, int]]:
+    return [(client_ids[i], client_ids[min(i + size, len(client_ids)) - 1]) for i in range(0, len(client_ids), size)]
+
+def compute_returns(conn: sqlite3.Connection, date_from: str, date_to: str,
+                    client_ids: Optional[List[int]] = None) -> List[Dict[str, Any]]:
+    # Todos los clientes (o client_ids) en una consulta por bloque de IDs, leyendo solo las fotos del rango
+    validate_date_str(date_from)
+    validate_date_str(date_to)
+    if date_from > date_to:
+        raise ValueError("La fecha inicial es posterior a la final")
+    ids = sorted(client_ids) if client_ids is not None else repo.list_client_ids(conn)
+    wanted = set(ids)
+    prev = _prev_day(date_from)
+    results: List[Dict[str, Any]] = []
+    for first_id, last_id in _chunks(ids, CLIENTS_PER_CHUNK):
+        names = {c["id"]: c["name"] for c in repo.get_clients_in_range(conn, first_id, last_id)}
+        current, rows = None, []
+        for r in repo.iter_nav_range(conn, first_id, last_id, prev, date_to):
+            if r["client_id"] != current:
+                if rows and current in wanted:
+                    results.append(dict(client_id=current, name=names.get(current), **client_returns(rows, date_from)))
+                current, rows = r["client_id"], []
+            rows.append(r)
+        if rows and current in wanted:
+            results.append(dict(client_id=current, name=names.get(current), **client_returns(rows, date_from)))
+    return results
+
+def write_returns(rows: List[Dict[str, Any]], path: str):
+    if path.endswith(".json"):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(rows, f, ensure_ascii=False, indent=1)
+        return
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=RETURN_FIELDS)
+        w.writeheader()
+        w.writerows(rows)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import argparse
+    from data.db import DB_FILE, get_connection, ensure_schema_and_seed
+    from services.snapshots import build_snapshots
+    p = argparse.ArgumentParser(description="TWR y XIRR por cliente para un período (p. ej. trimestral)")
+    p.add_argument("out", help="Archivo destino (.csv o .json)")
+    p.add_argument("--db", default=DB_FILE, help="Ruta de la base (por defecto investments.db)")
+    p.add_argument("--from", dest="date_from", required=True, help="Desde YYYY-MM-DD")
+    p.add_argument("--to", dest="date_to", required=True, help="Hasta YYYY-MM-DD (como máximo ayer)")
+    p.add_argument("--client", type=int, action="append", default=None, help="Solo este cliente (repetible)")
+    args = p.parse_args(argv)
+
+    conn = get_connection(args.db)
+    ensure_schema_and_seed(conn)
+    try:
+        # Fotos pendientes primero (incremental: si ya están al día no hace nada)
+        build_snapshots(conn, min(args.date_to, (date.today() - timedelta(days=1)).isoformat()))
+        started = time.perf_counter()
+        rows = compute_returns(conn, args.date_from, args.date_to, args.client)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return 1
+    finally:
+        conn.close()
+    write_returns(rows, args.out)
+    print(f"Rentabilidad de {len(rows)} clientes en {time.perf_counter() - started:.2f}s -> {args.out}")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
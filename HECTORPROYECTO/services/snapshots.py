@@ -0,0 +1,247 @@
+import sqlite3
+import time
+from datetime import date, timedelta
+from typing import Optional, List, Dict, Any, Tuple
+from data import repositorios as repo
+from utils.format import day_of, day_range
+from utils.validation import validate_date_str
+
+# Fotos diarias de NAV (nav_snapshots / nav_snapshot_positions): por cliente y día local, efectivo,
+# valor de mercado al cierre, NAV y flujo externo del día (depósitos - retiros), más cada posición abierta.
+# Cada día sale de la foto anterior más los eventos de ese día. Un cliente sin fotos parte del saldo de
+# apertura: capital y acciones actuales menos el efecto de todo el libro (así entra el capital inicial
+# de create_client, que no queda registrado como DEPOSIT). El efectivo queda anclado al capital actual:
+# la última foto cuadra con clients.capital_available y, si el libro no suma exacto (redondeos de datos
+# cargados), la diferencia queda en el saldo de apertura en vez de en cada día.
+# Por defecto se calcula hasta ayer: el día en curso todavía cambia. Las escrituras con fecha pasada
+# (importador, reprecio) borran las fotos desde ese día y la próxima corrida las rehace; lo mismo las
+# escrituras de PortfolioService si ya hay foto de hoy (--to con la fecha del día).
+CLIENTS_PER_CHUNK = 500
+FLUSH_ROWS = 50_000
+EPS = 1e-9
+
+def _yesterday() -> str:
+    return (date.today() - timedelta(days=1)).isoformat()
+
+def _next_day(day: str) -> str:
+    return (date.fromisoformat(day) + timedelta(days=1)).isoformat()
+
+def _days(first: str, last: str) -> List[str]:
+    d, end = date.fromisoformat(first), date.fromisoformat(last)
+    days = []
+    while d <= end:
+        days.append(d.isoformat())
+        d += timedelta(days=1)
+    return days
+
+def _chunks(client_ids: List[int], size: int) -> List[Tuple[int, int]]:
+    # Rangos contiguos de IDs (las consultas por rango usan los índices por client_id)
+    return [(client_ids[i], client_ids[min(i + size, len(client_ids)) - 1]) for i in range(0, len(client_ids), size)]
+
+def _effect(e) -> Tuple[float, float, float]:
+    # (Δ efectivo, Δ acciones, flujo externo) de un evento del libro
+    kind = e["type"]
+    if kind == "DEPOSIT":
+        return e["amount"], 0.0, e["amount"]
+    if kind == "WITHDRAW":
+        return -e["amount"], 0.0, -e["amount"]
+    if kind == "BUY":
+        return -e["amount"], e["shares"], 0.0
+    if kind == "SELL":
+        return e["amount"], -e["shares"], 0.0
+    return 0.0, 0.0, 0.0  # PRICE_UPDATE
+
+def _price_days(conn: sqlite3.Connection, days: List[str], bounds: List[int]) -> Tuple[Dict[int, float], List[Dict[int, float]]]:
+    # (precios al abrir el primer día, [cambios de cierre de cada día]) para todos los instrumentos
+    base = repo.get_prices_as_of(conn, bounds[0])
+    changes: List[Dict[int, float]] = [{} for _ in days]
+    i = 0
+    for p in repo.iter_price_points(conn, bounds[0], bounds[-1]):
+        while p["created_at"] >= bounds[i + 1]:
+            i += 1
+        changes[i][p["instrument_id"]] = p["price"]
+    return base, changes
+
+def _first_activity_ts(conn: sqlite3.Connection) -> Optional[int]:
+    row = conn.execute(
+        "SELECT MIN(ts) FROM (SELECT MIN(created_at) AS ts FROM clients UNION ALL "
+        "SELECT MIN(created_at) FROM cash_movements UNION ALL SELECT MIN(created_at) FROM investment_trades)"
+    ).fetchone()
+    return row[0]
+
+def _build_chunk(conn: sqlite3.Connection, first_id: int, last_id: int, days: List[str], bounds: List[int],
+                 base_prices: Dict[int, float], price_changes: List[Dict[int, float]]) -> Tuple[int, int]:
+    date_to = days[-1]
+    snap = repo.get_last_nav_state(conn, first_id, last_id)
+    clients = {c["id"]: c for c in repo.get_clients_in_range(conn, first_id, last_id)}
+    invs = {i["id"]: i for i in repo.get_investments_in_range(conn, first_id, last_id)}
+    # Primer día a calcular por cliente: el siguiente a su última foto, o el de su alta/primer evento
+    start_day: Dict[int, str] = {}
+    for cid, s in snap.items():
+        if s["day"] < date_to:
+            start_day[cid] = _next_day(s["day"])
+    anchored = [cid for cid in clients if cid not in snap]
+    since_ts = None
+    if not anchored:
+        if not start_day:
+            return 0, 0
+        since_ts = day_range(min(start_day.values()))[0]
+    events = list(repo.fetch_ledger_range(conn, first_id, last_id, since_ts))
+
+    cash: Dict[int, float] = {cid: s["cash"] for cid, s in snap.items()}
+    shares: Dict[int, Dict[int, float]] = {cid: dict(s["shares"]) for cid, s in snap.items()}
+    if anchored:
+        first_ts = {cid: clients[cid]["created_at"] for cid in anchored}
+        for cid in anchored:
+            cash[cid] = clients[cid]["capital_available"]
+            shares[cid] = {}
+        for inv in invs.values():
+            if inv["client_id"] in first_ts:
+                shares[inv["client_id"]][inv["id"]] = inv["shares"]
+        # Saldo de apertura = actual - efecto de todo el libro
+        for e in events:
+            cid = e["client_id"]
+            if cid not in first_ts:
+                continue
+            d_cash, d_shares, _flow = _effect(e)
+            cash[cid] -= d_cash
+            if d_shares:
+                shares[cid][e["investment_id"]] = shares[cid].get(e["investment_id"], 0.0) - d_shares
+            if first_ts[cid] is None or e["created_at"] < first_ts[cid]:
+                first_ts[cid] = e["created_at"]
+        for cid, ts in first_ts.items():
+            if ts is not None:
+                start_day[cid] = max(day_of(ts), days[0])
+    start_day = {cid: d for cid, d in start_day.items() if d <= date_to}
+    if not start_day:
+        return 0, 0
+    start_ts = {cid: day_range(d)[0] for cid, d in start_day.items()}
+    first_index = days.index(min(start_day.values()))
+
+    prices = dict(base_prices)
+    for changes in price_changes[:first_index]:
+        prices.update(changes)
+    # Sin precio registrado: el de la última operación de la posición, si no el costo promedio
+    trade_price: Dict[int, float] = {}
+    snapshots: List[tuple] = []
+    positions: List[tuple] = []
+    written = [0, 0]
+
+    def flush():
+        repo.insert_nav_snapshots_many(conn, snapshots, positions)
+        written[0] += len(snapshots)
+        written[1] += len(positions)
+        snapshots.clear()
+        positions.clear()
+
+    k = 0
+    active = sorted(start_day)
+    try:
+        conn.execute("BEGIN")
+        for i in range(first_index, len(days)):
+            day, end = days[i], bounds[i + 1]
+            prices.update(price_changes[i])
+            flows: Dict[int, float] = {}
+            while k < len(events) and events[k]["created_at"] < end:
+                e = events[k]
+                k += 1
+                cid = e["client_id"]
+                if cid not in start_ts or e["created_at"] < start_ts[cid]:
+                    continue  # ya incluido en la foto previa (o cliente sin días pendientes)
+                d_cash, d_shares, flow = _effect(e)
+                cash[cid] += d_cash
+                if flow:
+                    flows[cid] = flows.get(cid, 0.0) + flow
+                if e["investment_id"] is not None:
+                    trade_price[e["investment_id"]] = e["price"]
+                    if d_shares:
+                        held = shares[cid]
+                        held[e["investment_id"]] = held.get(e["investment_id"], 0.0) + d_shares
+            for cid in active:
+                if start_day[cid] > day:
+                    continue
+                market_value = 0.0
+                for inv_id, qty in shares[cid].items():
+                    if qty <= EPS:
+                        continue
+                    inv = invs[inv_id]
+                    price = prices.get(inv["instrument_id"])
+                    if price is None:
+                        price = trade_price.get(inv_id, inv["avg_price"])
+                    value = qty * price
+                    market_value += value
+                    positions.append((cid, day, inv_id, qty, price, value))
+                snapshots.append((cid, day, cash[cid], market_value, cash[cid] + market_value, flows.get(cid, 0.0)))
+            if len(positions) + len(snapshots) >= FLUSH_ROWS:
+                flush()
+        flush()
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return written[0], written[1]
+
+def build_snapshots(conn: sqlite3.Connection, date_to: Optional[str] = None,
+                    rebuild_from: Optional[str] = None) -> Dict[str, Any]:
+    # Incremental: cada cliente sigue desde su última foto hasta date_to (por defecto ayer).
+    # rebuild_from borra antes las fotos desde ese día (p. ej. tras corregir datos a mano).
+    date_to = date_to or _yesterday()
+    validate_date_str(date_to)
+    started = time.perf_counter()
+    if rebuild_from:
+        validate_date_str(rebuild_from)
+        try:
+            conn.execute("BEGIN")
+            repo.delete_nav_snapshots(conn, rebuild_from)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    stats = {"date_to": date_to, "days": 0, "snapshots": 0, "positions": 0, "seconds": 0.0}
+    last_days = repo.get_last_nav_days(conn)
+    client_ids = repo.list_client_ids(conn)
+    pending = [cid for cid in client_ids if last_days.get(cid, "") < date_to]
+    # Primer día de la corrida: el siguiente a la foto más vieja o, si hay clientes sin fotos, la primera actividad
+    candidates = [_next_day(last_days[cid]) for cid in pending if cid in last_days]
+    if any(cid not in last_days for cid in pending):
+        first_ts = _first_activity_ts(conn)
+        if first_ts is not None:
+            candidates.append(day_of(first_ts))
+    if not candidates or min(candidates) > date_to:
+        stats["seconds"] = time.perf_counter() - started
+        return stats
+    days = _days(min(candidates), date_to)
+    bounds = [day_range(d)[0] for d in days] + [day_range(date_to)[1]]
+    base_prices, price_changes = _price_days(conn, days, bounds)
+    for first_id, last_id in _chunks(pending, CLIENTS_PER_CHUNK):
+        n_snap, n_pos = _build_chunk(conn, first_id, last_id, days, bounds, base_prices, price_changes)
+        stats["snapshots"] += n_snap
+        stats["positions"] += n_pos
+    stats["days"] = len(days)
+    stats["seconds"] = time.perf_counter() - started
+    return stats
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import argparse
+    from data.db import DB_FILE, get_connection, ensure_schema_and_seed
+    p = argparse.ArgumentParser(description="Calcula las fotos diarias de NAV pendientes (incremental)")
+    p.add_argument("--db", default=DB_FILE, help="Ruta de la base (por defecto investments.db)")
+    p.add_argument("--to", dest="date_to", default=None, help="Hasta YYYY-MM-DD (por defecto ayer)")
+    p.add_argument("--rebuild-from", default=None, help="Rehacer desde YYYY-MM-DD (borra las fotos desde ese día)")
+    args = p.parse_args(argv)
+
+    conn = get_connection(args.db)
+    ensure_schema_and_seed(conn)
+    try:
+        stats = build_snapshots(conn, args.date_to, args.rebuild_from)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return 1
+    finally:
+        conn.close()
+    print(f"Fotos hasta {stats['date_to']}: {stats['snapshots']:,} días-cliente y {stats['positions']:,} posiciones "
+          f"({stats['days']} días) en {stats['seconds']:.2f}s")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,36 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Any, Optional
+from data.db import ConnectionManager
+from services.cache import PortfolioCache
+from services.portfolio import PortfolioService
+
+class DbWorker:
+    # Ejecuta operaciones de base fuera del hilo de Tk sobre un ConnectionManager:
+    # un único hilo escritor usa la conexión escritora y un pool de hilos atiende las
+    # lecturas con conexiones de solo lectura (WAL: no se bloquean entre sí).
+    # Con cache, todos los PortfolioService que entrega comparten la misma caché (las escrituras la invalidan).
+    def __init__(self, db: ConnectionManager, readers: int = 2, cache: Optional[PortfolioCache] = None):
+        self.db = db
+        self.cache = cache
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        self._readers = ThreadPoolExecutor(max_workers=max(1, min(readers, db.max_readers)),
+                                           thread_name_prefix="db-reader")
+
+    def _read(self, fn: Callable[..., Any], args, kwargs):
+        with self.db.reader() as conn:
+            return fn(PortfolioService(conn, cache=self.cache), *args, **kwargs)
+
+    def _write(self, fn: Callable[..., Any], args, kwargs):
+        with self.db.writer() as conn:
+            return fn(PortfolioService(conn, cache=self.cache), *args, **kwargs)
+
+    def submit_read(self, fn: Callable[..., Any], *args, **kwargs) -> Future:
+        # fn(svc, *args): svc es un PortfolioService sobre una conexión de solo lectura (svc.conn para repositorios)
+        return self._readers.submit(self._read, fn, args, kwargs)
+
+    def submit_write(self, fn: Callable[..., Any], *args, **kwargs) -> Future:
+        return self._writer.submit(self._write, fn, args, kwargs)
+
+    def shutdown(self, wait: bool = True):
+        self._readers.shutdown(wait=wait, cancel_futures=True)
+        self._writer.shutdown(wait=wait)
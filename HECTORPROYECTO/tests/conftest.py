@@ -0,0 +1,66 @@
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+
+# Los módulos se importan desde HECTORPROYECTO (paquetes sin __init__), como al correr la app
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from data.db import get_connection
+from data.migrations import migrate
+from data import repositorios as repo
+from utils.format import ts_from_datetime
+
+def ts(day: str, hour: int = 12) -> int:
+    # Marca de tiempo de "YYYY-MM-DD" a la hora dada (hora local, como day_of/day_range)
+    return ts_from_datetime(datetime.fromisoformat(day).replace(hour=hour))
+
+class Book:
+    # Libro con fechas pasadas: escribe como el importador (operación, saldo y posición), sin lotes
+    def __init__(self, conn):
+        self.conn = conn
+
+    def client(self, name: str, capital: float, day: str) -> int:
+        return self.conn.execute(
+            "INSERT INTO clients (name, created_at, capital_available) VALUES (?,?,?)", (name, ts(day, 9), capital)
+        ).lastrowid
+
+    def cash(self, client_id: int, kind: str, amount: float, day: str, hour: int = 12):
+        repo.insert_cash_movements_many(self.conn, [(client_id, kind, amount, None, ts(day, hour))])
+        repo.update_client_capital_many(self.conn, [(amount if kind == "DEPOSIT" else -amount, client_id)])
+
+    def price(self, company: str, price: float, day: str, hour: int = 12):
+        repo.insert_price_history_many(self.conn, [(repo.get_or_create_instrument(self.conn, company), price, ts(day, hour))])
+
+    def trade(self, client_id: int, kind: str, company: str, shares: float, price: float, day: str,
+              hour: int = 12) -> int:
+        inv = repo.get_investment_by_company(self.conn, client_id, company)
+        if inv is None:
+            instrument_id = repo.get_or_create_instrument(self.conn, company)
+            repo.create_investments_many(self.conn, [(client_id, instrument_id, company, price, 0.0, ts(day, hour))])
+            inv = repo.get_investment_by_company(self.conn, client_id, company)
+        amount = shares * price
+        repo.insert_trades_many(self.conn, [(inv["id"], kind, shares, price, amount, ts(day, hour), None)])
+        if kind == "BUY":
+            held = inv["shares"] + shares
+            repo.update_investment(self.conn, inv["id"], avg_price=(inv["avg_price"] * inv["shares"] + amount) / held,
+                                   shares=held)
+            repo.update_client_capital_many(self.conn, [(-amount, client_id)])
+        else:
+            repo.update_investment(self.conn, inv["id"], shares=inv["shares"] - shares)
+            repo.update_client_capital_many(self.conn, [(amount, client_id)])
+        self.price(company, price, day, hour)
+        return self.conn.execute("SELECT MAX(id) FROM investment_trades").fetchone()[0]
+
+@pytest.fixture
+def conn(tmp_path):
+    # Base vacía con el esquema al día (sin el cliente demo de ensure_schema_and_seed)
+    c = get_connection(str(tmp_path / "test.db"))
+    migrate(c)
+    yield c
+    c.close()
+
+@pytest.fixture
+def book(conn):
+    return Book(conn)
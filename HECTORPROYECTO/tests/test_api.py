@@ -0,0 +1,59 @@
+import threading
+
+import pytest
+
+from data.db import ConnectionManager
+from data.migrations import migrate
+from services import api
+from services.worker import DbWorker
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    monkeypatch.setattr(api, "WRITE_TIMEOUT", 0.2)
+    db = ConnectionManager(str(tmp_path / "api.db"), readers=2)
+    with db.writer() as conn:
+        migrate(conn)
+    s = api.ApiServer(("127.0.0.1", 0), db, DbWorker(db, readers=1))
+    yield s
+    s.server_close()
+    s.worker.shutdown(wait=True)
+    db.close()
+
+def _clients(server):
+    with server.db.reader() as conn:
+        return [r["name"] for r in conn.execute("SELECT name FROM clients ORDER BY id")]
+
+def _create(name):
+    def write(svc):
+        with svc.conn:
+            return svc.conn.execute("INSERT INTO clients (name, created_at) VALUES (?, 0)", (name,)).lastrowid
+    return write
+
+def test_write_returns_result(server):
+    assert server.write(_create("Ana")) == 1
+    assert _clients(server) == ["Ana"]
+
+def test_timed_out_write_still_queued_is_cancelled(server):
+    # El hilo escritor está ocupado: la escritura en cola vence, se cancela y nunca se aplica
+    release = threading.Event()
+    busy = server.worker.submit_write(lambda svc: release.wait(5))
+    with pytest.raises(api.ApiError) as e:
+        server.write(_create("Luis"))
+    assert e.value.status == 503
+    release.set()
+    busy.result()
+    assert server.write(_create("Ana")) == 1
+    assert _clients(server) == ["Ana"]
+
+def test_timed_out_running_write_may_still_apply(server):
+    # Ya empezó: no se puede cancelar, el 504 avisa que puede aplicarse (y se aplica)
+    release = threading.Event()
+    def slow(svc):
+        release.wait(5)
+        return _create("Luis")(svc)
+    with pytest.raises(api.ApiError) as e:
+        server.write(slow)
+    assert e.value.status == 504
+    release.set()
+    server.worker.submit_write(lambda svc: None).result()
+    assert _clients(server) == ["Luis"]
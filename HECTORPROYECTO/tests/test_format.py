@@ -0,0 +1,67 @@
+import csv
+import time
+from datetime import datetime
+
+import pytest
+
+from data import repositorios as repo
+from services.exports import export_client_history
+from utils.format import day_of, day_range, fmt_ts, ts_from_datetime
+from utils.validation import parse_timestamp
+
+@pytest.fixture(params=["UTC", "Europe/Madrid", "America/Santiago"])
+def local_tz(request, monkeypatch):
+    # Zonas con y sin cambio de hora; time.tzset no existe en Windows
+    if not hasattr(time, "tzset"):
+        pytest.skip("sin time.tzset")
+    monkeypatch.setenv("TZ", request.param)
+    time.tzset()
+    yield request.param
+    monkeypatch.undo()
+    time.tzset()
+
+@pytest.mark.parametrize("day", ["2024-01-01", "2024-02-29", "2024-03-31", "2024-04-07", "2024-09-08",
+                                 "2024-10-27", "2024-12-31"])
+def test_day_range_boundaries(local_tz, day):
+    start, end = day_range(day)
+    # Semiabierto: el primer y el último microsegundo son del día; el fin ya es del siguiente
+    assert day_of(start) == day_of(end - 1) == day
+    assert day_of(start - 1) < day < day_of(end)
+    # En Chile el 2024-09-08 empieza a la 01:00 (las 00:00 no existen)
+    first = "01:00:00" if (local_tz, day) == ("America/Santiago", "2024-09-08") else "00:00:00"
+    assert fmt_ts(start, precise=True) == f"{day} {first}.000000"
+    assert fmt_ts(end - 1, precise=True) == f"{day} 23:59:59.999999"
+    # Días de 23 o 25 horas en los cambios de hora
+    assert (end - start) // 3_600_000_000 in (23, 24, 25)
+
+def test_day_range_span_is_contiguous(local_tz):
+    start, end = day_range("2024-03-30", "2024-11-02")
+    days = []
+    t = start
+    while t < end:
+        days.append(day_of(t))
+        t = day_range(days[-1])[1]
+    assert t == end
+    assert days[0] == "2024-03-30" and days[-1] == "2024-11-02" and len(days) == len(set(days)) == 218
+
+def test_fmt_ts_precise_sorts_and_round_trips():
+    base = ts_from_datetime(datetime(2024, 5, 6, 7, 8, 9))
+    stamps = [base + d for d in (999_999, 0, 1, 10, 500_000, 1_000_000)]
+    texts = [fmt_ts(s, precise=True) for s in stamps]
+    assert sorted(texts) == [fmt_ts(s, precise=True) for s in sorted(stamps)]
+    assert [parse_timestamp(t) for t in texts] == stamps
+    assert fmt_ts(base + 999_999) == fmt_ts(base) == "2024-05-06 07:08:09"
+    assert fmt_ts(None, precise=True) == ""
+
+def test_export_keeps_sub_second_order(book, tmp_path):
+    # Varios movimientos dentro del mismo segundo: el CSV los deja distinguibles y en orden
+    cid = book.client("Ana", 0.0, "2024-05-06")
+    base = ts_from_datetime(datetime(2024, 5, 6, 12))
+    repo.insert_cash_movements_many(book.conn, [(cid, "DEPOSIT", float(i + 1), None, base + off)
+                                                for i, off in enumerate((5, 250_000, 250_001, 999_999))])
+    path = tmp_path / "h.csv"
+    assert export_client_history(book.conn, str(path), cid) == 4
+    with open(path, newline="", encoding="utf-8") as f:
+        fechas = [r["fecha"] for r in csv.DictReader(f)]
+    assert fechas == sorted(fechas, reverse=True)
+    assert [parse_timestamp(x) for x in fechas] == [base + 999_999, base + 250_001, base + 250_000, base + 5]
@@ -0,0 +1,96 @@
+import pytest
+
+from data import repositorios as repo
+from services.portfolio import PortfolioService
+
+def _history(book):
+    # Varias filas por marca de tiempo (empates de created_at entre efectivo e inversión y dentro de cada tabla)
+    cid = book.client("Ana", 0.0, "2024-03-01")
+    book.cash(cid, "DEPOSIT", 5000.0, "2024-03-01")
+    book.cash(cid, "DEPOSIT", 300.0, "2024-03-01")
+    book.trade(cid, "BUY", "ACME", 10, 50.0, "2024-03-01")
+    book.trade(cid, "BUY", "BETA", 4, 25.0, "2024-03-01")
+    book.cash(cid, "WITHDRAW", 100.0, "2024-03-02")
+    book.trade(cid, "BUY", "ACME", 2, 50.0, "2024-03-02")
+    book.trade(cid, "SELL", "BETA", 1, 30.0, "2024-03-02")
+    book.cash(cid, "WITHDRAW", 100.0, "2024-03-02")
+    book.trade(cid, "SELL", "ACME", 3, 55.0, "2024-03-03", hour=10)
+    book.cash(cid, "DEPOSIT", 75.0, "2024-03-03", hour=10)
+    book.trade(cid, "BUY", "CORP", 1, 75.0, "2024-03-03", hour=10)
+    return cid
+
+def _key(r, sort):
+    return ((r["sort_key"],) if sort else ()) + (r["created_at"], r["src"], r["id"])
+
+def _pages(svc, cid, limit, **kw):
+    rows, cursor, pages = [], None, 0
+    while True:
+        page, cursor = svc.get_client_history_page(cid, cursor=cursor, limit=limit, **kw)
+        rows += page
+        pages += 1
+        if cursor is None:
+            return rows, pages
+
+@pytest.mark.parametrize("descending", [True, False])
+@pytest.mark.parametrize("sort", [None, *repo.HISTORY_SORTS])
+def test_full_scan_follows_the_keyset(book, sort, descending):
+    # El orden de SQL es exactamente el de la tupla del cursor: (clave,) created_at, src, id
+    cid = _history(book)
+    rows = list(repo.iter_client_history(book.conn, cid, None, None, sort=sort, descending=descending))
+    keys = [_key(r, sort) for r in rows]
+    assert len(keys) == len(set(keys)) == 11
+    assert keys == sorted(keys, reverse=descending)
+
+@pytest.mark.parametrize("limit", [1, 2, 3, 4, 11, 50])
+@pytest.mark.parametrize("descending", [True, False])
+@pytest.mark.parametrize("sort", [None, "monto", "empresa", "tipo"])
+def test_pages_concatenate_to_the_full_history(book, sort, descending, limit):
+    # Los cortes de página caen en medio de empates de created_at y de la clave de orden sin perder ni repetir filas
+    cid = _history(book)
+    svc = PortfolioService(book.conn)
+    full = list(svc.iter_client_history(cid, sort=sort, descending=descending))
+    rows, pages = _pages(svc, cid, limit, sort=sort, descending=descending)
+    assert [r["cursor"] for r in rows] == [r["cursor"] for r in full]
+    # Si el total es múltiplo del límite hace falta una página vacía para saber que se terminó
+    assert pages == len(full) // limit + 1
+
+def test_sort_by_amount_and_company(book):
+    cid = _history(book)
+    svc = PortfolioService(book.conn)
+    asc = [r["monto_cambio_capital"] for r in svc.iter_client_history(cid, sort="monto", descending=False)]
+    assert asc == sorted(asc) and asc[0] == -500.0 and asc[-1] == 5000.0
+    desc = [r["monto_cambio_capital"] for r in svc.iter_client_history(cid, sort="monto")]
+    assert desc == sorted(asc, reverse=True)
+    companies = [r["empresa"] for r in svc.iter_client_history(cid, sort="empresa", descending=False)]
+    assert companies == [""] * 5 + ["ACME"] * 3 + ["BETA"] * 2 + ["CORP"]
+    # A igual empresa desempata la fecha, en la misma dirección
+    acme = [r for r in svc.iter_client_history(cid, sort="empresa") if r["empresa"] == "ACME"]
+    assert [r["tipo"] for r in acme] == ["SELL", "BUY", "BUY"]
+
+def test_pages_within_a_date_range(book):
+    cid = _history(book)
+    svc = PortfolioService(book.conn)
+    rows, _ = _pages(svc, cid, 2, date_from="2024-03-02", date_to="2024-03-02")
+    assert len(rows) == 4
+    assert {r["fecha"][:10] for r in rows} == {"2024-03-02"}
+    assert [r["cursor"] for r in rows] == [r["cursor"] for r in svc.iter_client_history(cid, day="2024-03-02")]
+
+def test_history_since_returns_only_new_rows(book):
+    cid = _history(book)
+    svc = PortfolioService(book.conn)
+    page, _ = svc.get_client_history_page(cid, limit=3)
+    head = page[0]["cursor"]
+    assert svc.get_client_history_since(cid, head) == []
+    # Una fila con el mismo created_at y la misma tabla que la cabeza, pero id mayor, también es nueva
+    assert page[0]["tipo"] == "BUY" and page[0]["empresa"] == "CORP"
+    book.trade(cid, "BUY", "CORP", 1, 80.0, "2024-03-03", hour=10)
+    book.trade(cid, "BUY", "ACME", 1, 60.0, "2024-03-04")
+    book.cash(cid, "WITHDRAW", 20.0, "2024-03-05")
+    new = svc.get_client_history_since(cid, head)
+    assert [(r["tipo"], r["fecha"][:10]) for r in new] == [
+        ("WITHDRAW", "2024-03-05"), ("BUY", "2024-03-04"), ("BUY", "2024-03-03")]
+    assert new == list(svc.iter_client_history(cid))[:3]
+    # El resto de la primera página sigue detrás de las nuevas, sin repetirse
+    assert [r["cursor"] for r in list(svc.iter_client_history(cid))[3:6]] == [r["cursor"] for r in page]
+    assert svc.get_client_history_since(cid, new[0]["cursor"]) == []
+    assert svc.get_client_history_since(cid, head, day="2024-03-05") == new[:1]
@@ -0,0 +1,39 @@
+from services.importer import import_trades
+
+FIELDS = ("type", "client_id", "company", "amount", "shares", "price", "note", "timestamp")
+
+def _rows(*lines):
+    # Como read_trade_file: (número de línea, fila); la línea 1 es el encabezado
+    return [(i, dict(zip(FIELDS, line))) for i, line in enumerate(lines, start=2)]
+
+def test_sell_dated_before_its_buy_is_rejected(conn, book):
+    cid = book.client("Ana", 5000.0, "2024-01-01")
+    report = import_trades(conn, _rows(
+        ("BUY", str(cid), "NEWCO", "1000", "", "10", "", "2024-05-01 10:00:00"),
+        ("SELL", str(cid), "NEWCO", "", "50", "12", "", "2024-04-01 10:00:00"),
+    ))
+    assert not report["applied"]
+    assert report["errors"] == ["Línea 3: Inversión no existe"]
+    assert conn.execute("SELECT COUNT(*) FROM investment_trades").fetchone()[0] == 0
+
+def test_rows_are_validated_in_date_order(conn, book):
+    # En el archivo la venta va primero, pero por fecha la compra es anterior
+    cid = book.client("Ana", 5000.0, "2024-01-01")
+    report = import_trades(conn, _rows(
+        ("SELL", str(cid), "NEWCO", "", "50", "12", "", "2024-05-02 10:00:00"),
+        ("BUY", str(cid), "NEWCO", "1000", "", "10", "", "2024-05-01 10:00:00"),
+    ))
+    assert report["applied"] and report["errors"] == []
+    lot = conn.execute("SELECT shares, remaining FROM lots").fetchone()
+    assert tuple(lot) == (100.0, 50.0)
+    assert conn.execute("SELECT realized_pnl FROM investment_trades WHERE type = 'SELL'").fetchone()[0] == 100.0
+
+def test_rows_before_stored_activity_are_rejected(conn, book):
+    cid = book.client("Ana", 5000.0, "2024-01-01")
+    book.cash(cid, "DEPOSIT", 100.0, "2024-03-01")
+    report = import_trades(conn, _rows(
+        ("WITHDRAW", str(cid), "", "4000", "", "", "", "2024-02-01 10:00:00"),
+        ("DEPOSIT", str(cid), "", "10", "", "", "", "2024-03-02 10:00:00"),
+    ))
+    assert report["errors"] == ["Línea 2: Fecha anterior al último movimiento registrado del cliente"]
+    assert conn.execute("SELECT capital_available FROM clients").fetchone()[0] == 5100.0
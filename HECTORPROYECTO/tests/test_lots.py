@@ -0,0 +1,150 @@
+import pytest
+
+from data import repositorios as repo
+from services.importer import import_trades
+from services.lots import match_lots, rebuild_lots
+from services.portfolio import PortfolioService
+
+def _rebuild(conn, method=None):
+    conn.execute("BEGIN")
+    stats = rebuild_lots(conn, method)
+    conn.execute("COMMIT")
+    return stats
+
+def _assert_lots_match_shares(conn):
+    for inv in conn.execute("SELECT id, shares FROM investments"):
+        remaining = conn.execute("SELECT COALESCE(SUM(remaining), 0) FROM lots WHERE investment_id = ?",
+                                 (inv["id"],)).fetchone()[0]
+        assert remaining == pytest.approx(inv["shares"])
+
+def _realized(conn, trade_id):
+    return conn.execute("SELECT realized_pnl FROM investment_trades WHERE id = ?", (trade_id,)).fetchone()[0]
+
+def _remaining(conn):
+    return [r[0] for r in conn.execute("SELECT remaining FROM lots ORDER BY created_at, id")]
+
+def test_match_lots_leaves_uncovered_shares_without_pnl():
+    lots = [{"id": 1, "remaining": 2.0, "price": 10.0}]
+    matches, realized = match_lots(lots, 5.0, 12.0, "FIFO")
+    assert matches == [(1, 2.0, 20.0, 24.0), (None, 3.0, 36.0, 36.0)]
+    assert realized == pytest.approx(4.0)
+    assert lots[0]["remaining"] == 0.0
+    with pytest.raises(ValueError):
+        match_lots(lots, 1.0, 12.0, "HIFO")
+
+# Compras 10 @ 10 y 10 @ 20; ventas 15 @ 30 y 3 @ 25 (la segunda consume parte de un lote)
+@pytest.mark.parametrize("method, first, second, remaining", [
+    ("FIFO", 10 * 20 + 5 * 10, 3 * 5, [0.0, 2.0]),
+    ("LIFO", 10 * 10 + 5 * 20, 3 * 15, [2.0, 0.0]),
+    ("AVG", 15 * 15, 3 * 10, [1.0, 1.0]),
+])
+def test_realized_pnl_by_method(conn, book, method, first, second, remaining):
+    cid = book.client("Ana", 1000.0, "2024-01-01")
+    book.trade(cid, "BUY", "ACME", 10, 10.0, "2024-01-02")
+    book.trade(cid, "BUY", "ACME", 10, 20.0, "2024-01-03")
+    sell1 = book.trade(cid, "SELL", "ACME", 15, 30.0, "2024-01-04")
+    sell2 = book.trade(cid, "SELL", "ACME", 3, 25.0, "2024-01-05")
+    stats = _rebuild(conn, method)
+    assert (stats["lots"], stats["sells"], stats["unmatched"]) == (2, 2, 0)
+    assert _realized(conn, sell1) == pytest.approx(first)
+    assert _realized(conn, sell2) == pytest.approx(second)
+    assert _remaining(conn) == pytest.approx(remaining)
+    # El resultado de cada venta es la suma de sus cruces por lote
+    for sell in (sell1, sell2):
+        total = conn.execute("SELECT SUM(realized_pnl) FROM lot_matches WHERE sell_trade_id = ?", (sell,)).fetchone()[0]
+        assert total == pytest.approx(_realized(conn, sell))
+    _assert_lots_match_shares(conn)
+
+def test_opening_lot_for_legacy_position(conn, book):
+    # Posición cargada antes del registro de operaciones: 35 acciones a 12 sin BUY, luego una venta
+    cid = book.client("Ana", 0.0, "2024-01-01")
+    instrument_id = repo.get_or_create_instrument(conn, "ACME")
+    repo.create_investments_many(conn, [(cid, instrument_id, "ACME", 12.0, 35.0, 0),
+                                        (cid, repo.get_or_create_instrument(conn, "GLOBEX"), "GLOBEX", 50.0, 4.0, 0)])
+    sell = book.trade(cid, "SELL", "ACME", 5, 15.0, "2024-01-02")
+    stats = _rebuild(conn, "FIFO")
+    assert stats["unmatched"] == 0
+    lots = {r["company"]: r for r in conn.execute(
+        "SELECT inv.company, l.buy_trade_id, l.shares, l.remaining, l.price "
+        "FROM lots l JOIN investments inv ON inv.id = l.investment_id")}
+    assert tuple(lots["ACME"]) == ("ACME", None, 35.0, 30.0, 12.0)
+    # Sin ninguna operación: solo el lote inicial
+    assert tuple(lots["GLOBEX"]) == ("GLOBEX", None, 4.0, 4.0, 50.0)
+    assert _realized(conn, sell) == pytest.approx(5 * 3.0)
+    _assert_lots_match_shares(conn)
+
+def _assert_rows_close(a, b):
+    assert len(a) == len(b)
+    for x, y in zip(a, b):
+        assert len(x) == len(y)
+        for u, v in zip(x, y):
+            assert u == (pytest.approx(v) if isinstance(v, float) else v)
+
+def _state(conn):
+    # Lotes y cruces identificados por su BUY (los ids de lotes cambian al rehacer)
+    lots = sorted(tuple(r) for r in conn.execute(
+        "SELECT investment_id, buy_trade_id, shares, remaining, price, created_at FROM lots"))
+    matches = sorted(tuple(r) for r in conn.execute(
+        "SELECT m.sell_trade_id, l.buy_trade_id, m.shares, m.cost, m.proceeds, m.realized_pnl "
+        "FROM lot_matches m LEFT JOIN lots l ON l.id = m.lot_id"))
+    pnl = [tuple(r) for r in conn.execute("SELECT id, realized_pnl FROM investment_trades WHERE type = 'SELL' ORDER BY id")]
+    return lots, matches, pnl
+
+@pytest.mark.parametrize("method", ["FIFO", "LIFO", "AVG"])
+def test_rebuild_matches_incremental(conn, method):
+    svc = PortfolioService(conn)
+    cid = repo.create_client(conn, "Ana", None, None, 10_000.0)
+    svc.buy(cid, "ACME", 1000.0, 10.0)
+    svc.buy(cid, "ACME", 600.0, 12.0)
+    svc.buy(cid, "GLOBEX", 500.0, 50.0)
+    acme = repo.get_investment_by_company(conn, cid, "ACME")["id"]
+    svc.sell(acme, 70.0, 15.0, None, method)
+    svc.buy(cid, "ACME", 400.0, 20.0)
+    svc.sell(acme, 30.0, 18.0, None, method)
+    svc.sell(repo.get_investment_by_company(conn, cid, "GLOBEX")["id"], 10.0, 40.0, None, method)
+    incremental = _state(conn)
+    assert len(incremental[2]) == 3 and all(pnl is not None for _id, pnl in incremental[2])
+    _assert_lots_match_shares(conn)
+    # Sin method: cada venta con el que se eligió al vender
+    _rebuild(conn)
+    rebuilt = _state(conn)
+    for before, after in zip(incremental, rebuilt):
+        _assert_rows_close(after, before)
+    _assert_lots_match_shares(conn)
+
+def _sell_after_two_buys(conn, method):
+    svc = PortfolioService(conn)
+    cid = repo.create_client(conn, "Ana", None, None, 10_000.0)
+    svc.buy(cid, "ACME", 1000.0, 10.0)
+    svc.buy(cid, "ACME", 2000.0, 20.0)
+    inv_id = repo.get_investment_by_company(conn, cid, "ACME")["id"]
+    svc.sell(inv_id, 50.0, 30.0, None, method)
+    return cid, conn.execute("SELECT MAX(id) FROM investment_trades").fetchone()[0]
+
+@pytest.mark.parametrize("method, realized", [("LIFO", 50 * 10.0), ("AVG", 50 * 15.0)])
+def test_sell_method_survives_rebuild(conn, method, realized):
+    _cid, sell = _sell_after_two_buys(conn, method)
+    assert _realized(conn, sell) == pytest.approx(realized)
+    _rebuild(conn)
+    assert _realized(conn, sell) == pytest.approx(realized)
+    assert conn.execute("SELECT lot_method FROM investment_trades WHERE id = ?", (sell,)).fetchone()[0] == method
+    _assert_lots_match_shares(conn)
+
+@pytest.mark.parametrize("method, realized", [("LIFO", 50 * 10.0), ("AVG", 50 * 15.0)])
+def test_sell_method_survives_import(conn, method, realized):
+    # El importador rehace los lotes de las posiciones que toca
+    cid, sell = _sell_after_two_buys(conn, method)
+    report = import_trades(conn, [(2, {"type": "BUY", "client_id": str(cid), "company": "ACME", "amount": "300",
+                                       "price": "30", "timestamp": ""})])
+    assert report["applied"]
+    assert conn.execute("SELECT COUNT(*) FROM lots").fetchone()[0] == 3
+    assert _realized(conn, sell) == pytest.approx(realized)
+    _assert_lots_match_shares(conn)
+
+def test_rebuild_with_method_changes_every_sell(conn):
+    _cid, sell = _sell_after_two_buys(conn, "LIFO")
+    assert _rebuild(conn, "FIFO")["method"] == "FIFO"
+    assert _realized(conn, sell) == pytest.approx(50 * 20.0)
+    assert conn.execute("SELECT lot_method FROM investment_trades WHERE id = ?", (sell,)).fetchone()[0] == "FIFO"
+    _rebuild(conn)
+    assert _realized(conn, sell) == pytest.approx(50 * 20.0)
@@ -0,0 +1,131 @@
+from data.db import get_connection
+from data.migrations import migrate, get_version, SCHEMA_VERSION
+from data import repositorios as repo
+from utils.format import fmt_ts
+
+# Esquema previo al versionado (user_version = 0): precios por investments.id y fechas como texto local
+LEGACY_SCHEMA = """
+CREATE TABLE clients (
+  id INTEGER PRIMARY KEY, name TEXT NOT NULL, email TEXT UNIQUE, phone TEXT, created_at TEXT,
+  capital_available REAL NOT NULL DEFAULT 0.0
+);
+CREATE TABLE investments (
+  id INTEGER PRIMARY KEY, client_id INTEGER NOT NULL REFERENCES clients(id) ON DELETE CASCADE,
+  company TEXT NOT NULL, avg_price REAL NOT NULL DEFAULT 0, shares REAL NOT NULL DEFAULT 0, created_at TEXT
+);
+CREATE TABLE cash_movements (
+  id INTEGER PRIMARY KEY, client_id INTEGER NOT NULL REFERENCES clients(id) ON DELETE CASCADE,
+  type TEXT CHECK(type IN ('DEPOSIT','WITHDRAW')) NOT NULL, amount REAL NOT NULL, note TEXT, created_at TEXT
+);
+CREATE TABLE investment_trades (
+  id INTEGER PRIMARY KEY, investment_id INTEGER NOT NULL REFERENCES investments(id) ON DELETE CASCADE,
+  type TEXT CHECK(type IN ('BUY','SELL','PRICE_UPDATE')) NOT NULL, shares REAL DEFAULT 0,
+  price REAL NOT NULL, amount REAL NOT NULL, created_at TEXT, note TEXT
+);
+CREATE TABLE price_history (
+  id INTEGER PRIMARY KEY, investment_id INTEGER NOT NULL REFERENCES investments(id) ON DELETE CASCADE,
+  price REAL NOT NULL, created_at TEXT
+);
+CREATE INDEX idx_cash_movements_client_date ON cash_movements(client_id, created_at);
+CREATE INDEX idx_trades_investment_date ON investment_trades(investment_id, created_at);
+CREATE INDEX idx_investments_client ON investments(client_id);
+"""
+
+def _legacy_db(path):
+    conn = get_connection(path)
+    conn.executescript(LEGACY_SCHEMA)
+    conn.executemany("INSERT INTO clients VALUES (?,?,?,?,?,?)", [
+        (1, "Ana Pérez", "ana@example.com", "555-1", "2024-01-02 09:00:00", 500.0),
+        (2, "Luis Gómez", "luis@example.com", "555-2", "2024-01-03 09:00:00", 1000.0),
+    ])
+    # ACME la tienen los dos clientes: su serie de precios se unifica en un instrumento
+    conn.executemany("INSERT INTO investments VALUES (?,?,?,?,?,?)", [
+        (1, 1, "ACME", 10.0, 30.0, "2024-01-05 10:00:00"),
+        (2, 2, "ACME", 12.0, 10.0, "2024-01-06 10:00:00"),
+        (3, 2, "GLOBEX", 50.0, 4.0, "2024-01-06 11:00:00"),
+    ])
+    conn.executemany("INSERT INTO investment_trades VALUES (?,?,?,?,?,?,?,?)", [
+        (1, 1, "BUY", 50.0, 10.0, 500.0, "2024-01-05 10:00:00", None),
+        (2, 1, "SELL", 20.0, 11.0, 220.0, "2024-02-01 10:00:00", None),
+        (3, 2, "BUY", 10.0, 12.0, 120.0, "2024-01-06 10:00:00", None),
+        (4, 3, "BUY", 4.0, 50.0, 200.0, "2024-01-06 11:00:00", None),
+    ])
+    conn.executemany("INSERT INTO cash_movements VALUES (?,?,?,?,?,?)", [
+        (1, 1, "DEPOSIT", 280.0, None, "2024-01-04 08:00:00"),
+        (2, 2, "WITHDRAW", 50.0, None, "2024-03-01 08:00:00"),
+    ])
+    conn.executemany("INSERT INTO price_history VALUES (?,?,?,?)", [
+        (1, 1, 10.0, "2024-01-05 10:00:00"),
+        (2, 1, 11.0, "2024-02-01 10:00:00"),
+        (3, 2, 12.0, "2024-01-06 10:00:00"),
+        (4, 2, 11.0, "2024-02-01 10:00:00"),  # mismo punto que el id 2: se colapsa
+        (5, 3, 50.0, "2024-01-06 11:00:00"),
+        (6, 3, 55.0, "2024-03-01 12:00:00"),
+    ])
+    return conn
+
+def _schema(conn):
+    return conn.execute("SELECT type, name, sql FROM sqlite_master ORDER BY type, name").fetchall()
+
+def test_migrate_legacy_db_to_latest(tmp_path):
+    conn = _legacy_db(str(tmp_path / "legacy.db"))
+    assert migrate(conn) == 0
+    assert get_version(conn) == SCHEMA_VERSION
+    assert conn.execute("PRAGMA foreign_key_check").fetchall() == []
+    assert conn.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+
+    # Un instrumento por empresa y latest_price igual al último punto de cada serie
+    symbols = {r["symbol"]: r["id"] for r in conn.execute("SELECT id, symbol FROM instruments")}
+    assert set(symbols) == {"ACME", "GLOBEX"}
+    assert conn.execute("SELECT COUNT(*) FROM price_history").fetchone()[0] == 5
+    assert repo.check_latest_prices(conn) == []
+    assert repo.get_last_prices(conn, list(symbols.values())) == {symbols["ACME"]: 11.0, symbols["GLOBEX"]: 55.0}
+
+    # Fechas a microsegundos UTC: vuelven al mismo texto en hora local
+    trade = conn.execute("SELECT created_at FROM investment_trades WHERE id = 2").fetchone()[0]
+    assert isinstance(trade, int)
+    assert fmt_ts(trade) == "2024-02-01 10:00:00"
+    assert conn.execute("SELECT COUNT(*) FROM clients WHERE typeof(created_at) != 'integer'").fetchone()[0] == 0
+
+    # Lotes del historial: el saldo de cada posición cuadra con sus acciones
+    for inv in conn.execute("SELECT id, shares FROM investments"):
+        remaining = conn.execute("SELECT SUM(remaining) FROM lots WHERE investment_id = ?", (inv["id"],)).fetchone()[0]
+        assert abs(remaining - inv["shares"]) < 1e-9
+    assert conn.execute("SELECT realized_pnl FROM investment_trades WHERE id = 2").fetchone()[0] == 20.0
+    conn.close()
+
+def test_migrate_twice_is_noop(tmp_path):
+    conn = _legacy_db(str(tmp_path / "legacy.db"))
+    migrate(conn)
+    schema = _schema(conn)
+    rows = {t: conn.execute(f"SELECT * FROM {t} ORDER BY 1").fetchall()
+            for t in ("clients", "investments", "investment_trades", "price_history", "latest_price", "lots")}
+    assert migrate(conn) == SCHEMA_VERSION
+    assert _schema(conn) == schema
+    for table, before in rows.items():
+        assert [tuple(r) for r in conn.execute(f"SELECT * FROM {table} ORDER BY 1")] == [tuple(r) for r in before]
+    conn.close()
+
+def test_fresh_db_migrates(conn):
+    assert get_version(conn) == SCHEMA_VERSION
+    assert conn.execute("PRAGMA foreign_key_check").fetchall() == []
+
+def _lot_state(conn):
+    lots = conn.execute("SELECT investment_id, buy_trade_id, shares, remaining, price, created_at FROM lots "
+                        "ORDER BY investment_id, created_at, buy_trade_id").fetchall()
+    matches = conn.execute("SELECT m.sell_trade_id, l.buy_trade_id, m.shares, m.cost, m.realized_pnl "
+                           "FROM lot_matches m LEFT JOIN lots l ON l.id = m.lot_id ORDER BY 1, 2").fetchall()
+    pnl = conn.execute("SELECT id, realized_pnl FROM investment_trades ORDER BY id").fetchall()
+    return [[tuple(r) for r in rows] for rows in (lots, matches, pnl)]
+
+def test_v5_lots_match_lot_engine(tmp_path):
+    # El paso 5 lleva su propia copia del replay FIFO: debe dar lo mismo que services.lots
+    from services.lots import rebuild_lots
+    conn = _legacy_db(str(tmp_path / "legacy.db"))
+    migrate(conn)
+    migrated = _lot_state(conn)
+    conn.execute("BEGIN")
+    rebuild_lots(conn)
+    conn.execute("COMMIT")
+    assert _lot_state(conn) == migrated
+    conn.close()
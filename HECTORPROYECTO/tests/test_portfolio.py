@@ -0,0 +1,22 @@
+import pytest
+
+from services.cache import PortfolioCache
+from services.portfolio import PortfolioService
+
+def test_create_client_invalidates_cache(conn):
+    # Un get_client de un id todavía inexistente deja None en la caché; crear el cliente lo invalida
+    svc = PortfolioService(conn, cache=PortfolioCache())
+    assert svc.get_client(1) is None
+    assert svc.get_client(1) is None and svc.cache.stats()["hits"] == {"client": 1}
+    client_id = svc.create_client("  Ana ", "ana@x.com", None, 250.0)
+    assert client_id == 1
+    client = svc.get_client(client_id)
+    assert (client["name"], client["email"], client["capital_available"]) == ("Ana", "ana@x.com", 250.0)
+    svc.deposit(client_id, 50.0)
+    assert svc.get_client(client_id)["capital_available"] == 300.0
+
+@pytest.mark.parametrize("name, capital", [("", 0.0), ("   ", 10.0), ("Ana", -1.0), ("Ana", None)])
+def test_create_client_validates(conn, name, capital):
+    with pytest.raises(ValueError):
+        PortfolioService(conn).create_client(name, initial_capital=capital)
+    assert conn.execute("SELECT COUNT(*) FROM clients").fetchone()[0] == 0
@@ -0,0 +1,82 @@
+import random
+
+import pytest
+
+from data import repositorios as repo
+from services.pricing import bulk_update_prices
+from conftest import ts
+
+def _latest(conn, instrument_id):
+    r = conn.execute("SELECT price, created_at, price_history_id FROM latest_price WHERE instrument_id = ?",
+                     (instrument_id,)).fetchone()
+    return tuple(r) if r else None
+
+def test_backdated_insert_keeps_latest(conn):
+    acme = repo.get_or_create_instrument(conn, "ACME")
+    repo.insert_price_history(conn, acme, 100.0)
+    now = _latest(conn, acme)
+    # Cierres de días pasados cargados después: quedan en el historial, no pisan el precio vigente
+    repo.insert_price_history_many(conn, [(acme, 90.0, ts("2024-01-02")), (acme, 95.0, ts("2024-01-03"))])
+    assert _latest(conn, acme) == now
+    assert repo.get_last_price(conn, acme) == 100.0
+    assert repo.check_latest_prices(conn) == []
+
+def test_out_of_order_batch_takes_newest(conn):
+    acme = repo.get_or_create_instrument(conn, "ACME")
+    beta = repo.get_or_create_instrument(conn, "BETA")
+    repo.insert_price_history_many(conn, [
+        (acme, 12.0, ts("2024-01-05")), (beta, 7.0, ts("2024-01-01")), (acme, 10.0, ts("2024-01-01")),
+        (beta, 8.0, ts("2024-01-09")), (acme, 11.0, ts("2024-01-03")), (beta, 6.0, ts("2024-01-02")),
+    ])
+    assert repo.get_last_prices(conn, [acme, beta]) == {acme: 12.0, beta: 8.0}
+    # Lote posterior más viejo que lo guardado: no cambia nada
+    repo.insert_price_history_many(conn, [(acme, 1.0, ts("2024-01-04")), (beta, 1.0, ts("2024-01-08"))])
+    assert repo.get_last_prices(conn, [acme, beta]) == {acme: 12.0, beta: 8.0}
+    assert repo.check_latest_prices(conn) == []
+
+def test_same_timestamp_higher_id_wins(conn):
+    # Empate de created_at (archivos de cierre con una sola marca): gana el último cargado, igual que el historial
+    acme = repo.get_or_create_instrument(conn, "ACME")
+    repo.insert_price_history_many(conn, [(acme, 10.0, ts("2024-01-05")), (acme, 11.0, ts("2024-01-05"))])
+    repo.insert_price_history_many(conn, [(acme, 12.0, ts("2024-01-05"))])
+    assert repo.get_last_price(conn, acme) == 12.0
+    assert repo.check_latest_prices(conn) == []
+
+def test_random_batches_match_backfill(conn):
+    rnd = random.Random(7)
+    ids = [repo.get_or_create_instrument(conn, f"I{i}") for i in range(20)]
+    for _ in range(30):
+        repo.insert_price_history_many(conn, [
+            (rnd.choice(ids), round(rnd.uniform(1, 100), 2), ts(f"2024-01-{rnd.randint(1, 28):02d}", rnd.randint(9, 17)))
+            for _ in range(rnd.randint(1, 40))
+        ])
+        if rnd.random() < 0.2:
+            repo.insert_price_history(conn, rnd.choice(ids), 50.0)
+    assert repo.check_latest_prices(conn) == []
+    incremental = [tuple(r) for r in conn.execute("SELECT * FROM latest_price ORDER BY instrument_id")]
+    repo.backfill_latest_prices(conn)
+    assert [tuple(r) for r in conn.execute("SELECT * FROM latest_price ORDER BY instrument_id")] == incremental
+
+def test_refresh_since_repairs_and_check_detects(conn):
+    acme = repo.get_or_create_instrument(conn, "ACME")
+    repo.insert_price_history_many(conn, [(acme, 10.0, ts("2024-01-02"))])
+    mark = conn.execute("SELECT MAX(id) FROM price_history").fetchone()[0]
+    # Filas escritas sin pasar por el repositorio: check lo detecta y refresh_latest_prices_since lo repara
+    conn.executemany("INSERT INTO price_history (instrument_id, price, created_at) VALUES (?,?,?)",
+                     [(acme, 13.0, ts("2024-01-04")), (acme, 12.0, ts("2024-01-03"))])
+    assert [r["instrument_id"] for r in repo.check_latest_prices(conn)] == [acme]
+    repo.refresh_latest_prices_since(conn, mark)
+    assert repo.get_last_price(conn, acme) == 13.0
+    assert repo.check_latest_prices(conn) == []
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 1000])
+def test_bulk_price_file_in_chunks(conn, chunk_size):
+    repo.get_or_create_instrument(conn, "ACME")
+    repo.get_or_create_instrument(conn, "BETA")
+    rows = [(2, "ACME", "11", "2024-01-03"), (3, "BETA", "5", "2024-01-09 10:00:00"), (4, "ACME", "12", "2024-01-05"),
+            (5, "ACME", "10", "2024-01-01"), (6, "BETA", "4", "2024-01-09 09:59:59.999999"), (7, "OTRA", "1", "")]
+    stats = bulk_update_prices(conn, rows, chunk_size)
+    assert stats["applied"] == 5 and stats["unknown"] == {"OTRA": 1}
+    ids = repo.get_instrument_ids(conn)
+    assert repo.get_last_prices(conn, [ids["ACME"], ids["BETA"]]) == {ids["ACME"]: 12.0, ids["BETA"]: 5.0}
+    assert repo.check_latest_prices(conn) == []
@@ -0,0 +1,60 @@
+import pytest
+
+from services import returns
+from services.returns import client_returns, compute_returns, xirr
+from services.snapshots import build_snapshots
+
+def _row(day, nav, flow=0.0):
+    return {"day": day, "nav": nav, "net_flow": flow}
+
+def test_twr_with_mid_period_flow():
+    # +10%, depósito de 50 sin rendimiento, +10%: el flujo no cuenta como ganancia
+    rows = [_row("2024-03-31", 100.0), _row("2024-04-01", 110.0),
+            _row("2024-04-02", 160.0, 50.0), _row("2024-04-03", 176.0)]
+    r = client_returns(rows, "2024-04-01")
+    assert r["twr"] == pytest.approx(1.1 * 1.1 - 1)
+    assert r["net_flow"] == 50.0
+    assert r["gain"] == pytest.approx(26.0)
+    assert (r["date_from"], r["date_to"], r["days"]) == ("2024-04-01", "2024-04-03", 3)
+    # XIRR: -100 al inicio, -50 el día 2 y +176 al final
+    flows = [(0.0, -100.0), (2 / 365, -50.0), (3 / 365, 176.0)]
+    assert sum(a * (1 + r["xirr"]) ** -t for t, a in flows) == pytest.approx(0.0, abs=1e-6)
+
+def test_new_client_starts_at_first_snapshot():
+    rows = [_row("2024-04-10", 1000.0, 1000.0), _row("2024-04-11", 1010.0)]
+    r = client_returns(rows, "2024-04-01")
+    assert (r["date_from"], r["begin_nav"]) == ("2024-04-10", 1000.0)
+    assert r["twr"] == pytest.approx(0.01)
+
+def test_xirr_newton():
+    assert xirr([(0.0, -100.0), (1.0, 110.0)]) == pytest.approx(0.1)
+    assert xirr([(0.0, -100.0), (1.0, -100.0), (2.0, 231.0)]) == pytest.approx(0.1)
+
+def test_xirr_bisection_fallback(monkeypatch):
+    # Newton salta por debajo de -100%: la tasa sale por bisección
+    assert xirr([(0.0, -1.0), (1.0, 0.001)]) == pytest.approx(-0.999, abs=1e-6)
+    # Sin iteraciones de Newton la bisección llega a la misma tasa
+    monkeypatch.setattr(returns, "XIRR_MAX_ITER", 0)
+    assert xirr([(0.0, -100.0), (1.0, -100.0), (2.0, 231.0)]) == pytest.approx(0.1, abs=1e-6)
+
+def test_xirr_without_sign_change():
+    assert xirr([(0.0, -100.0), (1.0, -10.0)]) is None
+    assert xirr([(0.0, 0.0)]) is None
+
+def test_compute_returns_over_snapshots(conn, book):
+    cid = book.client("Ana", 200.0, "2024-01-01")
+    book.cash(cid, "DEPOSIT", 1000.0, "2024-01-02")
+    book.trade(cid, "BUY", "ACME", 10, 50.0, "2024-01-03")
+    book.price("ACME", 60.0, "2024-01-05")
+    book.cash(cid, "WITHDRAW", 100.0, "2024-01-07")
+    build_snapshots(conn, "2024-01-08")
+    [r] = compute_returns(conn, "2024-01-02", "2024-01-08")
+    assert (r["client_id"], r["name"]) == (cid, "Ana")
+    assert (r["begin_nav"], r["end_nav"], r["net_flow"]) == (200.0, 1200.0, 900.0)
+    # Solo el reprecio (500 -> 600 sobre un NAV de 1200) es rendimiento
+    assert r["twr"] == pytest.approx(1300 / 1200 - 1)
+    assert r["gain"] == pytest.approx(100.0)
+    assert r["xirr"] > 0
+    assert compute_returns(conn, "2024-01-02", "2024-01-08", [cid + 1]) == []
+    with pytest.raises(ValueError):
+        compute_returns(conn, "2024-01-08", "2024-01-02")
@@ -0,0 +1,121 @@
+from datetime import date
+
+import pytest
+
+from data import repositorios as repo
+from services.portfolio import PortfolioService
+from services.snapshots import build_snapshots
+
+def _scenario(book):
+    # Capital inicial 200 (alta, sin DEPOSIT), depósito, compra, reprecio, venta parcial y retiro
+    cid = book.client("Ana", 0.0, "2024-01-01")
+    book.conn.execute("UPDATE clients SET capital_available = 200 WHERE id = ?", (cid,))
+    book.cash(cid, "DEPOSIT", 1000.0, "2024-01-02")
+    book.trade(cid, "BUY", "ACME", 10, 50.0, "2024-01-03")
+    book.price("ACME", 60.0, "2024-01-05")
+    book.trade(cid, "SELL", "ACME", 5, 60.0, "2024-01-06")
+    book.cash(cid, "WITHDRAW", 100.0, "2024-01-07")
+    return cid
+
+def _rows(conn):
+    snaps = [tuple(r) for r in conn.execute("SELECT * FROM nav_snapshots ORDER BY client_id, day")]
+    positions = [tuple(r) for r in conn.execute("SELECT * FROM nav_snapshot_positions ORDER BY client_id, day, investment_id")]
+    return snaps, positions
+
+def _assert_same(a, b):
+    assert len(a) == len(b)
+    for x, y in zip(a, b):
+        assert x[:2] == y[:2]
+        assert x[2:] == pytest.approx(y[2:])
+
+def test_nav_by_day(conn, book):
+    cid = _scenario(book)
+    build_snapshots(conn, "2024-01-08")
+    nav = {r["day"]: dict(r) for r in conn.execute("SELECT * FROM nav_snapshots WHERE client_id = ?", (cid,))}
+    assert sorted(nav) == [f"2024-01-0{d}" for d in range(1, 9)]
+    assert (nav["2024-01-01"]["cash"], nav["2024-01-01"]["nav"]) == (200.0, 200.0)
+    assert (nav["2024-01-02"]["nav"], nav["2024-01-02"]["net_flow"]) == (1200.0, 1000.0)
+    assert (nav["2024-01-03"]["cash"], nav["2024-01-03"]["market_value"]) == (700.0, 500.0)
+    assert nav["2024-01-05"]["market_value"] == 600.0
+    assert (nav["2024-01-06"]["cash"], nav["2024-01-06"]["market_value"]) == (1000.0, 300.0)
+    assert (nav["2024-01-07"]["nav"], nav["2024-01-07"]["net_flow"]) == (1200.0, -100.0)
+    # El efectivo se ancla al capital actual: la última foto cuadra con clients.capital_available
+    assert nav["2024-01-08"]["cash"] == conn.execute("SELECT capital_available FROM clients").fetchone()[0]
+
+def test_opening_balance_absorbs_ledger_residue(conn, book):
+    # Capital que no cuadra con el libro (redondeos de una carga vieja): la diferencia queda en la apertura
+    cid = _scenario(book)
+    conn.execute("UPDATE clients SET capital_available = capital_available + 0.004 WHERE id = ?", (cid,))
+    build_snapshots(conn, "2024-01-08")
+    cash = dict(conn.execute("SELECT day, cash FROM nav_snapshots WHERE client_id = ?", (cid,)).fetchall())
+    assert cash["2024-01-01"] == pytest.approx(200.004)
+    assert cash["2024-01-08"] == pytest.approx(900.004)
+
+def test_incremental_equals_full(conn, book):
+    _scenario(book)
+    other = book.client("Luis", 500.0, "2024-01-04")
+    book.trade(other, "BUY", "ACME", 4, 55.0, "2024-01-05", hour=15)
+    for day in ("2024-01-02", "2024-01-05", "2024-01-05", "2024-01-09"):
+        build_snapshots(conn, day)
+    incremental = _rows(conn)
+    stats = build_snapshots(conn, "2024-01-09", rebuild_from="2024-01-01")
+    assert stats["snapshots"] == len(incremental[0])
+    full = _rows(conn)
+    _assert_same(incremental[0], full[0])
+    _assert_same(incremental[1], full[1])
+
+def test_backdated_insert_invalidates(conn, book):
+    cid = _scenario(book)
+    build_snapshots(conn, "2024-01-09")
+    book.cash(cid, "DEPOSIT", 50.0, "2024-01-04")
+    days = [r[0] for r in conn.execute("SELECT day FROM nav_snapshots WHERE client_id = ? ORDER BY day", (cid,))]
+    assert days == ["2024-01-01", "2024-01-02", "2024-01-03"]
+    assert build_snapshots(conn, "2024-01-09")["snapshots"] == 6
+    nav = dict(conn.execute("SELECT day, nav FROM nav_snapshots WHERE client_id = ?", (cid,)).fetchall())
+    assert nav["2024-01-04"] == 1250.0
+    assert nav["2024-01-09"] == 1250.0
+    incremental = _rows(conn)
+    build_snapshots(conn, "2024-01-09", rebuild_from="2024-01-01")
+    _assert_same(incremental[0], _rows(conn)[0])
+
+def test_backdated_price_invalidates_all_clients(conn, book):
+    _scenario(book)
+    build_snapshots(conn, "2024-01-09")
+    book.price("ACME", 70.0, "2024-01-08")
+    assert conn.execute("SELECT MAX(day) FROM nav_snapshots").fetchone()[0] == "2024-01-07"
+    build_snapshots(conn, "2024-01-09")
+    assert conn.execute("SELECT market_value FROM nav_snapshots WHERE day = '2024-01-09'").fetchone()[0] == 350.0
+
+def test_writes_after_todays_snapshot(conn):
+    # Con --to hoy la foto del día queda escrita; depósitos, operaciones y precios posteriores la invalidan
+    today = date.today().isoformat()
+    svc = PortfolioService(conn)
+    cid = repo.create_client(conn, "Ana", None, None, 1000.0)
+    other = repo.create_client(conn, "Luis", None, None, 500.0)
+
+    def nav():
+        build_snapshots(conn, today)
+        return [dict(r) for r in svc.get_nav_series(cid, today, today)]
+
+    def equity(client_id):
+        cash = repo.get_client(conn, client_id)["capital_available"]
+        return cash + sum(p["current_value"] for p in svc.get_client_portfolio(client_id))
+
+    assert nav()[0]["nav"] == 1000.0
+    svc.deposit(cid, 200.0)
+    assert [(r["nav"], r["net_flow"]) for r in nav()] == [(1200.0, 200.0)]
+    svc.buy(cid, "ACME", 600.0, 10.0)
+    inv_id = repo.get_investment_by_company(conn, cid, "ACME")["id"]
+    assert nav()[0]["market_value"] == pytest.approx(600.0)
+    svc.update_company_price("ACME", 12.0)
+    assert nav()[0]["nav"] == pytest.approx(equity(cid)) == pytest.approx(1320.0)
+    svc.sell(inv_id, 10.0, 12.0)
+    svc.withdraw(cid, 50.0)
+    [row] = nav()
+    assert row["nav"] == pytest.approx(equity(cid))
+    assert row["net_flow"] == pytest.approx(150.0)
+    # Un precio solo invalida a quienes tienen el instrumento
+    assert conn.execute("SELECT COUNT(*) FROM nav_snapshots WHERE client_id = ?", (other,)).fetchone()[0] == 1
+    svc.update_company_price("ACME", 13.0)
+    assert conn.execute("SELECT COUNT(*) FROM nav_snapshots WHERE client_id = ?", (other,)).fetchone()[0] == 1
+    assert conn.execute("SELECT COUNT(*) FROM nav_snapshots WHERE client_id = ?", (cid,)).fetchone()[0] == 0
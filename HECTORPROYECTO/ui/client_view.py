@@ -1,21 +1,23 @@
 from ttkbootstrap import ttk
 from ttkbootstrap.constants import *
-from services.portfolio import PortfolioService
-from data import repositorios as repo
 from ui.dialogs import AmountDialog, BuyDialog, SellDialog, UpdatePriceDialog
 from ui.widgets import CollapsibleFrame, SortableTreeview, ToolTip
+from ui.tasks import UiTasks
 from utils.format import money
 from utils.validation import is_valid_date
-from utils.exports import export_history_csv
+from services.exports import export_client_history
 from tkinter import messagebox, filedialog
 
+# Filas de historial por página (se piden más al acercarse al final del scroll)
+HISTORY_PAGE_SIZE = 200
+
 class ClientView(ttk.Frame):
     def __init__(self, master, app, client_id: int):
         super().__init__(master, padding=8)
         self.app = app
-        self.conn = app.conn
         self.client_id = client_id
-        self.svc = PortfolioService(self.conn)
+        self.tasks = UiTasks(self, app.worker, on_busy=self._set_busy)
+        self._positions = {}
         self._build()
 
     # ---------- UI ----------
@@ -26,6 +28,8 @@ class ClientView(ttk.Frame):
         self.lbl_title = ttk.Label(header, text="", font=("Segoe UI", 18, "bold"))
         self.lbl_title.pack(side="left")
         ttk.Button(header, text="← Volver", command=self.app.show_home, bootstyle="secondary").pack(side="right")
+        self.lbl_status = ttk.Label(header, text="", bootstyle="secondary")
+        self.lbl_status.pack(side="right", padx=10)
 
         capbar = ttk.Frame(self)
         capbar.grid(row=1, column=0, sticky="ew", padx=12)
@@ -89,7 +93,11 @@ class ClientView(ttk.Frame):
         ttk.Button(filt, text="Exportar CSV", command=self.export_csv, bootstyle="success").pack(side="right")
 
         hcols = ("fecha","tipo_general","empresa","detalle","monto","shares","price")
-        self.tvh = SortableTreeview(self.hist.body, columns=hcols, show="headings", height=10, bootstyle="secondary")
+        hist_table = ttk.Frame(self.hist.body)
+        hist_table.pack(fill="both", expand=True)
+        # El historial es paginado: ordenar por una columna recarga con ORDER BY en la consulta
+        self.tvh = SortableTreeview(hist_table, columns=hcols, show="headings", height=10, bootstyle="secondary",
+                                    on_sort=self._sort_history)
         headers = ["Fecha/Hora","Tipo","Empresa","Detalle","Δ Capital","Shares","Precio"]
         for c, t in zip(hcols, headers):
             self.tvh.heading(c, text=t)
@@ -97,40 +105,63 @@ class ClientView(ttk.Frame):
             if c == "detalle": w = 380
             if c == "empresa": w = 160
             self.tvh.column(c, width=w, anchor="center")
-        self.tvh.pack(fill="both", expand=True)
+        self.tvh.pack(side="left", fill="both", expand=True)
+        self._hist_scroll = ttk.Scrollbar(hist_table, command=self.tvh.yview, bootstyle="round")
+        self.tvh.configure(yscrollcommand=self._on_history_scroll)
+        self._hist_scroll.pack(side="right", fill="y")
+        self._hist_filter = {}
+        self._hist_order = {"sort": None, "descending": True}  # None: por fecha, más nuevas primero
+        self._hist_cursor = None
+        self._hist_top = None  # cursor de la fila más nueva mostrada (para traer solo lo nuevo)
+        self._hist_done = True
+        self._hist_loading = False
 
         self.refresh_all()
 
     # ---------- Helpers ----------
-    def current_client(self):
-        return repo.get_client(self.conn, self.client_id)
+    def _set_busy(self, busy: bool):
+        self.lbl_status.configure(text="Cargando…" if busy else "")
+        self.configure(cursor="watch" if busy else "")
+
+    def _show_error(self, e: Exception):
+        messagebox.showerror("Error", str(e))
 
     def refresh_all(self):
-        cli = self.current_client()
+        self._refresh_portfolio()
+        # Historial (sin filtros)
+        self.load_history(None, None)
+
+    def _refresh_portfolio(self):
+        cid = self.client_id
+        self.tasks.read("refresh", lambda svc: (svc.get_client(cid), svc.get_client_portfolio(cid)),
+                        self._show_refresh, self._show_error)
+
+    def _refresh_after_write(self):
+        # Tras una acción: posiciones por diferencia y solo las filas nuevas del historial, con el filtro activo
+        self._refresh_portfolio()
+        self._load_new_history()
+
+    def _show_refresh(self, result):
+        cli, portfolio = result
         if not cli:
             messagebox.showerror("Error", "Cliente no encontrado")
             self.app.show_home()
             return
         self.lbl_title.configure(text=cli["name"])
         self.lbl_capital.configure(text=f"Capital: {money(cli['capital_available'])}")
-        # Portafolio
-        for i in self.tv.get_children():
-            self.tv.delete(i)
-        portfolio = self.svc.get_client_portfolio(self.client_id)
-        for row in portfolio:
-            self.tv.insert("", "end", iid=str(row["investment_id"]),
-                           values=(row["company"],
-                                   f"{row['shares']:.4f}",
-                                   money(row["avg_price"]),
-                                   money(row["current_price"]),
-                                   money(row["current_value"]),
-                                   money(row["pnl"])))
-        # Historial (sin filtros)
-        self.load_history(None, None)
-
-        # Disable action buttons until selection
-        for b in (self.btn_buy_more, self.btn_sell, self.btn_update):
-            b.configure(state="disabled")
+        # Portafolio: solo se tocan las filas que cambiaron
+        self._positions = {row["investment_id"]: row for row in portfolio}
+        self.tv.sync((row["investment_id"],
+                      (row["company"],
+                       f"{row['shares']:.4f}",
+                       money(row["avg_price"]),
+                       money(row["current_price"]),
+                       money(row["current_value"]),
+                       money(row["pnl"])),
+                      (row["company"].lower(), row["shares"], row["avg_price"], row["current_price"],
+                       row["current_value"], row["pnl"])) for row in portfolio)
+        # La selección se conserva si la posición sigue; botones según eso
+        self.on_select_row()
 
     def on_select_row(self, _e=None):
         sel = self.get_selected_investment_id()
@@ -149,16 +180,19 @@ class ClientView(ttk.Frame):
         return None
 
     # ---------- Actions ----------
+    def _run_action(self, fn, done_msg: str):
+        # Escritura en el hilo de base; al terminar se avisa y se refresca desde el hilo de Tk
+        def on_done(_result):
+            messagebox.showinfo("Listo", done_msg)
+            self._refresh_after_write()
+        self.tasks.write(fn, on_done, self._show_error)
+
     def on_deposit(self):
         dlg = AmountDialog(self, title="Ingresar capital", label="Monto a depositar")
         self.wait_window(dlg)
         if dlg.result:
-            try:
-                self.svc.deposit(self.client_id, dlg.result["amount"], dlg.result["note"])
-                messagebox.showinfo("Listo", "Depósito registrado")
-                self.refresh_all()
-            except Exception as e:
-                messagebox.showerror("Error", str(e))
+            res, cid = dlg.result, self.client_id
+            self._run_action(lambda svc: svc.deposit(cid, res["amount"], res["note"]), "Depósito registrado")
 
     def on_withdraw(self):
         dlg = AmountDialog(self, title="Retirar capital", label="Monto a retirar")
@@ -166,23 +200,16 @@ class ClientView(ttk.Frame):
         if dlg.result:
             if not messagebox.askyesno("Confirmar", "¿Confirmar retiro de capital?"):
                 return
-            try:
-                self.svc.withdraw(self.client_id, dlg.result["amount"], dlg.result["note"])
-                messagebox.showinfo("Listo", "Retiro registrado")
-                self.refresh_all()
-            except Exception as e:
-                messagebox.showerror("Error", str(e))
+            res, cid = dlg.result, self.client_id
+            self._run_action(lambda svc: svc.withdraw(cid, res["amount"], res["note"]), "Retiro registrado")
 
     def on_buy_new(self):
         dlg = BuyDialog(self, "Ingresar inversión")
         self.wait_window(dlg)
         if dlg.result:
-            try:
-                self.svc.buy(self.client_id, dlg.result["company"], dlg.result["amount"], dlg.result["price"], dlg.result["note"])
-                messagebox.showinfo("Listo", "Compra registrada")
-                self.refresh_all()
-            except Exception as e:
-                messagebox.showerror("Error", str(e))
+            res, cid = dlg.result, self.client_id
+            self._run_action(lambda svc: svc.buy(cid, res["company"], res["amount"], res["price"], res["note"]),
+                             "Compra registrada")
 
     def on_buy_more(self):
         inv_id = self.get_selected_investment_id()
@@ -196,29 +223,21 @@ class ClientView(ttk.Frame):
                 return
             price = d2.result["amount"]
             note = dlg.result["note"] or d2.result["note"]
-            inv = repo.get_investment(self.conn, inv_id)
-            try:
-                self.svc.buy(inv["client_id"], inv["company"], dlg.result["amount"], price, note)
-                messagebox.showinfo("Listo", "Compra adicional registrada")
-                self.refresh_all()
-            except Exception as e:
-                messagebox.showerror("Error", str(e))
+            amount, cid = dlg.result["amount"], self.client_id
+            company = self._positions[inv_id]["company"]
+            self._run_action(lambda svc: svc.buy(cid, company, amount, price, note), "Compra adicional registrada")
 
     def on_sell(self):
         inv_id = self.get_selected_investment_id()
         if not inv_id: return
-        inv = repo.get_investment(self.conn, inv_id)
-        dlg = SellDialog(self, default_shares=f"{inv['shares']:.4f}")
+        pos = self._positions[inv_id]
+        dlg = SellDialog(self, default_shares=f"{pos['shares']:.4f}")
         self.wait_window(dlg)
         if dlg.result:
             if not messagebox.askyesno("Confirmar", "¿Confirmar venta (SELL)?"):
                 return
-            try:
-                self.svc.sell(inv_id, dlg.result["shares"], dlg.result["price"], dlg.result["note"])
-                messagebox.showinfo("Listo", "Venta registrada")
-                self.refresh_all()
-            except Exception as e:
-                messagebox.showerror("Error", str(e))
+            res = dlg.result
+            self._run_action(lambda svc: svc.sell(inv_id, res["shares"], res["price"], res["note"]), "Venta registrada")
 
     def on_update_price(self):
         inv_id = self.get_selected_investment_id()
@@ -226,30 +245,99 @@ class ClientView(ttk.Frame):
         dlg = UpdatePriceDialog(self)
         self.wait_window(dlg)
         if dlg.result:
-            try:
-                self.svc.update_price(inv_id, dlg.result["price"], dlg.result["note"])
-                messagebox.showinfo("Listo", "Precio actualizado")
-                self.refresh_all()
-            except Exception as e:
-                messagebox.showerror("Error", str(e))
+            res = dlg.result
+            self._run_action(lambda svc: svc.update_price(inv_id, res["price"], res["note"]), "Precio actualizado")
 
     # ---------- Historial ----------
     def load_history(self, day: str | None, rng: tuple[str, str] | None):
-        for i in self.tvh.get_children():
-            self.tvh.delete(i)
-        day_arg = day
+        self.tvh.clear()
         date_from = date_to = None
         if rng:
             date_from, date_to = rng
-        data = self.svc.get_client_history(self.client_id, day=day_arg, date_from=date_from, date_to=date_to)
-        self._last_history_cache = data  # para exportar
-        for row in data:
-            self.tvh.insert("", "end", values=(
-                row["fecha"], row["tipo_general"], row["empresa"], row["detalle"],
-                f"{row['monto_cambio_capital']:.2f}" if row["monto_cambio_capital"] != "" else "",
-                f"{row['shares']:.4f}" if isinstance(row["shares"], (float, int)) and row["shares"] != "" else row["shares"],
-                f"{row['price']:.2f}" if isinstance(row["price"], (float, int)) else "",
-            ))
+        self._hist_filter = {"day": day, "date_from": date_from, "date_to": date_to}
+        self._hist_cursor = None
+        self._hist_top = None
+        self.tasks.cancel("history_new")
+        self._hist_done = False
+        self._hist_loading = False
+        self._load_history_page()
+
+    def _load_history_page(self):
+        if self._hist_done or self._hist_loading:
+            return
+        self._hist_loading = True
+        cid, cursor = self.client_id, self._hist_cursor
+        filt = dict(self._hist_filter, **self._hist_order)
+        # Mismo canal: un filtro u orden nuevo descarta las páginas pendientes del anterior
+        self.tasks.read("history",
+                        lambda svc: svc.get_client_history_page(cid, cursor=cursor, limit=HISTORY_PAGE_SIZE, **filt),
+                        self._show_history_page, self._show_error)
+
+    def _sort_history(self, col, descending):
+        # Columna del historial -> clave de orden en SQL; "detalle" empieza por el tipo de movimiento
+        sort = {"fecha": None, "detalle": "tipo", "monto": "monto"}.get(col, col)
+        self._hist_order = {"sort": sort, "descending": descending}
+        self._reload_history()
+
+    def _reload_history(self):
+        # Vuelve a la primera página con el filtro y el orden activos
+        f = self._hist_filter
+        rng = (f["date_from"], f["date_to"]) if f.get("date_from") else None
+        self.load_history(f.get("day"), rng)
+
+    @staticmethod
+    def _history_iid(row) -> str:
+        # (..., created_at, src, id) -> "src-id": único entre efectivo y operaciones
+        src, rid = row["cursor"][-2:]
+        return f"{src}-{rid}"
+
+    @staticmethod
+    def _history_values(row) -> tuple:
+        return (
+            row["fecha"], row["tipo_general"], row["empresa"], row["detalle"],
+            f"{row['monto_cambio_capital']:.2f}" if row["monto_cambio_capital"] != "" else "",
+            f"{row['shares']:.4f}" if isinstance(row["shares"], (float, int)) and row["shares"] != "" else row["shares"],
+            f"{row['price']:.2f}" if isinstance(row["price"], (float, int)) else "",
+        )
+
+    def _show_history_page(self, result):
+        page, self._hist_cursor = result
+        self._hist_loading = False
+        self._hist_done = self._hist_cursor is None
+        if page and self._hist_top is None:
+            self._hist_top = page[0]["cursor"]
+        for row in page:
+            iid = self._history_iid(row)
+            if not self.tvh.exists(iid):
+                self.tvh.insert("", "end", iid=iid, values=self._history_values(row))
+
+    def _load_new_history(self):
+        if self._hist_top is None or self._hist_order["sort"] or not self._hist_order["descending"]:
+            # Nada mostrado todavía (o primera página en camino), u otro orden que el de fecha descendente
+            # (las filas nuevas no van necesariamente arriba): recargar con el mismo filtro
+            self._reload_history()
+            return
+        cid, top, filt = self.client_id, self._hist_top, dict(self._hist_filter)
+        self.tasks.read("history_new", lambda svc: svc.get_client_history_since(cid, top, **filt),
+                        lambda rows: self._show_new_history(rows, top), self._show_error)
+
+    def _show_new_history(self, rows, top):
+        if top != self._hist_top or not rows:
+            return  # el historial se recargó mientras tanto
+        # Vienen de la más nueva a la más vieja: se insertan arriba en ese orden
+        index = 0
+        for row in rows:
+            iid = self._history_iid(row)
+            if not self.tvh.exists(iid):
+                self.tvh.insert("", index, iid=iid, values=self._history_values(row))
+                index += 1
+        self._hist_top = rows[0]["cursor"]
+
+    def _on_history_scroll(self, first, last):
+        self._hist_scroll.set(first, last)
+        # Cerca del final: pedir la siguiente página fuera del callback de scroll
+        if float(last) >= 0.9 and not self._hist_done and not self._hist_loading:
+            self.after_idle(self._load_history_page)
 
     def apply_day(self):
         day = self.e_day.get().strip()
@@ -276,14 +364,14 @@ class ClientView(ttk.Frame):
         self.load_history(None, None)
 
     def export_csv(self):
-        if not getattr(self, "_last_history_cache", None):
+        if not self.tvh.get_children():
             messagebox.showinfo("Exportar", "No hay datos de historial para exportar")
             return
-        path = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV","*.csv")], title="Guardar historial")
+        path = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV","*.csv"), ("CSV comprimido","*.csv.gz")], title="Guardar historial")
         if not path:
             return
-        try:
-            export_history_csv(path, self._last_history_cache)
-            messagebox.showinfo("Éxito", f"Historial exportado a:\n{path}")
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
+        # Historial completo del filtro activo, en streaming desde la base (no solo las páginas cargadas)
+        cid, filt = self.client_id, dict(self._hist_filter)
+        self.tasks.read("export", lambda svc: export_client_history(svc.conn, path, cid, **filt),
+                        lambda _n: messagebox.showinfo("Éxito", f"Historial exportado a:\n{path}"),
+                        self._show_error)
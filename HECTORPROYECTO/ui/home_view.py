@@ -2,19 +2,33 @@ from ttkbootstrap import ttk
 from ttkbootstrap.constants import *
 from data import repositorios as repo
 from ui.dialogs import CreateClientDialog
+from ui.tasks import UiTasks
+from ui.widgets import VirtualGrid
 from utils.format import money
 
+SEARCH_DEBOUNCE_MS = 250  # espera tras la última tecla antes de consultar
+SEARCH_LIMIT = 1000       # resultados por búsqueda, los más relevantes
+CARD_COLUMNS = 4
+CARD_HEIGHT = 170         # alto de fila de la grilla (tarjeta + márgenes)
+
 class HomeView(ttk.Frame):
     def __init__(self, master, app):
         super().__init__(master, padding=8)
         self.app = app
-        self.conn = app.conn
+        self.tasks = UiTasks(self, app.worker, on_busy=self._set_busy)
+        self._search_job = None
+        self._last_q = None
+        # IDs en orden de la lista actual y datos de tarjeta ya traídos (id -> dict o None si no existe)
+        self._ids = []
+        self._card_data = {}
         self.build()
 
     def build(self):
         header = ttk.Frame(self)
         header.pack(fill="x", pady=10, padx=12)
         ttk.Label(header, text="Base de datos para inversiones", font=("Segoe UI", 18, "bold")).pack(side="left")
+        self.lbl_status = ttk.Label(header, text="", bootstyle="secondary")
+        self.lbl_status.pack(side="right")
 
         # Búsqueda
         search = ttk.Frame(self)
@@ -22,60 +36,118 @@ class HomeView(ttk.Frame):
         ttk.Label(search, text="Buscar cliente:").pack(side="left")
         self.e_q = ttk.Entry(search, width=30)
         self.e_q.pack(side="left", padx=6)
+        # Búsqueda mientras se escribe; Enter busca sin esperar
+        self.e_q.bind("<KeyRelease>", self._on_query_changed)
+        self.e_q.bind("<Return>", lambda _e: self.refresh())
         ttk.Button(search, text="Buscar", command=self.refresh, bootstyle="primary").pack(side="left")
         ttk.Button(search, text="Limpiar", command=self.clear_search, bootstyle="secondary").pack(side="left", padx=(6,0))
 
-        self.cards = ttk.Frame(self)
+        # Solo se crean widgets para las filas visibles; el ítem 0 es la tarjeta "Crear cliente"
+        self.cards = VirtualGrid(self, self._make_card, self._fill_card, self._load_visible,
+                                 columns=CARD_COLUMNS, row_height=CARD_HEIGHT)
         self.cards.pack(fill="both", expand=True, padx=12, pady=8)
-        self.cards.columnconfigure((0,1,2,3), weight=1)
 
         self.refresh()
 
-    def _card(self, parent, title, subtitle, primary_text=None, primary_cmd=None):
+    def _make_card(self, parent):
         card = ttk.Frame(parent, padding=16, bootstyle="light")
         # Línea superior decorativa
         ttk.Separator(card, orient="horizontal").pack(fill="x", pady=(0,10))
-        ttk.Label(card, text=title, font=("Segoe UI", 14, "bold")).pack(anchor="w")
-        ttk.Label(card, text=subtitle).pack(anchor="w", pady=(4,10))
-        if primary_text and primary_cmd:
-            ttk.Button(card, text=primary_text, command=primary_cmd, bootstyle="primary").pack(anchor="e")
+        card.lbl_title = ttk.Label(card, font=("Segoe UI", 14, "bold"))
+        card.lbl_title.pack(anchor="w")
+        card.lbl_sub = ttk.Label(card)
+        card.lbl_sub.pack(anchor="w", pady=(4,0))
+        card.lbl_equity = ttk.Label(card)
+        card.lbl_equity.pack(anchor="w", pady=(0,10))
+        card.btn = ttk.Button(card, bootstyle="primary")
+        card.btn.pack(anchor="e")
         return card
 
+    def _fill_card(self, card, index):
+        if index == 0:
+            card.lbl_title.configure(text="+ Crear cliente")
+            card.lbl_sub.configure(text="Registrar nuevo inversionista")
+            card.lbl_equity.configure(text="")
+            card.btn.configure(text="Crear", command=self.create_client, state="normal")
+            return
+        cid = self._ids[index - 1]
+        if cid not in self._card_data:
+            # Datos en camino: la tarjeta se rellena al llegar la página
+            card.lbl_title.configure(text="…")
+            card.lbl_sub.configure(text="")
+            card.lbl_equity.configure(text="")
+            card.btn.configure(text="Entrar", state="disabled")
+            return
+        cli = self._card_data[cid]
+        if cli is None:
+            card.lbl_title.configure(text="(eliminado)")
+            card.lbl_sub.configure(text="")
+            card.lbl_equity.configure(text="")
+            card.btn.configure(text="Entrar", state="disabled")
+            return
+        card.lbl_title.configure(text=cli["name"])
+        card.lbl_sub.configure(text=f"Capital: {money(cli['capital_available'])}")
+        card.lbl_equity.configure(text=f"Patrimonio: {money(cli['equity'])} ({cli['positions']} posiciones)")
+        card.btn.configure(text="Entrar", state="normal", command=lambda c=cid: self.app.open_client(c))
+
     def clear_search(self):
         self.e_q.delete(0, 'end')
         self.refresh()
 
+    def _set_busy(self, busy: bool):
+        self.lbl_status.configure(text="Cargando…" if busy else "")
+        self.configure(cursor="watch" if busy else "")
+
+    def _on_query_changed(self, _e=None):
+        # Teclas que no cambian el texto (flechas, Shift...) no disparan consulta
+        if self.e_q.get().strip() == self._last_q:
+            return
+        if self._search_job:
+            self.after_cancel(self._search_job)
+        self._search_job = self.after(SEARCH_DEBOUNCE_MS, self.refresh)
+
     def refresh(self):
-        for w in self.cards.winfo_children():
-            w.destroy()
-        q = self.e_q.get().strip() or None
-        clients = repo.list_clients(self.conn, q=q)
-
-        # Card Crear cliente
-        cc = self._card(self.cards, "+ Crear cliente", "Registrar nuevo inversionista", "Crear", self.create_client)
-        cc.grid(row=0, column=0, sticky="nsew", padx=8, pady=8)
-
-        # Clientes
-        col = 1
-        row = 0
-        for cli in clients:
-            subtitle = f"Capital: {money(cli['capital_available'])}"
-            card = self._card(self.cards, cli["name"], subtitle, "Entrar", lambda cid=cli["id"]: self.app.open_client(cid))
-            card.grid(row=row, column=col, sticky="nsew", padx=8, pady=8)
-            col += 1
-            if col > 3:
-                col = 0
-                row += 1
+        if self._search_job:
+            self.after_cancel(self._search_job)
+            self._search_job = None
+        q = self.e_q.get().strip()
+        self._last_q = q
+        # Solo los IDs en orden: las tarjetas piden sus datos por página visible.
+        # Una búsqueda nueva reemplaza a la anterior si aún no terminó.
+        if q:
+            fn = lambda svc: repo.search_client_ids(svc.conn, q, limit=SEARCH_LIMIT)
+        else:
+            fn = lambda svc: repo.list_client_ids(svc.conn, newest_first=True)
+        self.tasks.read("clients", fn, self._show_clients)
+
+    def _show_clients(self, ids):
+        self._ids = ids
+        self._card_data = {}
+        self.tasks.cancel("cards")
+        self.cards.set_count(len(ids) + 1)
+
+    def _load_visible(self, first, last):
+        # Ítems visibles más una página por delante; un solo pedido (dos consultas) por los que faltan
+        ahead = last + (last - first)
+        missing = [cid for cid in self._ids[max(first - 1, 0):max(ahead - 1, 0)] if cid not in self._card_data]
+        if missing:
+            self.tasks.read("cards", lambda svc: svc.get_client_cards(missing),
+                            lambda cards: self._show_cards(missing, cards))
+
+    def _show_cards(self, ids, cards):
+        for cid in ids:
+            self._card_data[cid] = cards.get(cid)
+        self.cards.refresh()
 
     def create_client(self):
         dlg = CreateClientDialog(self)
         self.wait_window(dlg)
         if dlg.result:
-            try:
-                repo.create_client(self.conn, dlg.result["name"], dlg.result["email"], dlg.result["phone"], dlg.result["capital"])
-                from tkinter import messagebox
+            from tkinter import messagebox
+            res = dlg.result
+
+            def on_done(_client_id):
                 messagebox.showinfo("Éxito", "Cliente creado")
                 self.refresh()
-            except Exception as e:
-                from tkinter import messagebox
-                messagebox.showerror("Error", str(e))
+            self.tasks.write(lambda svc: svc.create_client(res["name"], res["email"], res["phone"], res["capital"]),
+                             on_done, lambda e: messagebox.showerror("Error", str(e)))
@@ -0,0 +1,68 @@
+from concurrent.futures import Future
+from typing import Callable, Any, Optional, Dict
+
+# Intervalo de sondeo de futures desde el hilo de Tk (ms)
+POLL_MS = 25
+
+class UiTasks:
+    # Puente entre DbWorker y Tk: los resultados vuelven al hilo de la interfaz vía after().
+    # Cada "canal" recuerda solo la última petición: una nueva (p. ej. otro filtro de
+    # historial) cancela/ignora la anterior.
+    def __init__(self, widget, worker, on_busy: Optional[Callable[[bool], None]] = None):
+        self.widget = widget
+        # after() sobre la ventana raíz: el sondeo sobrevive aunque la vista se destruya
+        self._root = widget.winfo_toplevel()
+        self.worker = worker
+        self.on_busy = on_busy
+        self._generation: Dict[str, int] = {}
+        self._futures: Dict[str, Future] = {}
+        self._pending = 0
+
+    def read(self, channel: str, fn: Callable[..., Any], on_done: Callable[[Any], None],
+             on_error: Optional[Callable[[Exception], None]] = None):
+        self._start(channel, self.worker.submit_read(fn), on_done, on_error)
+
+    def write(self, fn: Callable[..., Any], on_done: Callable[[Any], None],
+              on_error: Optional[Callable[[Exception], None]] = None):
+        # Las escrituras nunca se reemplazan: siempre se entrega su resultado
+        self._start(None, self.worker.submit_write(fn), on_done, on_error)
+
+    def cancel(self, channel: str):
+        self._generation[channel] = self._generation.get(channel, 0) + 1
+        fut = self._futures.pop(channel, None)
+        if fut is not None:
+            fut.cancel()
+
+    def _start(self, channel, future, on_done, on_error):
+        gen = None
+        if channel is not None:
+            self.cancel(channel)
+            gen = self._generation[channel]
+            self._futures[channel] = future
+        self._set_pending(+1)
+        self._root.after(POLL_MS, self._poll, channel, gen, future, on_done, on_error)
+
+    def _poll(self, channel, gen, future, on_done, on_error):
+        if not future.done():
+            self._root.after(POLL_MS, self._poll, channel, gen, future, on_done, on_error)
+            return
+        self._set_pending(-1)
+        if future.cancelled() or (channel is not None and self._generation.get(channel) != gen):
+            return  # reemplazada por una petición más nueva
+        if channel is not None:
+            self._futures.pop(channel, None)
+        if not self.widget.winfo_exists():
+            return
+        exc = future.exception()
+        if exc is None:
+            on_done(future.result())
+        elif on_error:
+            on_error(exc)
+        else:
+            raise exc
+
+    def _set_pending(self, delta: int):
+        before = self._pending
+        self._pending += delta
+        if self.on_busy and (before == 0) != (self._pending == 0) and self.widget.winfo_exists():
+            self.on_busy(self._pending > 0)
@@ -55,17 +55,169 @@ class ToolTip:
             self.tip = None
 
 class SortableTreeview(ttk.Treeview):
+    # Ordena con un modelo de filas tipado (números y fechas crudos), no releyendo el texto de Tk.
+    # Con on_sort(col, descending) el orden lo resuelve quien carga los datos (ORDER BY en fuentes paginadas).
+    def __init__(self, *args, on_sort=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Últimos valores escritos por sync(), para comparar sin consultar a Tk
+        self._values = {}
+        # iid -> valores tipados por columna, usados para ordenar
+        self._sort_values = {}
+        self.on_sort = on_sort
+
+    def sync(self, rows):
+        # rows: [(iid, values)] o [(iid, values, sort_values)]. Actualiza en el lugar solo lo que cambió,
+        # agrega lo nuevo al final y borra lo que ya no está; selección y orden actual se conservan.
+        # Devuelve (nuevas, cambiadas, borradas).
+        current = set(self.get_children(""))
+        seen = set()
+        added = changed = 0
+        for iid, values, *sort_values in rows:
+            iid, values = str(iid), tuple(values)
+            seen.add(iid)
+            if iid not in current:
+                self.insert("", "end", iid=iid, values=values)
+                added += 1
+            elif self._values.get(iid) != values:
+                self.item(iid, values=values)
+                changed += 1
+            self._values[iid] = values
+            if sort_values:
+                self._sort_values[iid] = tuple(sort_values[0])
+        gone = current - seen
+        if gone:
+            self.delete(*gone)
+            for iid in gone:
+                self._values.pop(iid, None)
+                self._sort_values.pop(iid, None)
+        return added, changed, len(gone)
+
+    def clear(self):
+        children = self.get_children("")
+        if children:
+            self.delete(*children)
+        self._values.clear()
+        self._sort_values.clear()
+
     def heading(self, column, **kwargs):
-        if "command" not in kwargs:
+        if "command" not in kwargs and kwargs:
             kwargs["command"] = lambda c=column: self._sort_by(c, False)
-        super().heading(column, **kwargs)
+        return super().heading(column, **kwargs)
+
+    def _sort_key(self, iid, index, col):
+        row = self._sort_values.get(iid)
+        if row is not None:
+            return row[index]
+        # Filas insertadas sin modelo: el texto de la celda
+        return self.set(iid, col)
 
     def _sort_by(self, col, descending):
-        data = [(self.set(k, col), k) for k in self.get_children("")]
-        try:
-            data.sort(key=lambda t: float(str(t[0]).replace(",", "").replace("$", "")), reverse=descending)
-        except Exception:
-            data.sort(reverse=descending)
-        for index, (_, k) in enumerate(data):
-            self.move(k, "", index)
         self.heading(col, command=lambda: self._sort_by(col, not descending))
+        if self.on_sort:
+            self.on_sort(col, descending)
+            return
+        index = list(self["columns"]).index(col)
+        keyed = [(self._sort_key(k, index, col), k) for k in self.get_children("")]
+        # Vacíos (None) siempre al final, en cualquier sentido
+        present = [t for t in keyed if t[0] is not None]
+        empty = [k for v, k in keyed if v is None]
+        try:
+            present.sort(key=lambda t: t[0], reverse=descending)
+        except TypeError:
+            present.sort(key=lambda t: str(t[0]), reverse=descending)
+        # Un solo reordenamiento en Tk en lugar de un move() por fila
+        self.set_children("", *[k for _, k in present], *empty)
+
+class VirtualGrid(ttk.Frame):
+    # Grilla de tarjetas virtualizada: solo existen las celdas de las filas visibles y se reutilizan al
+    # desplazarse. make_cell(parent) crea una celda vacía; fill_cell(cell, index) la llena con el ítem index;
+    # on_range(first, last) avisa qué ítems [first, last) quedaron a la vista (para pedir sus datos).
+    _instances = 0
+
+    def __init__(self, master, make_cell, fill_cell, on_range=None, columns=4, row_height=170, **kwargs):
+        super().__init__(master, **kwargs)
+        self.make_cell = make_cell
+        self.fill_cell = fill_cell
+        self.on_range = on_range
+        self.columns = columns
+        self.row_height = row_height
+        self._count = 0
+        self._first_row = 0
+        self._rows = 0
+        self._cells = []
+        self._body = ttk.Frame(self)
+        self._body.pack(side="left", fill="both", expand=True)
+        # El tamaño lo da la ventana, no las celdas
+        self._body.grid_propagate(False)
+        for c in range(columns):
+            self._body.columnconfigure(c, weight=1, uniform="cells")
+        self._scroll = ttk.Scrollbar(self, orient="vertical", command=self._on_scrollbar, bootstyle="round")
+        self._scroll.pack(side="right", fill="y")
+        self._body.bind("<Configure>", self._on_resize)
+        # Rueda del mouse sobre cualquier widget de la grilla (etiqueta propia, no bind_all)
+        VirtualGrid._instances += 1
+        self._wheel_tag = f"VirtualGrid{VirtualGrid._instances}"
+        for seq in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            self.bind_class(self._wheel_tag, seq, self._on_wheel)
+        self._add_wheel_tag(self._body)
+
+    def _add_wheel_tag(self, widget):
+        widget.bindtags((self._wheel_tag,) + widget.bindtags())
+        for child in widget.winfo_children():
+            self._add_wheel_tag(child)
+
+    def _total_rows(self):
+        return -(-self._count // self.columns)
+
+    def set_count(self, count):
+        # Nueva lista de ítems: vuelve al principio
+        self._count = count
+        self._first_row = 0
+        self.refresh()
+
+    def refresh(self):
+        # Vuelve a llenar las celdas visibles (p. ej. al llegar los datos de la página)
+        visible = self._rows * self.columns
+        while len(self._cells) < visible:
+            cell = self.make_cell(self._body)
+            self._add_wheel_tag(cell)
+            self._cells.append(cell)
+        first = self._first_row * self.columns
+        for i, cell in enumerate(self._cells):
+            index = first + i
+            if i < visible and index < self._count:
+                cell.grid(row=i // self.columns, column=i % self.columns, sticky="nsew", padx=8, pady=8)
+                self.fill_cell(cell, index)
+            else:
+                cell.grid_remove()
+        total = self._total_rows()
+        if total:
+            self._scroll.set(self._first_row / total, min(1.0, (self._first_row + self._rows) / total))
+        else:
+            self._scroll.set(0.0, 1.0)
+        if self.on_range:
+            self.on_range(first, min(self._count, first + visible))
+
+    def scroll_to_row(self, row):
+        row = max(0, min(row, self._total_rows() - self._rows))
+        if row != self._first_row:
+            self._first_row = row
+            self.refresh()
+
+    def _on_resize(self, event):
+        rows = max(1, event.height // self.row_height)
+        if rows != self._rows:
+            self._rows = rows
+            self._first_row = max(0, min(self._first_row, self._total_rows() - rows))
+            self.refresh()
+
+    def _on_scrollbar(self, action, amount, unit=None):
+        if action == "moveto":
+            self.scroll_to_row(round(float(amount) * self._total_rows()))
+        elif action == "scroll":
+            step = self._rows if unit == "pages" else 1
+            self.scroll_to_row(self._first_row + int(amount) * step)
+
+    def _on_wheel(self, event):
+        up = event.num == 4 or getattr(event, "delta", 0) > 0
+        self.scroll_to_row(self._first_row + (-1 if up else 1))
@@ -1,19 +1,42 @@
 import csv
-from typing import List, Dict, Any
+import gzip
+from itertools import islice
+from typing import List, Dict, Any, Iterable, Sequence
 
-def export_history_csv(path: str, rows: List[Dict[str, Any]]):
-    fieldnames = ["fecha","tipo_general","tipo","empresa","detalle","monto_cambio_capital","shares","price"]
-    with open(path, "w", newline="", encoding="utf-8") as f:
-        w = csv.DictWriter(f, fieldnames=fieldnames)
-        w.writeheader()
-        for r in rows:
-            w.writerow({
-                "fecha": r.get("fecha",""),
-                "tipo_general": r.get("tipo_general",""),
-                "tipo": r.get("tipo",""),
-                "empresa": r.get("empresa",""),
-                "detalle": r.get("detalle",""),
-                "monto_cambio_capital": r.get("monto_cambio_capital",""),
-                "shares": r.get("shares",""),
-                "price": r.get("price",""),
-            })
+from utils.format import fmt_ts
+
+HISTORY_FIELDS = ["fecha","tipo_general","tipo","empresa","detalle","monto_cambio_capital","shares","price"]
+
+# Filas formateadas por bloque antes de escribir (memoria constante)
+EXPORT_CHUNK = 5000
+
+def _open_text(path: str, compress: bool):
+    if compress:
+        return gzip.open(path, "wt", newline="", encoding="utf-8")
+    return open(path, "w", newline="", encoding="utf-8")
+
+def _cells(r: Dict[str, Any], fieldnames: List[str], fecha: int) -> List[Any]:
+    # "fecha" sale de created_at con microsegundos si la fila lo trae: al segundo, filas del mismo
+    # segundo quedarían empatadas al ordenar o reimportar el CSV
+    cells = [r.get(k, "") for k in fieldnames]
+    if r.get("created_at") is not None:
+        cells[fecha] = fmt_ts(r["created_at"], precise=True)
+    return cells
+
+def export_history_csv(path: str, rows: Iterable[Dict[str, Any]], compress: bool = False,
+                       extra_fields: Sequence[str] = ()) -> int:
+    # rows puede ser una lista o un iterador (p. ej. directo del cursor); devuelve filas escritas
+    fieldnames: List[str] = list(extra_fields) + HISTORY_FIELDS
+    fecha = fieldnames.index("fecha")
+    written = 0
+    it = iter(rows)
+    with _open_text(path, compress) as f:
+        w = csv.writer(f)
+        w.writerow(fieldnames)
+        while True:
+            chunk = [_cells(r, fieldnames, fecha) for r in islice(it, EXPORT_CHUNK)]
+            if not chunk:
+                break
+            w.writerows(chunk)
+            written += len(chunk)
+    return written
@@ -1,7 +1,43 @@
-from datetime import datetime
+import time
+from datetime import datetime, timedelta, timezone
+
+# Las fechas se guardan como microsegundos desde epoch (UTC); se muestran en hora local
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
 
 def money(x: float) -> str:
     return f"$ {x:,.2f}"
 
-def now_iso() -> str:
-    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+def now_ts() -> int:
+    return time.time_ns() // 1000
+
+def ts_from_datetime(dt: datetime) -> int:
+    # dt sin zona horaria se interpreta como hora local
+    if dt.tzinfo is None:
+        dt = dt.astimezone()
+    return (dt - _EPOCH) // timedelta(microseconds=1)
+
+def fmt_ts(ts, precise: bool = False) -> str:
+    # precise: con microsegundos (ancho fijo), para que el texto ordene igual que created_at y vuelva a
+    # importarse sin perder el orden; en pantalla basta el segundo
+    if ts is None:
+        return ""
+    dt = datetime.fromtimestamp(ts // 1_000_000)
+    if precise:
+        return dt.replace(microsecond=ts % 1_000_000).strftime("%Y-%m-%d %H:%M:%S.%f")
+    return dt.strftime("%Y-%m-%d %H:%M:%S")
+
+def day_of(ts: int) -> str:
+    # Día local "YYYY-MM-DD" de una marca de tiempo
+    return datetime.fromtimestamp(ts // 1_000_000).strftime("%Y-%m-%d")
+
+def _day_start(d: datetime) -> int:
+    # Primer instante local del día. Si las 00:00 no existen (cambio de hora a medianoche, p. ej. Chile)
+    # una de las dos lecturas cae en el día anterior; se toma la más temprana que sea del día
+    day = d.strftime("%Y-%m-%d")
+    return min(t for t in (ts_from_datetime(d.replace(fold=f)) for f in (0, 1)) if day_of(t) == day)
+
+def day_range(day: str, day_to: str | None = None) -> tuple[int, int]:
+    # Intervalo semiabierto [inicio de day, inicio del día siguiente a day_to)
+    start = datetime.strptime(day, "%Y-%m-%d")
+    end = datetime.strptime(day_to or day, "%Y-%m-%d") + timedelta(days=1)
+    return _day_start(start), _day_start(end)
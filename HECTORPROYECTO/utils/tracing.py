@@ -0,0 +1,195 @@
+import atexit
+import functools
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections.abc import Generator
+from typing import Optional, Dict, Any
+
+# Instrumentación opcional. Se activa con la variable de entorno INVERSIONES_TRACE=<archivo.json>
+# (se vuelca al salir) o llamando a enable(). Desactivada no agrega costo: get_connection usa
+# sqlite3.Connection normal y los métodos de servicio no se envuelven.
+ENV_TRACE = "INVERSIONES_TRACE"
+ENV_SLOW_MS = "INVERSIONES_TRACE_SLOW_MS"
+SLOW_MS = 50.0
+# Límites superiores (ms) de los buckets del histograma; el último es "más"
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 5000)
+
+_WS = re.compile(r"\s+")
+_IN_LIST = re.compile(r"\(\s*\?(\s*,\s*\?)+\s*\)")
+_NO_PLAN = ("BEGIN", "COMMIT", "ROLLBACK", "PRAGMA", "ANALYZE", "VACUUM", "EXPLAIN", "CREATE", "DROP", "ALTER")
+
+def _normalize(sql: str) -> str:
+    # Una entrada por forma de sentencia: espacios colapsados y listas IN (?,?,...) unificadas
+    return _IN_LIST.sub("(?,...)", _WS.sub(" ", sql).strip())
+
+def new_stat() -> Dict[str, Any]:
+    return {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "hist": [0] * (len(BUCKETS_MS) + 1)}
+
+def add_sample(stat: Dict[str, Any], ms: float):
+    stat["count"] += 1
+    stat["total_ms"] += ms
+    if ms > stat["max_ms"]:
+        stat["max_ms"] = ms
+    i = 0
+    while i < len(BUCKETS_MS) and ms > BUCKETS_MS[i]:
+        i += 1
+    stat["hist"][i] += 1
+
+def summarize(stats: Dict[str, Dict[str, Any]]) -> list:
+    # Lista ordenada por tiempo total, con el histograma etiquetado por bucket
+    out = []
+    for key, s in stats.items():
+        out.append({"name": key, "count": s["count"], "total_ms": round(s["total_ms"], 3),
+                    "avg_ms": round(s["total_ms"] / s["count"], 3), "max_ms": round(s["max_ms"], 3),
+                    "hist": dict(zip([f"<={b}" for b in BUCKETS_MS] + ["mas"], s["hist"]))})
+    return sorted(out, key=lambda r: r["total_ms"], reverse=True)
+
+class Tracer:
+    def __init__(self, path: Optional[str] = None, slow_ms: float = SLOW_MS):
+        self.path = path
+        self.slow_ms = slow_ms
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self.statements: Dict[str, Dict[str, Any]] = {}
+        self.methods: Dict[str, Dict[str, Any]] = {}
+        self.slow: Dict[str, Dict[str, Any]] = {}
+
+    def record_sql(self, conn: sqlite3.Connection, sql: str, params, ms: float):
+        key = _normalize(sql)
+        with self._lock:
+            add_sample(self.statements.setdefault(key, new_stat()), ms)
+            first_slow = ms >= self.slow_ms and key not in self.slow
+            if ms >= self.slow_ms and not first_slow:
+                entry = self.slow[key]
+                entry["count"] += 1
+                entry["max_ms"] = max(entry["max_ms"], ms)
+        if first_slow:
+            # El plan se pide una vez por forma de sentencia, fuera del lock
+            plan = self._explain(conn, sql, params)
+            with self._lock:
+                self.slow.setdefault(key, {"count": 1, "max_ms": ms, "plan": plan})
+
+    @staticmethod
+    def _explain(conn: sqlite3.Connection, sql: str, params) -> Optional[list]:
+        if sql.lstrip().upper().startswith(_NO_PLAN):
+            return None
+        try:
+            rows = sqlite3.Connection.execute(conn, "EXPLAIN QUERY PLAN " + sql, params or ())
+            return [r[3] for r in rows]
+        except sqlite3.Error as e:
+            return [f"(sin plan: {e})"]
+
+    def record_method(self, name: str, ms: float):
+        with self._lock:
+            add_sample(self.methods.setdefault(name, new_stat()), ms)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "started": self.started, "seconds": round(time.time() - self.started, 3), "slow_ms": self.slow_ms,
+                "statements": summarize(self.statements),
+                "methods": summarize(self.methods),
+                "slow_queries": [{"sql": k, **v} for k, v in self.slow.items()],
+            }
+
+    def dump(self, path: Optional[str] = None) -> Optional[str]:
+        path = path or self.path
+        if not path:
+            return None
+        import json
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, indent=2, ensure_ascii=False)
+        return path
+
+_tracer: Optional[Tracer] = None
+_classes: list = []
+
+def enable(path: Optional[str] = None, slow_ms: Optional[float] = None) -> Tracer:
+    # Las conexiones creadas a partir de aquí quedan instrumentadas; con path se vuelca al salir
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer(path, SLOW_MS if slow_ms is None else slow_ms)
+        if path:
+            atexit.register(_tracer.dump)
+        for cls in _classes:
+            _wrap_methods(cls)
+    return _tracer
+
+def get_tracer() -> Optional[Tracer]:
+    return _tracer
+
+def dump(path: Optional[str] = None) -> Optional[str]:
+    return _tracer.dump(path) if _tracer else None
+
+class TracedConnection(sqlite3.Connection):
+    # Mide execute/executemany (preparación y primer paso; el fetch posterior no se cuenta)
+    def execute(self, sql, parameters=(), /):
+        t = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            if _tracer:
+                _tracer.record_sql(self, sql, parameters, (time.perf_counter() - t) * 1000)
+
+    def executemany(self, sql, seq_of_parameters, /):
+        t = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            if _tracer:
+                _tracer.record_sql(self, sql, None, (time.perf_counter() - t) * 1000)
+
+def connection_factory():
+    return TracedConnection if _tracer else sqlite3.Connection
+
+def _timed_iter(name: str, it: Generator, elapsed: float):
+    # Métodos que devuelven un generador: se suma el tiempo de cada next() (producir las filas, no
+    # consumirlas) y se registra una vez, al agotarse o cerrarse
+    try:
+        while True:
+            t = time.perf_counter()
+            try:
+                item = next(it)
+            except StopIteration:
+                return
+            finally:
+                elapsed += time.perf_counter() - t
+            yield item
+    finally:
+        it.close()
+        if _tracer:
+            _tracer.record_method(name, elapsed * 1000)
+
+def _timed(name: str, fn):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        t = time.perf_counter()
+        result = None
+        try:
+            result = fn(*args, **kwargs)
+            if isinstance(result, Generator):
+                return _timed_iter(name, result, time.perf_counter() - t)
+            return result
+        finally:
+            if _tracer and not isinstance(result, Generator):
+                _tracer.record_method(name, (time.perf_counter() - t) * 1000)
+    return wrapper
+
+def _wrap_methods(cls):
+    import inspect
+    for name, fn in list(vars(cls).items()):
+        if not name.startswith("_") and inspect.isfunction(fn):
+            setattr(cls, name, _timed(f"{cls.__name__}.{name}", fn))
+
+def instrument(cls):
+    # Decorador de clase: mide los métodos públicos, ahora o cuando se llame a enable()
+    _classes.append(cls)
+    if _tracer:
+        _wrap_methods(cls)
+    return cls
+
+if os.environ.get(ENV_TRACE):
+    enable(os.environ[ENV_TRACE], float(os.environ.get(ENV_SLOW_MS, SLOW_MS)))
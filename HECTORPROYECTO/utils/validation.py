@@ -1,4 +1,5 @@
 from datetime import datetime
+from utils.format import ts_from_datetime
 
 def parse_float_or_none(s: str):
     try:
@@ -26,6 +27,14 @@ def is_valid_date(s: str) -> bool:
     except Exception:
         return False
 
+def parse_timestamp(s: str):
+    # Acepta "YYYY-MM-DD HH:MM:SS[.ffffff]", con "T" o solo "YYYY-MM-DD" (hora local si no trae zona).
+    # Devuelve microsegundos desde epoch o None si es inválido.
+    try:
+        return ts_from_datetime(datetime.fromisoformat((s or "").strip()))
+    except ValueError:
+        return None
+
 def validate_date_str(s: str):
     if not is_valid_date(s):
         raise ValueError("Fecha inválida. Use YYYY-MM-DD")